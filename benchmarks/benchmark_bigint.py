@@ -0,0 +1,62 @@
+import random
+import time
+import pyFNR
+import pyFNR.Util
+
+# big-int arithmetic of formats with 2**100 and more words: Python ints
+# vs gmpy2.mpz columns. Every format is measured with all big columns as
+# Python ints and as mpz, the ratio shows above which size of counts mpz
+# pays off (Util.MPZ_BITS).
+N_SAMPLES = 300
+LENGTHS = [40, 80, 160, 320, 480, 640, 1000]
+
+def best(func, repeat=5):
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		times.append(time.perf_counter() - start)
+	return min(times)
+
+def run(arithmetic, N):
+	pyFNR.Util.set_arithmetic(arithmetic)
+	build = best(lambda: pyFNR.Util.LuhnR(0, N))
+	fmt = pyFNR.Util.LuhnR(0, N)
+	random.seed(N)
+	ranks = [random.randrange(fmt.get_words_count()) for _ in range(N_SAMPLES)]
+	words = fmt.unrank_batch(ranks)
+	assert fmt.rank_batch(words) == ranks
+	unrank = best(lambda: fmt.unrank_batch(ranks)) / N_SAMPLES
+	rank = best(lambda: fmt.rank_batch(words)) / N_SAMPLES
+	return build, rank, unrank
+
+mpz_bits = pyFNR.Util.MPZ_BITS
+# every big column as mpz
+pyFNR.Util.MPZ_BITS = 65
+print('MPZ_BITS = ' + str(mpz_bits))
+for N in LENGTHS:
+	bits = pyFNR.Util.LuhnR(0, N).get_words_count().bit_length()
+	python = run('python', N)
+	gmpy2 = run('gmpy2', N)
+	line = 'LuhnR(0,' + str(N) + ')'
+	line = line.ljust(14) + ' ~2**' + str(bits - 1).ljust(5)
+	for name, p, g in zip(('build', 'rank', 'unrank'), python, gmpy2):
+		line += '\t' + name + ' {0:9.1f}us / {1:9.1f}us ({2:4.2f}x)'.format(p * 1e6, g * 1e6, p / g)
+	print(line + ('\tmpz' if bits >= mpz_bits else ''))
+pyFNR.Util.MPZ_BITS = mpz_bits
+pyFNR.Util.set_arithmetic(None)
+
+# int <-> block conversions of FNR-128
+fnr = pyFNR.FNR(block_size=128)
+ints = [random.getrandbits(128) for _ in range(10000)]
+start = time.perf_counter()
+blocks = [fnr._int_to_bytes(i) for i in ints]
+to_bytes = time.perf_counter() - start
+start = time.perf_counter()
+[fnr._bytes_to_int(b) for b in blocks]
+from_bytes = time.perf_counter() - start
+start = time.perf_counter()
+[bytearray.fromhex('{0:032x}'.format(i))[::-1] for i in ints]
+hex_time = time.perf_counter() - start
+print('FNR-128 _int_to_bytes: {0:.3f}us (hex strings: {1:.3f}us), _bytes_to_int: {2:.3f}us'.format(to_bytes * 1e2, hex_time * 1e2, from_bytes * 1e2))
+fnr.close()
@@ -0,0 +1,36 @@
+import random
+import shutil
+import tempfile
+import time
+import pyFNR.Util
+import pyFNR.codegen
+
+# generic FPE_Format.rank()/unrank() against functions generated by pyFNR.codegen
+COUNT = 100000
+
+def timed(func, values):
+	start = time.perf_counter()
+	for value in values:
+		func(value)
+	return (time.perf_counter() - start) / len(values)
+
+cache_dir = tempfile.mkdtemp()
+random.seed(49)
+for name, factory in (('ECV', pyFNR.Util.ECV), ('LuhnR(0,16)', lambda: pyFNR.Util.LuhnR(0, 16))):
+	fmt = factory()
+	ranks = [random.randrange(fmt.get_words_count()) for _ in range(COUNT)]
+	words = [fmt.unrank(c) for c in ranks]
+	generic = (timed(fmt.rank, words), timed(fmt.unrank, ranks))
+	specialized = factory()
+	start = time.perf_counter()
+	pyFNR.codegen.specialize(specialized, cache_dir)
+	generate = time.perf_counter() - start
+	cached = factory()
+	start = time.perf_counter()
+	pyFNR.codegen.specialize(cached, cache_dir)
+	load = time.perf_counter() - start
+	assert specialized.rank_batch(words) == ranks and specialized.unrank_batch(ranks) == words
+	fast = (timed(specialized.rank, words), timed(specialized.unrank, ranks))
+	print(name.ljust(12) + ': rank {0:6.2f}us -> {1:6.2f}us ({2:.1f}x)\tunrank {3:6.2f}us -> {4:6.2f}us ({5:.1f}x)\tgenerate {6:.1f}ms, cached {7:.1f}ms'.format(
+		generic[0] * 1e6, fast[0] * 1e6, generic[0] / fast[0], generic[1] * 1e6, fast[1] * 1e6, generic[1] / fast[1], generate * 1e3, load * 1e3))
+shutil.rmtree(cache_dir)
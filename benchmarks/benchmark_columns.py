@@ -0,0 +1,53 @@
+import sys
+import time
+import numpy
+import pandas
+import pyarrow
+import pyFNR
+import pyFNR.Util
+import pyFNR.arrow
+import pyFNR.pandas
+
+# usage: python benchmarks/benchmark_columns.py [rows], default 100M rows
+N_ROWS = int(float(sys.argv[1])) if len(sys.argv) > 1 else 10**8
+N_APPLY = 10000
+N_PLATES = 1000
+
+ecv = pyFNR.Util.ECV()
+ids = pyFNR.FNR2(key="password", tweak="ids", domain=10**9 - 1)
+plates = pyFNR.FNR2(key="password", tweak="plates", domain=ecv.get_words_count() - 1)
+
+def report(name, rows, seconds):
+	print(name.ljust(40) + ': ' + str(int(rows / seconds)).rjust(10) + ' rows/s\t' + '{0:.1f}s per 100M rows'.format(seconds * 10**8 / rows))
+
+numbers = numpy.random.randint(0, 10**9, size=N_ROWS, dtype=numpy.int64)
+series = pandas.Series(numbers)
+
+start = time.time()
+series.iloc[:N_APPLY].apply(ids.encrypt)
+report('pandas .apply(FNR2.encrypt)', N_APPLY, time.time() - start)
+
+start = time.time()
+pyFNR.pandas.encrypt(ids, series)
+report('pyFNR.pandas int64 (' + str(N_ROWS) + ' rows)', N_ROWS, time.time() - start)
+
+array = pyarrow.array(numbers, mask=numpy.arange(N_ROWS) % 100 == 0)
+start = time.time()
+pyFNR.arrow.encrypt(ids, array)
+report('pyFNR.arrow int64 with 1% nulls', N_ROWS, time.time() - start)
+del numbers, series, array
+
+# low-cardinality string column: distinct plates are enciphered once
+words = numpy.array([ecv.unrank(c) for c in numpy.random.randint(0, ecv.get_words_count(), size=N_PLATES).tolist()], dtype=object)
+column = words[numpy.random.randint(0, N_PLATES, size=N_ROWS)]
+
+start = time.time()
+pyFNR.pandas.encrypt(plates, pandas.Series(column), ecv)
+report('pyFNR.pandas ECV (' + str(N_PLATES) + ' distinct)', N_ROWS, time.time() - start)
+
+start = time.time()
+pyFNR.arrow.encrypt(plates, pyarrow.array(column), ecv)
+report('pyFNR.arrow ECV (' + str(N_PLATES) + ' distinct)', N_ROWS, time.time() - start)
+
+ids.close()
+plates.close()
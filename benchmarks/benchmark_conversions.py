@@ -17,6 +17,13 @@ for i in i_tests:
 end = time.time()
 print("_int_to_bytes : " + str((end-start)*1000/len(i_tests)) + "ms")
 
+start = time.time()
+for i in i_tests:
+	b = bytearray.fromhex(fnr._hex_format_string.format(i))
+	b.reverse()
+end = time.time()
+print("fromhex       : " + str((end-start)*1000/len(i_tests)) + "ms")
+
 start = time.time()
 for i in i_tests:
 	b = fnr._int_to_bytes2(i)
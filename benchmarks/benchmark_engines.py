@@ -0,0 +1,44 @@
+import time
+import random
+import pyFNR
+
+N_SAMPLES = 200
+PERCENTILES = [50, 90, 99, 99.9]
+
+# domain sizes just above powers of two are the worst case of cycle walking
+domains = [2**16, 2**32 - 2, 2**32, 10**9 - 1]
+
+def percentiles(values, unit):
+	values = sorted(values)
+	line = ''
+	for percentile in PERCENTILES:
+		index = min(int(len(values) * percentile / 100), len(values) - 1)
+		line += '\tp' + str(percentile) + ': ' + unit(values[index])
+	return line + '\tmax: ' + unit(values[-1])
+
+for domain in domains:
+	tests = [random.randint(0, domain) for _ in range(N_SAMPLES)]
+	for engine in ('cycle-walking', 'feistel'):
+		fnr2 = pyFNR.FNR2(key="password", tweak="string tweak", domain=domain, engine=engine)
+		# FNR calls per value do not depend on backend or machine load
+		calls = [0]
+		encrypt_int = fnr2._fnr.encrypt_int
+		def counted(x):
+			calls[0] += 1
+			return encrypt_int(x)
+		fnr2._fnr.encrypt_int = counted
+		latencies = []
+		counts = []
+		for p in tests:
+			calls[0] = 0
+			start = time.perf_counter()
+			fnr2.encrypt(p)
+			latencies.append(time.perf_counter() - start)
+			counts.append(calls[0])
+		start = time.perf_counter()
+		fnr2.encrypt_batch(tests)
+		batch = time.perf_counter() - start
+		fnr2.close()
+		prefix = 'domain: ' + str(domain).rjust(10) + '\t' + engine.ljust(14)
+		print(prefix + '\tFNR calls' + percentiles(counts, str) + '\tmean: {0:.2f}'.format(sum(counts) / len(counts)))
+		print(prefix + '\tlatency  ' + percentiles(latencies, lambda t: '{0:.4f}ms'.format(t * 1000)) + '\tbatch: {0:.4f}ms'.format(batch * 1000 / len(tests)))
@@ -0,0 +1,19 @@
+import subprocess
+import sys
+import time
+
+N_SAMPLES = 20
+
+statements = [
+	('python startup', 'pass'),
+	('import pyFNR', 'import pyFNR'),
+	('import pyFNR.Util', 'import pyFNR.Util'),
+	('first FNR()', 'import pyFNR; pyFNR.FNR(block_size=32).close()'),
+]
+
+for name, statement in statements:
+	start = time.time()
+	for _ in range(N_SAMPLES):
+		subprocess.check_call([sys.executable, '-c', statement])
+	end = time.time()
+	print(name.ljust(18) + ': ' + str((end-start)*1000/N_SAMPLES) + "ms")
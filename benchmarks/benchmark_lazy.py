@@ -0,0 +1,58 @@
+import math
+import time
+import tracemalloc
+import pyFNR.Util
+
+# synthetic checksum-plus-counter automaton: decimal words of length N
+# with weighted checksum divisible by MODULUS and at most MAX_NINES nines
+MODULUS = 997
+COUNTER = 200 # counter states declared for eager DFA
+MAX_NINES = 3
+N = 16
+
+SIGMA = [str(i) for i in range(10)]
+
+def luhn_delta(t, c):
+	a, b = t[0], t[1]
+	c = ord(c) - ord('0')
+	return ((a+c+(1-b)*(c+int(math.floor(1.0*c/5))))%10 , 1-b)
+
+def counter_delta(t, c):
+	checksum, nines = t
+	return ((checksum * 7 + int(c)) % MODULUS, min(nines + (c == '9'), COUNTER))
+
+def counter_accepts(t):
+	return t[0] == 0 and t[1] <= MAX_NINES
+
+def eager_luhn(n):
+	return pyFNR.Util.LuhnR(0, n)
+
+def lazy_luhn(n):
+	return pyFNR.Util.FPE_Format(pyFNR.Util.DFA(None, SIGMA, luhn_delta, (0, 0), lambda t: t[0] == 0, lazy=True), n)
+
+def eager_counter():
+	Q = [(a, b) for a in range(MODULUS) for b in range(COUNTER + 1)]
+	F = [q for q in Q if counter_accepts(q)]
+	return pyFNR.Util.FPE_Format(pyFNR.Util.DFA(Q, SIGMA, counter_delta, (0, 0), F), N)
+
+def lazy_counter():
+	return pyFNR.Util.FPE_Format(pyFNR.Util.DFA(None, SIGMA, counter_delta, (0, 0), counter_accepts, lazy=True), N)
+
+def measure(name, factory):
+	tracemalloc.start()
+	start = time.time()
+	fmt = factory()
+	duration = time.time() - start
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print(name.ljust(36) + ': {0:8.3f}s'.format(duration) + '\tstates: ' + str(fmt.table.footprint()["states"]).rjust(7) + '\tmemory: {0:8.1f}MB (peak {1:.1f}MB)'.format(current / 2.0**20, peak / 2.0**20))
+	return fmt
+
+for n in (16, 64):
+	eager = measure('LuhnR(0,' + str(n) + ') eager', lambda: eager_luhn(n))
+	lazy = measure('LuhnR(0,' + str(n) + ') lazy', lambda: lazy_luhn(n))
+	assert eager.get_words_count() == lazy.get_words_count()
+lazy = measure('counter (' + str(MODULUS * (COUNTER + 1)) + ' states, N=' + str(N) + ') lazy', lazy_counter)
+eager = measure('counter (' + str(MODULUS * (COUNTER + 1)) + ' states, N=' + str(N) + ') eager', eager_counter)
+assert eager.get_words_count() == lazy.get_words_count()
+print('words: ' + str(lazy.get_words_count()))
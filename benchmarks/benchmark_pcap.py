@@ -0,0 +1,52 @@
+import os
+import random
+import struct
+import tempfile
+import time
+import pyFNR
+import pyFNR.tools.pcap
+
+# synthetic Ethernet capture of TCP packets between hosts of FLOWS flows
+PACKETS = 200000
+FLOWS = 2000
+PAYLOAD = 64
+
+def write_capture(path):
+	random.seed(47)
+	hosts = [struct.pack('>I', random.getrandbits(32)) for _ in range(2 * FLOWS)]
+	with open(path, 'wb') as f:
+		f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+		for i in range(PACKETS):
+			flow = random.randrange(FLOWS)
+			ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 40 + PAYLOAD, i & 0xffff, 0, 64, 6, 0, hosts[2 * flow], hosts[2 * flow + 1])
+			packet = b'\x00' * 12 + b'\x08\x00' + ip + b'\x00' * (20 + PAYLOAD)
+			f.write(struct.pack('<IIII', i, 0, len(packet), len(packet)) + packet)
+
+def naive(fnr, source, target):
+	# address by address through encrypt_bytes(), as before encrypt_packed()
+	class Single(object):
+		_block_size = 32
+		def encrypt_packed(self, data):
+			return b''.join(bytes(fnr.encrypt_bytes(bytearray(data[i:i + 4]))) for i in range(0, len(data), 4))
+	return pyFNR.tools.pcap.Anonymiser(Single(), cache=None).anonymise(source, target)
+
+directory = tempfile.mkdtemp()
+source = os.path.join(directory, 'source.pcap')
+target = os.path.join(directory, 'target.pcap')
+write_capture(source)
+ipv4 = pyFNR.FNR(block_size=32)
+ipv6 = pyFNR.FNR(block_size=128)
+runs = [
+	('per address encrypt_bytes', lambda: naive(ipv4, source, target)),
+	('packed, no cache', lambda: pyFNR.tools.pcap.Anonymiser(ipv4, ipv6, cache=None).anonymise(source, target)),
+	('packed, cache ' + str(pyFNR.tools.pcap.CACHE_SIZE), lambda: pyFNR.tools.pcap.Anonymiser(ipv4, ipv6).anonymise(source, target)),
+]
+for name, run in runs:
+	stats = run()
+	print(name.ljust(28) + ': {0:10.0f} packets/s\t{1:8d} enciphered\thit rate {2:.1%}'.format(stats['packets_per_second'], stats['enciphered'], stats['hit_rate']))
+print(str(PACKETS) + ' packets, ' + str(FLOWS) + ' flows, ' + str(os.path.getsize(source) // 2**20) + 'MB')
+ipv4.close()
+ipv6.close()
+os.remove(source)
+os.remove(target)
+os.rmdir(directory)
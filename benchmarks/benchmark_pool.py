@@ -0,0 +1,66 @@
+import argparse
+import gc
+import random
+import time
+import pyFNR
+import pyFNR.pool
+
+# soak test: requests encipher batches under one of several (key, tweak)
+# pairs, instances are built per request (closed or left to garbage
+# collector) or lent by pyFNR.pool.Pool
+KEYS = dict(('key-' + str(i), bytes(bytearray([i] * pyFNR.KEY_SIZE))) for i in range(4))
+TWEAKS = ['emails', 'phones']
+DOMAIN = 10**9 - 1
+
+def rss():
+	# resident memory of this process (native and Python) in MB
+	try:
+		with open('/proc/self/status') as f:
+			for line in f:
+				if line.startswith('VmRSS:'):
+					return int(line.split()[1]) / 1024.0
+	except IOError:
+		import resource
+		return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+	return 0.0
+
+def per_request(close):
+	def request(key_id, tweak, values):
+		fnr2 = pyFNR.FNR2.from_master_key(KEYS[key_id], tweak, DOMAIN)
+		result = fnr2.encrypt_batch(values)
+		if close:
+			fnr2.close()
+		return result
+	return request
+
+def pooled(pool):
+	def request(key_id, tweak, values):
+		with pool.lease(key_id, tweak, domain=DOMAIN) as fnr2:
+			return fnr2.encrypt_batch(values)
+	return request
+
+def soak(name, request, operations, batch, reports):
+	random.seed(48)
+	values = list(range(batch))
+	requests = operations // batch
+	start = last = time.perf_counter()
+	for i in range(1, requests + 1):
+		request(random.choice(sorted(KEYS)), random.choice(TWEAKS), values)
+		if i % (requests // reports) == 0:
+			now = time.perf_counter()
+			print(name.ljust(20) + ': {0:9d} ops\t{1:10.0f} ops/s\tRSS {2:7.1f}MB'.format(i * batch, (requests // reports) * batch / (now - last), rss()))
+			last = now
+	print(name.ljust(20) + ': {0:10.0f} ops/s total'.format(requests * batch / (time.perf_counter() - start)))
+
+parser = argparse.ArgumentParser(description='pool soak benchmark')
+parser.add_argument('--operations', type=int, default=2 * 10**6, help='enciphered values per strategy')
+parser.add_argument('--batch', type=int, default=100, help='values per request')
+parser.add_argument('--reports', type=int, default=4, help='reports per strategy')
+args = parser.parse_args()
+print('backend: ' + pyFNR.backends.get_backend().name)
+soak('new+close', per_request(True), args.operations, args.batch, args.reports)
+soak('new, no close', per_request(False), args.operations, args.batch, args.reports)
+gc.collect()
+with pyFNR.pool.Pool(KEYS, max_size=8) as pool:
+	soak('pool(max_size=8)', pooled(pool), args.operations, args.batch, args.reports)
+	print(pool.stats())
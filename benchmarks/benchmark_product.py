@@ -0,0 +1,66 @@
+import random
+import time
+import pyFNR.Util
+
+# card numbers of length N: Luhn checksum, fixed BIN and at most MAX_NINES nines
+BIN = '453201'
+MAX_NINES = 3
+N = 16
+COUNT = 2000
+
+SIGMA = [str(i) for i in range(10)]
+
+def bin_delta(q, c):
+	# states 0..len(BIN), len(BIN) + 1 is dead state
+	if q < len(BIN):
+		return q + 1 if c == BIN[q] else len(BIN) + 1
+	return q
+
+def nines_delta(q, c):
+	# states 0..MAX_NINES + 1, last state is dead
+	return min(q + (c == '9'), MAX_NINES + 1)
+
+def constraints():
+	bin_dfa = pyFNR.Util.DFA(range(len(BIN) + 2), SIGMA, bin_delta, 0, [len(BIN)])
+	nines = pyFNR.Util.DFA(range(MAX_NINES + 2), SIGMA, nines_delta, 0, range(MAX_NINES + 1))
+	return bin_dfa, nines
+
+def manual():
+	# product of declared state spaces, as users had to write it
+	luhn = pyFNR.Util.LuhnR(0, N).DFA
+	luhn_states = [(a, b) for a in range(10) for b in range(2)]
+	Q = [(l, q, r) for l in luhn_states for q in range(len(BIN) + 2) for r in range(MAX_NINES + 2)]
+	F = [(l, q, r) for l, q, r in Q if l[0] == 0 and q == len(BIN) and r <= MAX_NINES]
+	def delta(t, c):
+		l, q, r = t
+		d = ord(c) - ord('0')
+		return (((l[0] + d + (1 - l[1]) * (d + d // 5)) % 10, 1 - l[1]), bin_delta(q, c), nines_delta(r, c))
+	return pyFNR.Util.FPE_Format(pyFNR.Util.DFA(Q, SIGMA, delta, ((0, 0), 0, 0), F), N)
+
+def product():
+	bin_dfa, nines = constraints()
+	return pyFNR.Util.FPE_Format(pyFNR.Util.LuhnR(0, N).DFA.intersect(bin_dfa).intersect(nines), N)
+
+def unminimized():
+	bin_dfa, nines = constraints()
+	return pyFNR.Util.FPE_Format(pyFNR.Util.LuhnR(0, N).DFA.intersect(bin_dfa, minimize=False).intersect(nines, minimize=False), N)
+
+def measure(name, factory):
+	start = time.time()
+	fmt = factory()
+	build = time.time() - start
+	ranks = [random.randrange(fmt.get_words_count()) for _ in range(COUNT)]
+	start = time.time()
+	words = [fmt.unrank(c) for c in ranks]
+	unrank = (time.time() - start) / COUNT
+	start = time.time()
+	assert [fmt.rank(w) for w in words] == ranks
+	rank = (time.time() - start) / COUNT
+	footprint = fmt.table.footprint()
+	print(name.ljust(14) + ': build {0:7.3f}s'.format(build) + '\tstates: ' + str(footprint["states"]).rjust(5) + '\ttable: {0:8.1f}kB'.format(footprint["bytes"] / 1024.0) + '\trank: {0:6.1f}us\tunrank: {1:6.1f}us'.format(rank * 1e6, unrank * 1e6))
+	return fmt
+
+random.seed(46)
+formats = [measure('manual', manual), measure('unminimized', unminimized), measure('intersect', product)]
+assert len(set(fmt.get_words_count() for fmt in formats)) == 1
+print('words: ' + str(formats[0].get_words_count()))
@@ -0,0 +1,36 @@
+import random
+import time
+import pyFNR
+import pyFNR.Util
+import pyFNR.rekey
+
+N_TOKENS = 20000
+SMALL_DOMAIN = 10**4 - 1
+
+def report(name, tokens, seconds):
+	print(name.ljust(50) + ': ' + '{0:8.2f}us per token'.format(seconds * 1e6 / tokens))
+
+def run(name, func, tokens):
+	start = time.time()
+	func()
+	report(name, tokens, time.time() - start)
+
+ecv = pyFNR.Util.ECV()
+old = pyFNR.FNR2(key="password", tweak="plates-2024", domain=ecv.get_words_count() - 1)
+new = pyFNR.FNR2(key="password", tweak="plates-2025", domain=ecv.get_words_count() - 1)
+words = [ecv.unrank(random.randrange(ecv.get_words_count())) for _ in range(N_TOKENS)]
+rekeyer = pyFNR.rekey.Rekeyer(old, new, ecv)
+
+run('ECV: per token decrypt + encrypt', lambda: [ecv.unrank(new.encrypt(ecv.rank(ecv.unrank(old.decrypt(ecv.rank(w)))))) for w in words], N_TOKENS)
+run('ECV: decrypt_words + encrypt_words', lambda: new.encrypt_words(ecv, old.decrypt_words(ecv, words)), N_TOKENS)
+run('ECV: Rekeyer.rekey_batch', lambda: rekeyer.rekey_batch(words), N_TOKENS)
+
+# small domain: table is built after domain + 1 tokens and reused
+old = pyFNR.FNR2(key="password", tweak="codes-2024", domain=SMALL_DOMAIN)
+new = pyFNR.FNR2(key="password", tweak="codes-2025", domain=SMALL_DOMAIN)
+codes = [random.randrange(SMALL_DOMAIN + 1) for _ in range(N_TOKENS)]
+run('10**4 codes: decrypt_batch + encrypt_batch', lambda: new.encrypt_batch(old.decrypt_batch(codes)), N_TOKENS)
+run('10**4 codes: Rekeyer(table=False).rekey_batch', lambda: pyFNR.rekey.Rekeyer(old, new, table=False).rekey_batch(codes), N_TOKENS)
+rekeyer = pyFNR.rekey.Rekeyer(old, new)
+run('10**4 codes: Rekeyer.rekey_batch (builds table)', lambda: rekeyer.rekey_batch(codes), N_TOKENS)
+run('10**4 codes: Rekeyer.rekey_batch (table)', lambda: rekeyer.rekey_batch(codes), N_TOKENS)
@@ -0,0 +1,53 @@
+import random
+import time
+import pyFNR.Util
+
+# synthetic data: uniform sampling by ranks vs rejection sampling of
+# random strings over the alphabet of the format
+N_WORDS = 20000
+N_REJECTION = 2000
+MODULUS = 997
+
+def checksum_format():
+	# 12-digit IDs with weighted checksum divisible by MODULUS (1 in MODULUS strings)
+	Q = list(range(MODULUS))
+	return pyFNR.Util.FPE_Format(pyFNR.Util.DFA(Q, [str(i) for i in range(10)], lambda q, a: (q * 7 + int(a)) % MODULUS, 0, [0]), 12)
+
+def rejection_sample(fmt, k, alphabet, rng):
+	words = []
+	tries = 0
+	while len(words) < k:
+		word = ''.join(rng.choice(alphabet) for _ in range(fmt.N))
+		tries += 1
+		try:
+			fmt.rank(word)
+		except (ValueError, KeyError):
+			continue
+		words.append(word)
+	return words, tries
+
+def report(name, words, seconds):
+	print(name.ljust(56) + ': {0:10.0f} words/s'.format(words / seconds))
+
+rng = random.Random(45)
+digits = '0123456789'
+formats = [
+	('ECV', pyFNR.Util.ECV(), digits + 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'),
+	('LuhnR(0,16)', pyFNR.Util.LuhnR(0, 16), digits),
+	('checksum mod ' + str(MODULUS) + ' (12 digits)', checksum_format(), digits),
+	('IPv4', pyFNR.Util.IPv4(), None),
+	('IPv6', pyFNR.Util.IPv6(), None),
+	('CompositeFormat(ECV,LuhnR(0,16),IPv4)', pyFNR.Util.CompositeFormat([pyFNR.Util.ECV(), pyFNR.Util.LuhnR(0, 16), pyFNR.Util.IPv4()], '|'), None),
+]
+for name, fmt, alphabet in formats:
+	if alphabet is not None:
+		start = time.time()
+		words, tries = rejection_sample(fmt, N_REJECTION, alphabet, rng)
+		report(name + ' rejection', N_REJECTION, time.time() - start)
+		print('\t' + '{0:.1f} strings drawn per word'.format(1.0 * tries / N_REJECTION))
+	start = time.time()
+	fmt.sample(N_WORDS, rng)
+	report(name + ' sample()', N_WORDS, time.time() - start)
+	start = time.time()
+	fmt.sample(N_WORDS, rng, distinct=True)
+	report(name + ' sample(distinct=True)', N_WORDS, time.time() - start)
@@ -0,0 +1,52 @@
+import multiprocessing
+import random
+import time
+import pyFNR.Util
+import pyFNR.shared
+
+N_WORKERS = 4
+N_SAMPLES = 1000
+MODULUS = 5000 # states of custom DFA
+LENGTH = 40
+
+def memory():
+	# resident (Rss), proportional (Pss) and private (Uss) memory in kB
+	values = {}
+	with open('/proc/self/smaps_rollup') as f:
+		for line in f:
+			parts = line.split()
+			if parts[0].rstrip(':') in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+				values[parts[0].rstrip(':')] = int(parts[1])
+	return {'Rss': values['Rss'], 'Pss': values['Pss'], 'Uss': values['Private_Clean'] + values['Private_Dirty']}
+
+def build_format():
+	# decimal numbers divisible by MODULUS
+	Q = list(range(MODULUS))
+	Sigma = [str(i) for i in range(10)]
+	dfa = pyFNR.Util.DFA(Q, Sigma, lambda q, a: (10 * q + int(a)) % MODULUS, 0, [0])
+	return pyFNR.Util.FPE_Format(dfa, LENGTH)
+
+def worker(args):
+	mode, name = args
+	before = memory()
+	start = time.time()
+	fmt = build_format() if mode == 'build' else pyFNR.shared.attach(name)
+	ready = time.time() - start
+	for _ in range(N_SAMPLES):
+		fmt.rank(fmt.unrank(random.randrange(fmt.get_words_count())))
+	after = memory()
+	return ready, dict((key, after[key] - before[key]) for key in after)
+
+if __name__ == '__main__':
+	parent = build_format()
+	tables = pyFNR.shared.publish(parent)
+	print('tables: ' + str(tables.size // 1024) + 'kB in shared memory, ' + str(N_WORKERS) + ' workers')
+	context = multiprocessing.get_context('fork')
+	for mode in ('build', 'attach'):
+		with context.Pool(N_WORKERS) as pool:
+			results = pool.map(worker, [(mode, tables.name)] * N_WORKERS)
+		ready = sum(r[0] for r in results) / N_WORKERS
+		mem = dict((key, sum(r[1][key] for r in results) // N_WORKERS) for key in results[0][1])
+		print(mode.ljust(7) + '\tready: {0:.3f}s'.format(ready) + '\tper worker: Rss +' + str(mem['Rss']) + 'kB\tPss +' + str(mem['Pss']) + 'kB\tUss +' + str(mem['Uss']) + 'kB')
+	tables.close()
+	tables.unlink()
@@ -0,0 +1,59 @@
+import math
+import time
+import pyFNR._optional
+import pyFNR.Util
+
+# counting table build time and footprint for long words
+SIGMA = [str(i) for i in range(10)]
+MODULUS = 997
+
+def luhn_dfa():
+	return pyFNR.Util.LuhnR(0, 1).DFA
+
+def checksum_dfa():
+	# decimal words with weighted checksum divisible by MODULUS
+	Q = list(range(MODULUS))
+	return pyFNR.Util.DFA(Q, SIGMA, lambda q, a: (q * 7 + int(a)) % MODULUS, 0, [0])
+
+def list_table(dfa, N):
+	# rows of Python lists of ints, for comparison
+	transitions = [[dfa.delta(q, a) for a in dfa.Sigma] for q in dfa.Q]
+	T = [[0]*(N+1) for _ in range(len(dfa.Q))]
+	for q in dfa.F:
+		T[q][0] = 1
+	for i in range(1, N+1):
+		for q in dfa.Q:
+			T[q][i] = sum(T[t][i-1] for t in transitions[q])
+	return T
+
+# import NumPy before timing
+pyFNR._optional.numpy()
+
+def mb(size):
+	return '{0:8.2f}MB'.format(size / 2.0**20)
+
+for name, factory, lengths in (('LuhnR', luhn_dfa, (64, 256, 1024)), ('checksum mod ' + str(MODULUS), checksum_dfa, (16, 64, 256))):
+	for N in lengths:
+		dfa = factory()
+		start = time.time()
+		list_table(dfa, N)
+		list_time = time.time() - start
+		dfa = factory()
+		start = time.time()
+		fmt = pyFNR.Util.FPE_Format(dfa, N)
+		build_time = time.time() - start
+		report = fmt.table.footprint()
+		print((name + ' N=' + str(N)).ljust(26) + ' lists: {0:7.3f}s'.format(list_time) + mb(report['list_bytes']) + '\ttable: {0:7.3f}s'.format(build_time) + mb(report['counts_bytes']) + '\t(' + str(report['fixed_columns']) + ' fixed, ' + str(report['big_columns']) + ' big columns)')
+
+# formats of lengths 1..N of one DFA share one growing table (tables only)
+N = 64
+start = time.time()
+for n in range(1, N + 1):
+	pyFNR.Util.FPE_Format(checksum_dfa(), n, positional=False)
+separate = time.time() - start
+start = time.time()
+dfa = checksum_dfa()
+for n in range(1, N + 1):
+	pyFNR.Util.FPE_Format(dfa, n, positional=False)
+shared = time.time() - start
+print('formats of lengths 1..' + str(N) + ': separate DFAs {0:.3f}s, shared DFA {1:.3f}s'.format(separate, shared))
@@ -0,0 +1,65 @@
+import argparse
+import sys
+import threading
+import time
+import pyFNR
+import pyFNR.Util
+
+# ops/s of instances shared by 1..N threads: FNR2.encrypt() per value,
+# FNR2.encrypt_batch() and LuhnR(0,16) rank/unrank. On GIL builds threads
+# add little (NumPy and libFNR calls release it), free-threaded builds
+# (python3.13t) should scale with cores.
+DOMAIN = 10**9 - 1
+
+def gil_enabled():
+	# sys._is_gil_enabled() exists since Python 3.13
+	return getattr(sys, '_is_gil_enabled', lambda: True)()
+
+def measure(threads, work, operations):
+	# every thread does operations // threads units of work
+	barrier = threading.Barrier(threads + 1)
+	share = operations // threads
+	def run():
+		barrier.wait()
+		work(share)
+	workers = [threading.Thread(target=run) for _ in range(threads)]
+	for worker in workers:
+		worker.start()
+	barrier.wait()
+	start = time.perf_counter()
+	for worker in workers:
+		worker.join()
+	return share * threads / (time.perf_counter() - start)
+
+parser = argparse.ArgumentParser(description='thread scaling benchmark')
+parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8], help='thread counts')
+parser.add_argument('--operations', type=int, default=20000, help='values per measurement')
+args = parser.parse_args()
+
+print('backend: ' + pyFNR.backends.get_backend().name + ', Python ' + sys.version.split()[0] + ', GIL ' + ('enabled' if gil_enabled() else 'disabled'))
+fnr2 = pyFNR.FNR2.from_master_key(b'k' * pyFNR.KEY_SIZE, 'threads', DOMAIN)
+fmt = pyFNR.Util.LuhnR(0, 16)
+words = fmt.sample(1000)
+
+def single(count):
+	encrypt = fnr2.encrypt
+	for x in range(count):
+		encrypt(x)
+
+def batch(count):
+	for start in range(0, count, 1000):
+		fnr2.encrypt_batch(range(start, min(start + 1000, count)))
+
+def formats(count):
+	# 10x operations, rank/unrank are cheap compared to enciphering
+	for i in range(10 * count):
+		fmt.unrank(fmt.rank(words[i % 1000]))
+
+for name, work, scale in (('encrypt', single, 1), ('encrypt_batch', batch, 1), ('rank+unrank', formats, 10)):
+	work(1000) # warm up lazily built tables
+	base = None
+	for threads in args.threads:
+		speed = scale * measure(threads, work, args.operations)
+		base = base or speed
+		print(name.ljust(14) + ' threads {0:3d}: {1:10.0f} ops/s ({2:4.2f}x)'.format(threads, speed, speed / base))
+fnr2.close()
@@ -0,0 +1,21 @@
+import time
+import random
+import pyFNR
+
+N_SAMPLES = 200
+
+# domains of more than 2**128 elements use Feistel network over FNR-128
+for bits in [128, 130, 192, 256, 512, 1024, 2048]:
+	tests = [random.randint(0, 2**bits - 1) for _ in range(N_SAMPLES)]
+	fnr2 = pyFNR.FNR2(key="password", tweak="string tweak", domain=2**bits - 1)
+
+	start = time.time()
+	for p in tests:
+		fnr2.encrypt(p)
+	single = time.time() - start
+
+	start = time.time()
+	fnr2.encrypt_batch(tests)
+	batch = time.time() - start
+	fnr2.close()
+	print('domain: 2**' + str(bits).ljust(5) + '\tengine: ' + fnr2._engine.name.ljust(14) + '\tencrypt: ' + str(int(N_SAMPLES / single)).rjust(7) + ' ops/s\tencrypt_batch: ' + str(int(N_SAMPLES / batch)).rjust(7) + ' ops/s')
@@ -0,0 +1,257 @@
+"""
+Benchmark suite of pyFNR with machine-readable results.
+
+Every benchmark is timed by time.perf_counter() after warmup runs, in
+several repeats, and reported as time per operation (min, median, mean).
+
+Usage:
+	python benchmarks/suite.py [run] [-o results.json] [--quick] [--filter TEXT]
+	python benchmarks/suite.py compare baseline.json results.json [--threshold 0.1]
+
+Compare mode prints relative change of median time for every benchmark
+present in both files and exits with status 1 if any benchmark is slower
+than baseline by more than threshold.
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+
+import pyFNR
+import pyFNR.Util
+import pyFNR.backends
+
+BLOCK_SIZES = [1, 8, 16, 31, 32, 33, 48, 64, 96, 127, 128]
+DOMAIN_EXPONENTS = [16, 32, 64]
+
+_benchmarks = []
+
+def benchmark(func):
+	"""
+	Registers generator of benchmark cases. Generator yields tuples
+	(name, setup), where setup() returns tuple (function, number,
+	resources): function() performs number operations and resources
+	(FNR or FNR2 instances) are closed when the case is finished. Setup
+	is called only for cases selected by --filter.
+	"""
+	_benchmarks.append(func)
+	return func
+
+def measure(func, number, repeat=5, warmup=1):
+	"""
+	measure(function, int[, repeat[, warmup]]) -> dict
+
+	Calls function warmup times, then repeat times measures duration of
+	a call. Returns statistics of time per operation in seconds.
+	"""
+	for _ in range(warmup):
+		func()
+	times = []
+	for _ in range(repeat):
+		start = time.perf_counter()
+		func()
+		times.append((time.perf_counter() - start) / number)
+	times.sort()
+	return {
+		'number': number,
+		'repeat': repeat,
+		'min': times[0],
+		'median': times[len(times) // 2],
+		'mean': sum(times) / len(times),
+		'max': times[-1],
+	}
+
+def _loop(operation, inputs):
+	def run():
+		for x in inputs:
+			operation(x)
+	return run
+
+@benchmark
+def construction(quick):
+	number = 3 if quick else 20
+	master_key = bytes(bytearray(range(pyFNR.KEY_SIZE)))
+	yield ('construct/FNR(block_size=32)', lambda: (lambda: [pyFNR.FNR(block_size=32).close() for _ in range(number)], number, []))
+	yield ('construct/FNR(block_size=128)', lambda: (lambda: [pyFNR.FNR(block_size=128).close() for _ in range(number)], number, []))
+	yield ('construct/FNR.from_master_key(block_size=128)', lambda: (lambda: [pyFNR.FNR.from_master_key(master_key, block_size=128).close() for _ in range(number)], number, []))
+	yield ('construct/FNR2(domain=10**9)', lambda: (lambda: [pyFNR.FNR2(domain=10**9).close() for _ in range(number)], number, []))
+
+def _fnr_case(block_size, operation, number):
+	fnr = pyFNR.FNR(block_size=block_size)
+	ints = [random.randrange(2**block_size) for _ in range(number)]
+	if operation == 'encrypt_ints':
+		ints = ints * 10
+		return (lambda: fnr.encrypt_ints(ints)), number * 10, [fnr]
+	inputs = ints
+	if operation in ('encrypt_bytes', 'encrypt_str'):
+		inputs = [fnr._int_to_bytes(i) for i in ints]
+	if operation == 'encrypt_str':
+		inputs = [fnr._bytes_to_str(b).rstrip('\x00') for b in inputs]
+	return _loop(getattr(fnr, operation), inputs), number, [fnr]
+
+@benchmark
+def fnr_operations(quick):
+	number = 20 if quick else 200
+	for block_size in BLOCK_SIZES:
+		for operation in ('encrypt_int', 'decrypt_int', 'encrypt_bytes', 'encrypt_str', 'encrypt_ints'):
+			yield ('fnr/' + operation + '/block_size=' + str(block_size), lambda block_size=block_size, operation=operation: _fnr_case(block_size, operation, number))
+
+def _fnr2_case(domain, batch, number):
+	fnr2 = pyFNR.FNR2(domain=domain)
+	ints = [random.randrange(domain + 1) for _ in range(number)]
+	if batch:
+		ints = ints * 10
+		return (lambda: fnr2.encrypt_batch(ints)), number * 10, [fnr2]
+	return _loop(fnr2.encrypt, ints), number, [fnr2]
+
+@benchmark
+def fnr2_cycle_walking(quick):
+	number = 20 if quick else 200
+	for exponent in DOMAIN_EXPONENTS:
+		# domain sizes 2**k - 1 .. 2**k + 1 need k or k+1 bits, walks differ a lot
+		for domain in (2**exponent - 2, 2**exponent - 1, 2**exponent):
+			suffix = '/size=2**' + str(exponent) + '{0:+d}'.format(domain + 1 - 2**exponent)
+			yield ('fnr2/encrypt' + suffix, lambda domain=domain: _fnr2_case(domain, False, number))
+			yield ('fnr2/encrypt_batch' + suffix, lambda domain=domain: _fnr2_case(domain, True, number))
+
+def _dedup_case(distinct, dedup, number):
+	ecv = pyFNR.Util.ECV()
+	words = [ecv.unrank(random.randrange(ecv.get_words_count())) for _ in range(distinct)]
+	rows = [random.choice(words) for _ in range(number)]
+	fnr2 = pyFNR.FNR2(domain=ecv.get_words_count() - 1, dedup=dedup)
+	return (lambda: fnr2.encrypt_words(ecv, rows)), number, [fnr2]
+
+@benchmark
+def deduplication(quick):
+	number = 1000 if quick else 20000
+	for distinct in (10, 100, number):
+		for dedup in (pyFNR.DEDUP_THRESHOLD, None):
+			suffix = '/distinct=' + str(distinct) + '/dedup=' + str(dedup)
+			yield ('fnr2/encrypt_words/ECV' + suffix, lambda distinct=distinct, dedup=dedup: _dedup_case(distinct, dedup, number))
+
+def _permutation_case(start, number):
+	fnr2 = pyFNR.FNR2(domain=10**9 - 1)
+	if start is None:
+		start = fnr2.shard_range(63, 64)[0]
+	return (lambda: sum(1 for _ in fnr2.permutation(start, start + number))), number, [fnr2]
+
+@benchmark
+def permutation(quick):
+	number = 1000 if quick else 20000
+	# iterate parts of 10**9-element permutation at several positions
+	for start in (0, 5 * 10**8, 10**9 - number):
+		yield ('fnr2/permutation/size=10**9/start=' + str(start), lambda start=start: _permutation_case(start, number))
+	yield ('fnr2/permutation/size=10**9/shard=63of64', lambda: _permutation_case(None, number))
+
+ALNUM = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+
+def _alnum_dfa():
+	return pyFNR.Util.DFA([0], list(ALNUM), lambda q, a: 0, 0, [0])
+
+def _format_case(factory, operation, number, build_number):
+	if operation == 'build':
+		return (lambda: [factory() for _ in range(build_number)]), build_number, []
+	fmt = factory()
+	ranks = [random.randrange(fmt.get_words_count()) for _ in range(number)]
+	words = [fmt.unrank(c) for c in ranks]
+	inputs = words if operation.startswith('rank') else ranks
+	if operation.endswith('_batch'):
+		return (lambda: getattr(fmt, operation)(inputs)), number, []
+	return _loop(getattr(fmt, operation), inputs), number, []
+
+@benchmark
+def formats(quick):
+	number = 20 if quick else 200
+	build_number = 1 if quick else 5
+	factories = [
+		('LuhnR(0,16)', lambda: pyFNR.Util.LuhnR(0, 16)),
+		('ECV', pyFNR.Util.ECV),
+		('IPv4', pyFNR.Util.IPv4),
+		('IPv6', pyFNR.Util.IPv6),
+		('ECV(generic)', lambda: pyFNR.Util.FPE_Format(pyFNR.Util.ECV().DFA, 7, positional=False)),
+		('FPE_Format(alnum*12)', lambda: pyFNR.Util.FPE_Format(_alnum_dfa(), 12)),
+		('FPE_Format(alnum*12,generic)', lambda: pyFNR.Util.FPE_Format(_alnum_dfa(), 12, positional=False)),
+		('PositionalFormat(alnum*12)', lambda: pyFNR.Util.PositionalFormat([ALNUM] * 12)),
+		('PositionalFormat(alnum*8,prefix=ECV)', lambda: pyFNR.Util.PositionalFormat([ALNUM] * 8, prefix=pyFNR.Util.ECV())),
+		('DateFormat', pyFNR.Util.DateFormat),
+		('DateFormat(%d.%m.%Y)', lambda: pyFNR.Util.DateFormat('%d.%m.%Y', '01.01.1900', '31.12.2099')),
+		('TimestampFormat', pyFNR.Util.TimestampFormat),
+		('IntRangeFormat(0,10**9,10)', lambda: pyFNR.Util.IntRangeFormat(0, 10**9, 10)),
+		('CompositeFormat(ECV,LuhnR(0,4),IPv4)', lambda: pyFNR.Util.CompositeFormat([pyFNR.Util.ECV(), pyFNR.Util.LuhnR(0, 4), pyFNR.Util.IPv4()], '|')),
+	]
+	for name, factory in factories:
+		for operation in ('build', 'rank', 'unrank', 'rank_batch', 'unrank_batch'):
+			yield ('format/' + operation + '/' + name, lambda factory=factory, operation=operation: _format_case(factory, operation, number, build_number))
+
+def run(args):
+	repeat = 3 if args.quick else args.repeat
+	results = {}
+	for generator in _benchmarks:
+		for name, setup in generator(args.quick):
+			if args.filter and args.filter not in name:
+				continue
+			# inputs of a case do not depend on which other cases run
+			random.seed(str(args.seed) + name)
+			func, number, resources = setup()
+			try:
+				results[name] = measure(func, number, repeat)
+			finally:
+				for resource in resources:
+					resource.close()
+			print(name.ljust(60) + ' {0:12.3f}us'.format(results[name]['median'] * 1e6))
+	report = {
+		'meta': {
+			'python': platform.python_version(),
+			'implementation': platform.python_implementation(),
+			'platform': platform.platform(),
+			'backend': pyFNR.backends.get_backend().name,
+			'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+		},
+		'results': results,
+	}
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1, sort_keys=True)
+	return 0
+
+def compare(args):
+	with open(args.baseline) as f:
+		baseline = json.load(f)['results']
+	with open(args.results) as f:
+		results = json.load(f)['results']
+	regressions = 0
+	for name in sorted(set(baseline) & set(results)):
+		change = results[name]['median'] / baseline[name]['median'] - 1
+		flag = ''
+		if change > args.threshold:
+			flag = ' REGRESSION'
+			regressions += 1
+		print(name.ljust(60) + ' {0:+8.1%}'.format(change) + flag)
+	for name in sorted(set(baseline) ^ set(results)):
+		print(name.ljust(60) + ' only in ' + ('baseline' if name in baseline else 'results'))
+	print(str(regressions) + ' regression(s) over {0:.0%}'.format(args.threshold))
+	return 1 if regressions else 0
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='pyFNR benchmark suite')
+	subparsers = parser.add_subparsers(dest='command')
+	run_parser = subparsers.add_parser('run', help='run benchmarks')
+	compare_parser = subparsers.add_parser('compare', help='compare two result files')
+	for p in (parser, run_parser):
+		p.add_argument('-o', '--output', help='write results as JSON to this file')
+		p.add_argument('--repeat', type=int, default=5, help='number of measured repeats')
+		p.add_argument('--quick', action='store_true', help='fewer operations and repeats')
+		p.add_argument('--filter', help='run only benchmarks containing this text')
+		p.add_argument('--seed', type=int, default=47, help='seed of random inputs')
+	compare_parser.add_argument('baseline')
+	compare_parser.add_argument('results')
+	compare_parser.add_argument('--threshold', type=float, default=0.1, help='allowed relative slowdown of median')
+	args = parser.parse_args(argv)
+	if args.command == 'compare':
+		return compare(args)
+	return run(args)
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,13 @@
+import pyFNR
+import pyFNR.Util
+
+birth_date = pyFNR.Util.DateFormat('%d.%m.%Y', '01.01.1900', '31.12.2020')
+fnr = pyFNR.FNR2(key='password', tweak='tweak-is-string', domain=birth_date.get_words_count()-1)
+
+plain = '13.07.1985'
+cipher = birth_date.unrank(fnr.encrypt(birth_date.rank(plain)))
+plain2 = birth_date.unrank(fnr.decrypt(birth_date.rank(cipher)))
+
+print(plain + ' -> ' + cipher + ' -> ' +plain2)
+
+fnr.close()
@@ -7,10 +7,75 @@ and unrank() methods for converting words from desired regular
 language to integers and vice versa.
 """
 
-import struct
-import socket
-import binascii
+import array
+import bisect
 import math
+import sys
+import threading
+
+from pyFNR import _optional
+
+# minimal batch size for NumPy paths of arithmetic formats
+NUMPY_BATCH_THRESHOLD = 32
+# minimal number of states counted by NumPy in CountingTable
+NUMPY_TABLE_THRESHOLD = 256
+# tables with counts of at least this many bits store big columns as gmpy2.mpz,
+# smaller mpz additions and comparisons are slower than Python ints (see
+# benchmarks/benchmark_bigint.py)
+MPZ_BITS = 1024
+# words unranked at once by FPE_Format.generate()
+SAMPLE_CHUNK_SIZE = 4096
+
+_arithmetic = None
+# serializes discovery of lazy DFA states and extension of counting tables,
+# lookups of published tables and memoized transitions take no lock
+_build_lock = threading.RLock()
+
+def set_arithmetic(name):
+	"""
+	set_arithmetic(str or None)
+
+	Selects arithmetic of big counts in counting tables built later:
+	'gmpy2' stores all columns of big counts as gmpy2.mpz once counts of
+	a table reach MPZ_BITS bits (additions and subtractions of such
+	numbers in table build, rank() and unrank() are faster, smaller
+	ones are faster as Python ints), 'python' uses Python ints only and
+	None (default) selects 'gmpy2' if it is installed.
+	"""
+	global _arithmetic
+	if name not in (None, 'python', 'gmpy2'):
+		raise ValueError("Unknown arithmetic: " + str(name))
+	if name == 'gmpy2' and _optional.gmpy2() is None:
+		raise ImportError("gmpy2 is not installed")
+	_arithmetic = name
+
+def get_arithmetic():
+	"""
+	get_arithmetic() -> str
+
+	Returns name of arithmetic used by new counting tables.
+	"""
+	if _arithmetic is None:
+		return 'gmpy2' if _optional.gmpy2() is not None else 'python'
+	return _arithmetic
+
+def _rank_positional(X, start, digits):
+	# mixed-radix number from positions start.. of X, digits[i] maps char -> digit
+	c = 0
+	for i, position_digits in enumerate(digits):
+		char = X[start + i]
+		if char not in position_digits:
+			raise ValueError('Invalid word ' + X)
+		c = c * len(position_digits) + position_digits[char]
+	return c
+
+def _unrank_positional(c, chars):
+	# inverse of _rank_positional, chars[i] is ordered list of chars of position
+	X = [None] * len(chars)
+	for i in range(len(chars) - 1, -1, -1):
+		c, d = divmod(c, len(chars[i]))
+		X[i] = chars[i][d]
+	return ''.join(X)
 
 class DFA(object):
 	"""
@@ -26,12 +91,25 @@ class DFA(object):
 		from Q as values or function (state, symbol) -> state
 	q0 -- start state from Q
 	F -- list of accept states, a subset of Q
+	lazy -- discover states on demand (default False). Q can be None,
+		delta is called only for states reachable from q0 and its
+		results are memoized under integer IDs, delta returning None
+		means no transition. F can be a collection or a predicate
+		state -> bool. FPE_Format explores only states reachable within
+		N steps (see explore()), e.g. for automata with large sparsely
+		reachable state spaces such as checksum-plus-counter formats.
 	"""
 
-	def __init__(self, Q, Sigma, delta, q0, F):
+	lazy = False
+	_table = None
+
+	def __init__(self, Q, Sigma, delta, q0, F, lazy=False):
 		"""
 		Constructor of DFA class. For parameter description see DFA.__doc__
 		"""
+		if lazy:
+			self.__initLazy(Q, Sigma, delta, q0, F)
+			return
 		if not (q0 in Q):
 			raise ValueError("Unknown initial state: " + str(q0))
 		for q in F:
@@ -72,6 +150,15 @@ class DFA(object):
 		"""
 		if (q == self.invalid_q):
 			return self.invalid_q
+		if self.lazy:
+			j = self.Sigma_ord[char]
+			t = self._memo[q][j]
+			if t is None:
+				with _build_lock:
+					t = self._memo[q][j]
+					if t is None:
+						t = self._memo[q][j] = self.__stateId(self._delta(self.Q_chr[q], char))
+			return t
 		if (type(self._delta) == dict):
 			if (q, char) in self._delta:
 				return self._delta[(q, char)]
@@ -80,6 +167,138 @@ class DFA(object):
 		else:
 			return self.Q_ord[self._delta(self.Q_chr[q], char)]
 
+	def __initLazy(self, Q, Sigma, delta, q0, F):
+		# ID 0 is invalid state, other IDs are assigned in order of discovery
+		if Q is not None and not (q0 in Q):
+			raise ValueError("Unknown initial state: " + str(q0))
+		if (type(delta) == dict):
+			_delta = {}
+			for q,chars in delta.keys():
+				for a in chars:
+					_delta[(q,a)] = delta[q,chars]
+			delta = lambda q, a: _delta.get((q, a))
+		self.lazy = True
+		self.Sigma = Sigma
+		self.Sigma_ord = dict(zip(Sigma, range(len(Sigma))))
+		self.invalid_q = 0
+		self.Q_chr = [None]
+		self.Q_ord = {}
+		self.Q = range(1)
+		self.F = []
+		self._delta = delta
+		self._accepts = F if callable(F) else (lambda q, F=F: q in F)
+		self._memo = [[0] * len(Sigma)]
+		self.q0 = self.__stateId(q0)
+
+	def __stateId(self, q):
+		if q is None:
+			return self.invalid_q
+		if q in self.Q_ord:
+			return self.Q_ord[q]
+		i = self.Q_ord[q] = len(self.Q_chr)
+		self.Q_chr.append(q)
+		self._memo.append([None] * len(self.Sigma))
+		self.Q = range(len(self.Q_chr))
+		if self._accepts(q):
+			self.F.append(i)
+		return i
+
+	def explore(self, N):
+		"""
+		explore(int) -> list of lists
+
+		Finds states reachable from q0 within N steps by breadth-first
+		search and returns them by levels: list of states first reached
+		after i steps for i in 0..N. Transitions of states of levels
+		0..N-1 are memoized, so repeated exploration is cheap.
+		"""
+		with _build_lock:
+			levels = [[self.q0]]
+			seen = set([self.q0, self.invalid_q])
+			for i in range(N):
+				level = []
+				for q in levels[-1]:
+					for a in self.Sigma:
+						t = self.delta(q, a)
+						if t not in seen:
+							seen.add(t)
+							level.append(t)
+				levels.append(level)
+			return levels
+
+	def intersect(self, other, minimize=True):
+		"""
+		intersect(DFA[, minimize]) -> DFA
+
+		Returns DFA of words accepted by both automata, over symbols of
+		both of them (in order of this DFA). See union().
+		"""
+		sigma = [a for a in self.Sigma if a in other.Sigma_ord]
+		return self.__product(other, sigma, lambda x, y: x and y, minimize)
+
+	def union(self, other, minimize=True):
+		"""
+		union(DFA[, minimize]) -> DFA
+
+		Returns DFA of words accepted by any of automata, over symbols of
+		any of them (symbols of this DFA first).
+
+		Product automaton contains only pairs of states reachable from
+		the pair of start states and its states are integers. With
+		minimize (default) equivalent states are merged and states
+		accepting no words are removed, so counting tables of formats
+		stay small. Product of lazy automata is lazy and not minimized.
+		"""
+		sigma = list(self.Sigma) + [a for a in other.Sigma if a not in self.Sigma_ord]
+		return self.__product(other, sigma, lambda x, y: x or y, minimize)
+
+	def complement(self, minimize=True):
+		"""
+		complement([minimize]) -> DFA
+
+		Returns DFA of words over Sigma which are not accepted by this
+		DFA. See union().
+		"""
+		def step(state, a):
+			return (self.delta(state[0], a),)
+		def accepts(state):
+			return not self._is_final(state[0])
+		return _build_dfa(self.Sigma, step, (self.q0,), accepts, minimize, self.lazy)
+
+	def __product(self, other, sigma, combine, minimize):
+		def step(state, a):
+			p = self.delta(state[0], a) if a in self.Sigma_ord else self.invalid_q
+			q = other.delta(state[1], a) if a in other.Sigma_ord else other.invalid_q
+			if not combine(p != self.invalid_q, q != other.invalid_q):
+				return None
+			return (p, q)
+		def accepts(state):
+			return combine(self._is_final(state[0]), other._is_final(state[1]))
+		return _build_dfa(sigma, step, (self.q0, other.q0), accepts, minimize, self.lazy or other.lazy)
+
+	def _is_final(self, q):
+		# accept state test for compiled state q
+		if q == self.invalid_q:
+			return False
+		if self.lazy:
+			return self._accepts(self.Q_chr[q])
+		if getattr(self, '_final', None) is None:
+			self._final = set(self.F)
+		return q in self._final
+
+	def counting_table(self, N):
+		"""
+		counting_table(int) -> CountingTable
+
+		Returns counting table of this DFA extended to words of length N.
+		All formats of the DFA share one table, which grows for longer words.
+		"""
+		with _build_lock:
+			if self._table is None:
+				self._table = CountingTable(self)
+			self._table.extend(N)
+			return self._table
+
 	def ord(self, char):
 		"""
 		ord(char) -> int
@@ -97,6 +316,228 @@ class DFA(object):
 		return self.Sigma[i]
 
 
+def _build_dfa(Sigma, step, start, accepts, minimize, lazy):
+	# DFA of states reachable from start, step(state, symbol) -> state or None
+	if lazy:
+		return DFA(None, Sigma, step, start, accepts, lazy=True)
+	ids = {start: 0}
+	states = [start]
+	transitions = []
+	for state in states:
+		row = []
+		for a in Sigma:
+			t = step(state, a)
+			if t is None:
+				row.append(None)
+				continue
+			if t not in ids:
+				ids[t] = len(states)
+				states.append(t)
+			row.append(ids[t])
+		transitions.append(row)
+	invalid = len(states)
+	transitions = [[invalid if t is None else t for t in row] for row in transitions]
+	transitions.append([invalid] * len(Sigma))
+	final = [accepts(state) for state in states] + [False]
+	if minimize:
+		transitions, final, invalid = _minimize(transitions, final, invalid)
+	dfa = DFA.__new__(DFA)
+	dfa.Q = range(invalid + 1)
+	dfa.invalid_q = invalid
+	dfa.Sigma = list(Sigma)
+	dfa.Sigma_ord = dict(zip(Sigma, range(len(Sigma))))
+	dfa.q0 = 0
+	dfa.F = [q for q in range(invalid) if final[q]]
+	dfa._delta = dict(((q, a), t) for q in range(invalid) for a, t in zip(Sigma, transitions[q]) if t != invalid)
+	return dfa
+
+def _minimize(transitions, final, invalid):
+	# Moore's partition refinement, class of invalid state becomes invalid
+	classes = [1 if f else 0 for f in final]
+	count = len(set(classes))
+	while True:
+		signatures = {}
+		refined = [signatures.setdefault((classes[q],) + tuple(classes[t] for t in row), len(signatures)) for q, row in enumerate(transitions)]
+		classes = refined
+		if len(signatures) == count:
+			break
+		count = len(signatures)
+	# number classes in order of states (start state 0 stays 0)
+	numbers = {}
+	sink = classes[invalid]
+	for q in range(len(transitions)):
+		if classes[q] != sink and classes[q] not in numbers:
+			numbers[classes[q]] = len(numbers)
+	numbers[sink] = len(numbers)
+	representatives = {}
+	for q in range(len(transitions)):
+		representatives.setdefault(numbers[classes[q]], q)
+	size = len(numbers)
+	minimized = [[numbers[classes[t]] for t in transitions[representatives[c]]] for c in range(size)]
+	return minimized, [final[representatives[c]] for c in range(size)], size - 1
+
+
+class CountingTable(object):
+	"""
+	CountingTable(DFA) -> CountingTable object
+
+	Numbers of words accepted from states of DFA, see
+	DFA.counting_table(). columns[i][q] is the number of words of length
+	i accepted from state q, transitions[q][j] is the state after symbol
+	Sigma[j]. Columns are stored as array('Q') of unsigned 64-bit ints
+	while their counts fit and as lists of Python ints (or gmpy2.mpz for
+	very big counts, see set_arithmetic()) when they overflow. extend() adds columns for longer words, columns
+	of many states are counted by NumPy if it is installed. Published
+	columns (a tuple) and transitions (a tuple of tuples) are immutable,
+	so tables can be shared by threads (also of free-threaded builds).
+
+	Table of lazy DFA counts only states reachable from q0: column i is
+	valid for states first reached within N - i steps (depth[q]), where
+	N is the length of the table.
+	"""
+
+	_mpz = None
+
+	def __init__(self, DFA):
+		self.DFA = DFA
+		self.N = -1
+		self.columns = ()
+		self.transitions = ()
+		self.depth = ()
+
+	def extend(self, N):
+		"""
+		extend(int)
+
+		Extends table to words of length N. Columns and transitions are
+		never modified once published: extension builds new tuples
+		(copying only columns which change) and replaces them at once, so
+		formats built earlier keep consistent tables while other threads
+		extend it.
+		"""
+		if N <= self.N:
+			return
+		with _build_lock:
+			if N > self.N:
+				self.__extend(N)
+
+	def __extend(self, N):
+		DFA = self.DFA
+		transitions = self.transitions
+		depth = self.depth
+		if DFA.lazy:
+			# lazy DFA: states of levels N.. have no transitions yet
+			levels = DFA.explore(N)
+			depth = [N + 1] * len(DFA.Q)
+			depth[DFA.invalid_q] = 0
+			for i, level in enumerate(levels):
+				for q in level:
+					depth[q] = i
+			invalid = (DFA.invalid_q,) * len(DFA.Sigma)
+			transitions = tuple(tuple(DFA._memo[q]) if d < N else invalid for q, d in enumerate(depth))
+		elif not transitions:
+			transitions = tuple(tuple(DFA.delta(q, a) for a in DFA.Sigma) for q in DFA.Q)
+			depth = [0] * len(DFA.Q)
+		states = len(depth)
+		order = sorted(range(states), key=depth.__getitem__)
+		depths = [depth[q] for q in order]
+		numpy = _optional.numpy() if states >= NUMPY_TABLE_THRESHOLD else None
+		matrix = None
+		if numpy is not None:
+			matrix = numpy.array(transitions, dtype=numpy.intp).reshape(states, len(DFA.Sigma))
+		final = set(DFA.F)
+		columns = list(self.columns)
+		for i in range(N + 1):
+			# counts of states first reached after self.N - i .. N - i steps are missing
+			targets = order[bisect.bisect_right(depths, self.N - i):bisect.bisect_right(depths, N - i)]
+			if i < len(columns):
+				column = columns[i]
+				if not targets and len(column) == states:
+					continue
+				# copy on write, published columns are shared by formats
+				column = columns[i] = column[:]
+				column.extend([0] * (states - len(column)))
+			else:
+				column = array.array('Q', bytes(8 * states))
+				columns.append(column)
+			if not targets:
+				continue
+			if i == 0:
+				for q in targets:
+					column[q] = 1 if q in final else 0
+			elif not self.__countNumpy(numpy, matrix, columns, transitions, i, targets):
+				self.__count(columns, transitions, i, targets)
+		self.transitions = transitions
+		self.depth = tuple(depth)
+		self.columns = tuple(columns)
+		self.N = N
+
+	def __count(self, columns, transitions, i, targets):
+		previous = columns[i-1]
+		values = [sum(previous[t] for t in transitions[q]) for q in targets]
+		column = columns[i]
+		largest = max(values)
+		if isinstance(column, array.array) and largest >= 2**64:
+			column = columns[i] = list(column)
+		if self._mpz is None and largest.bit_length() >= MPZ_BITS and get_arithmetic() == 'gmpy2':
+			# all big columns at once, mixed mpz and int operations are slow
+			self._mpz = _optional.gmpy2().mpz
+			for k, big in enumerate(columns):
+				if not isinstance(big, array.array):
+					columns[k] = [self._mpz(v) for v in big]
+			column = columns[i]
+		if self._mpz is not None and not isinstance(column, array.array):
+			values = [self._mpz(value) for value in values]
+		for q, value in zip(targets, values):
+			column[q] = value
+
+	def __countNumpy(self, numpy, matrix, columns, transitions, i, targets):
+		# only fixed-width columns whose sums cannot overflow
+		previous = columns[i-1]
+		column = columns[i]
+		if matrix is None or len(targets) < NUMPY_TABLE_THRESHOLD:
+			return False
+		if not isinstance(previous, array.array) or not isinstance(column, array.array):
+			return False
+		previous = numpy.frombuffer(previous, dtype=numpy.uint64)
+		if int(previous.max()) > (2**64 - 1) // matrix.shape[1]:
+			return False
+		targets = numpy.array(targets, dtype=numpy.intp)
+		numpy.frombuffer(column, dtype=numpy.uint64)[targets] = previous[matrix[targets]].sum(axis=1, dtype=numpy.uint64)
+		return True
+
+	def footprint(self):
+		"""
+		footprint() -> dict
+
+		Returns approximate memory footprint of the table in bytes:
+		fixed-width columns (fixed_bytes), columns of big ints (big_bytes),
+		both together (counts_bytes), transitions (transitions_bytes) and
+		total (bytes). For comparison list_bytes is size of the same
+		counts as rows of Python lists of ints.
+		"""
+		fixed = [column for column in self.columns if isinstance(column, array.array)]
+		big = [column for column in self.columns if not isinstance(column, array.array)]
+		report = {
+			'states': len(self.depth),
+			'N': self.N,
+			'fixed_columns': len(fixed),
+			'big_columns': len(big),
+			'fixed_bytes': sum(sys.getsizeof(column) for column in fixed),
+			'big_bytes': sum(sys.getsizeof(column) + sum(_int_size(v) for v in column) for column in big),
+			# rows of states without transitions are one shared list
+			'transitions_bytes': sys.getsizeof(self.transitions) + sum(sys.getsizeof(row) for row in dict((id(row), row) for row in self.transitions).values()),
+		}
+		report['counts_bytes'] = report['fixed_bytes'] + report['big_bytes']
+		report['bytes'] = report['counts_bytes'] + report['transitions_bytes']
+		report['list_bytes'] = len(self.depth) * sys.getsizeof([0] * (self.N + 1)) + sum(_int_size(v) for column in self.columns for v in column)
+		return report
+
+def _int_size(value):
+	# small ints are cached by CPython and cost nothing per entry
+	return 0 if -5 <= value <= 256 else sys.getsizeof(value)
+
+
 class FPE_Format(object):
 	"""
 	Base class for classes uses formats described by DFA.
@@ -104,28 +545,73 @@ class FPE_Format(object):
 	Arguments:
 	DFA -- DFA object for desired format (regular language).
 	N -- exact length of words from regular language
+	positional -- detect positional tail of the format (default True).
+		If all words with a valid prefix pass through a single DFA
+		state at each of the last positions, these positions are
+		independent character sets and rank()/unrank() handle them by
+		mixed-radix arithmetic instead of walking the DFA.
 	"""
 
-	def __init__(self, DFA, N):
+	def __init__(self, DFA, N, positional=True):
 		"""
 		Constructor of FPE_Format class. For parameter description
 		see FPE_Format.__doc__
 		"""
 		self.DFA = DFA
 		self.N = N
+		self._compile(DFA, N)
 		self.__buildTable(N)
-		self.words_count = self.T[0][N]
+		self.words_count = int(self._columns[N][self._q0])
+		self._tail_start = N
+		self._tail_chars = []
+		self._tail_digits = []
+		if positional:
+			self.__findPositionalTail(N)
+
+	def _compile(self, DFA, N):
+		self._sigma = list(DFA.Sigma)
+		self._sigma_ord = DFA.Sigma_ord
+		self._q0 = DFA.q0
+		self._invalid_q = DFA.invalid_q
 
 	def __buildTable(self, N):
-		DFA = self.DFA
-		self.T = [[0]*(N+1) for _ in range(len(DFA.Q))]
-		for q in DFA.Q:
-			if q in DFA.F:
-				self.T[q][0] = 1
-		for i in range(1, N+1):
-			for q in DFA.Q:
-				for a in DFA.Sigma:
-					self.T[q][i] += self.T[DFA.delta(q, a)][i-1]
+		# counting table shared by all formats of the DFA, see CountingTable;
+		# tables published together are never modified, see extend()
+		with _build_lock:
+			self.table = self.DFA.counting_table(N)
+			self._transitions = self.table.transitions
+			self._columns = self.table.columns
+
+	@property
+	def T(self):
+		"""
+		Counting table as rows: T[q][i] is the number of words of length i
+		accepted from state q. Built from columns of table on every access.
+		"""
+		columns = self._columns[:self.N + 1]
+		return [[column[q] for column in columns] for q in range(len(self._transitions))]
+
+	def __findPositionalTail(self, N):
+		# live states at position i: reachable from q0 and accepting some suffix
+		transitions = self._transitions
+		live = []
+		states = set([self._q0])
+		columns = self._columns
+		for i in range(N + 1):
+			live.append([q for q in states if q != self._invalid_q and columns[N-i][q] > 0])
+			states = set(t for q in live[-1] for t in transitions[q])
+		start = N
+		while start > 0 and len(live[start-1]) == 1:
+			start -= 1
+		if start == N:
+			return
+		self._tail_start = start
+		self._tail_state = live[start][0]
+		for i in range(start, N):
+			q = live[i][0]
+			chars = [a for a, t in zip(self._sigma, transitions[q]) if columns[N-i-1][t] > 0]
+			self._tail_chars.append(chars)
+			self._tail_digits.append(dict((a, d) for d, a in enumerate(chars)))
 
 	def rank(self, X):
 		"""
@@ -134,17 +620,27 @@ class FPE_Format(object):
 		Returns integer ordinal of given word in sorted list of all words
 		from regular language
 		"""
-		DFA = self.DFA
-		q = DFA.q0
+		columns = self._columns
+		transitions = self._transitions
+		sigma_ord = self._sigma_ord
+		q = self._q0
 		c = 0
 		N = self.N
-		for i in range(N):
-			for j in range(0, DFA.ord(X[i])):
-				c += self.T[DFA.delta(q, DFA.Sigma[j])][N-i-1]
-			q = DFA.delta(q, X[i])
-		if q == DFA.invalid_q:
+		for i in range(self._tail_start):
+			row = transitions[q]
+			column = columns[N-i-1]
+			j = sigma_ord[X[i]]
+			for t in row[:j]:
+				c += column[t]
+			q = row[j]
+		if self._tail_digits:
+			if q != self._tail_state:
+				raise ValueError('Invalid word ' + X)
+			return int(c + _rank_positional(X, self._tail_start, self._tail_digits))
+		if not columns[0][q]:
+			# invalid or not accepting state
 			raise ValueError('Invalid word ' + X)
-		return c
+		return int(c)
 
 	def unrank(self, c):
 		"""
@@ -153,20 +649,112 @@ class FPE_Format(object):
 		Returns word with given integer ordinal in sorted list of all
 		words from regular language.
 		"""
-		DFA = self.DFA
+		columns = self._columns
+		transitions = self._transitions
+		sigma = self._sigma
 		X = ''
 		N = self.N
-		q = DFA.q0
-		j = 0
-		for i in range(self.N):
-			while c >= self.T[DFA.delta(q, DFA.Sigma[j])][N-i-1]:
-				c -= self.T[DFA.delta(q,DFA.Sigma[j])][N-i-1]
-				j += 1
-			X += DFA.Sigma[j]
-			q = DFA.delta(q, X[i])
+		q = self._q0
+		for i in range(self._tail_start):
+			row = transitions[q]
+			column = columns[N-i-1]
 			j = 0
+			while c >= column[row[j]]:
+				c -= column[row[j]]
+				j += 1
+			X += sigma[j]
+			q = row[j]
+		if self._tail_chars:
+			X += _unrank_positional(c, self._tail_chars)
 		return X
 
+	def rank_batch(self, words):
+		"""
+		rank_batch(iterable) -> list
+
+		Returns list of integer ordinals of given words, see rank().
+		"""
+		rank = self.rank
+		return [rank(X) for X in words]
+
+	def unrank_batch(self, ranks):
+		"""
+		unrank_batch(iterable) -> list
+
+		Returns list of words with given integer ordinals, see unrank().
+		"""
+		unrank = self.unrank
+		return [unrank(c) for c in ranks]
+
+	def sample(self, k, rng=None, distinct=False):
+		"""
+		sample(int[, rng[, distinct]]) -> list
+
+		Returns list of k uniformly random words of the format, see
+		generate().
+		"""
+		return list(self.generate(k, rng, distinct))
+
+	def generate(self, k=None, rng=None, distinct=False, chunk_size=SAMPLE_CHUNK_SIZE):
+		"""
+		generate([k[, rng[, distinct[, chunk_size]]]]) -> generator of str
+
+		Lazily yields k uniformly random words of the format (endlessly if
+		k is None), e.g. synthetic test data. Ranks are drawn uniformly
+		from 0..get_words_count()-1 and unranked in chunks by
+		unrank_batch(), so no words are rejected even for sparse formats.
+
+		rng -- random.Random instance (default is module random).
+		distinct -- yield every word at most once: ranks are positions
+			0..k-1 of pseudorandom permutation (FNR2.permutation()) of
+			all ranks with random key from rng. k is at most
+			get_words_count(), None yields all words. Needs the default
+			cipher backend, see pyFNR.backends.
+		chunk_size -- number of words unranked at once.
+		"""
+		if rng is None:
+			import random
+			rng = random
+		count = self.get_words_count()
+		if distinct:
+			if k is None:
+				k = count
+			if k > count:
+				raise ValueError("Sample larger than number of words: " + str(count))
+			import pyFNR
+			master_key = bytes(bytearray(rng.getrandbits(8) for _ in range(pyFNR.KEY_SIZE)))
+			fnr2 = pyFNR.FNR2.from_master_key(master_key, "sample", count - 1)
+			try:
+				for start in range(0, k, chunk_size):
+					ranks = list(fnr2.permutation(start, min(start + chunk_size, k), chunk_size))
+					for word in self.unrank_batch(ranks):
+						yield word
+			finally:
+				fnr2.close()
+			return
+		done = 0
+		while k is None or done < k:
+			size = chunk_size if k is None else min(chunk_size, k - done)
+			for word in self.unrank_batch([rng.randrange(count) for _ in range(size)]):
+				yield word
+			done += size
+
+	def specialize(self, cache_dir=None):
+		"""
+		specialize([cache_dir]) -> FPE_Format
+
+		Replaces rank() and unrank() of this instance by functions
+		generated for its tables and N and returns the instance, see
+		pyFNR.codegen.
+		"""
+		from pyFNR import codegen
+		return codegen.specialize(self, cache_dir)
+
+	def _alphabet(self):
+		# set of characters words can contain, None if not known
+		sigma = getattr(self, '_sigma', None)
+		return set(sigma) if sigma is not None else None
+
 	def get_words_count(self):
 		"""
 		get_words_count() -> int
@@ -177,13 +765,568 @@ class FPE_Format(object):
 		return self.words_count
 
 
+class PositionalFormat(FPE_Format):
+	"""
+	PositionalFormat(positions[, prefix]) -> PositionalFormat object
+
+	Format of fixed-length words where every position has its own
+	independent set of characters, e.g. fixed-width alphanumeric IDs.
+	Words are ranked and unranked by mixed-radix arithmetic, no DFA or
+	counting table is built.
+
+	Arguments:
+	positions -- list of ordered character sets (strings or lists of
+		chars), one for each position
+	prefix -- optional FPE_Format for the beginning of words. Words are
+		prefix word followed by positional part and are ordered by
+		prefix first.
+	"""
+
+	def __init__(self, positions, prefix=None):
+		self.prefix = prefix
+		self._tail_chars = [list(chars) for chars in positions]
+		self._tail_digits = [dict((a, d) for d, a in enumerate(chars)) for chars in self._tail_chars]
+		for chars, digits in zip(self._tail_chars, self._tail_digits):
+			if not chars or len(digits) != len(chars):
+				raise ValueError('Invalid character set: ' + str(chars))
+		self._tail_start = 0
+		self._tail_count = 1
+		for chars in self._tail_chars:
+			self._tail_count *= len(chars)
+		self.words_count = self._tail_count
+		if prefix is not None:
+			self._tail_start = prefix.N
+			self.words_count *= prefix.get_words_count()
+		self.N = self._tail_start + len(positions)
+
+	def rank(self, X):
+		"""
+		rank(str) -> int
+
+		Returns integer ordinal of given word in sorted list of all words
+		from regular language
+		"""
+		if len(X) != self.N:
+			raise ValueError('Invalid word ' + X)
+		c = _rank_positional(X, self._tail_start, self._tail_digits)
+		if self.prefix is not None:
+			c += self.prefix.rank(X[:self._tail_start]) * self._tail_count
+		return c
+
+	def unrank(self, c):
+		"""
+		unrank(int) -> str
+
+		Returns word with given integer ordinal in sorted list of all
+		words from regular language.
+		"""
+		if self.prefix is None:
+			return _unrank_positional(c, self._tail_chars)
+		p, c = divmod(c, self._tail_count)
+		return self.prefix.unrank(p) + _unrank_positional(c, self._tail_chars)
+
+	def specialize(self, cache_dir=None):
+		"""
+		specialize([cache_dir]) -> PositionalFormat
+
+		Not supported, positional formats have no DFA tables to generate
+		code for and rank()/unrank() are plain arithmetic already. Raises
+		ValueError, specialize DFA based prefix instead.
+		"""
+		raise ValueError('PositionalFormat has no DFA tables to specialize, specialize its prefix instead')
+
+	def _alphabet(self):
+		alphabet = set(a for chars in self._tail_chars for a in chars)
+		if self.prefix is not None:
+			prefix = self.prefix._alphabet()
+			if prefix is None:
+				return None
+			alphabet |= prefix
+		return alphabet
+
+
+class CompositeFormat(FPE_Format):
+	"""
+	CompositeFormat(formats[, separator]) -> CompositeFormat object
+
+	Format of records which consist of several fields, each of them with
+	its own format (FPE_Format, PositionalFormat, IPv4, IPv6, other
+	CompositeFormat...). Rank of a record is mixed-radix number with
+	ranks of fields as digits (the first field is the most significant),
+	so no table for the whole record is built and tables of fields are
+	not copied. The same format instance can be shared by many fields
+	and composite formats.
+
+	Arguments:
+	formats -- list of formats of fields
+	separator -- string between fields (default ''). Without separator
+		all formats must have fixed length of words (attribute N), so
+		records can be split by lengths. The first character of
+		separator must not occur in words of any field, so records are
+		split unambiguously.
+	"""
+
+	def __init__(self, formats, separator=''):
+		self.formats = list(formats)
+		self.separator = separator
+		if not separator:
+			for fmt in self.formats:
+				if getattr(fmt, 'N', None) is None:
+					raise ValueError('Format without fixed length needs separator: ' + fmt.__class__.__name__)
+			self.N = sum(fmt.N for fmt in self.formats)
+		else:
+			for fmt in self.formats:
+				alphabet = fmt._alphabet() if isinstance(fmt, FPE_Format) else None
+				if alphabet is not None and separator[0] in alphabet:
+					raise ValueError('Separator ' + repr(separator) + ' can occur in words of ' + fmt.__class__.__name__)
+		self.words_count = 1
+		for fmt in self.formats:
+			self.words_count *= fmt.get_words_count()
+
+	def split(self, X):
+		"""
+		split(str) -> list
+
+		Splits record into list of words of fields.
+		"""
+		if self.separator:
+			fields = X.split(self.separator)
+			if len(fields) != len(self.formats):
+				raise ValueError('Invalid word ' + X)
+			return fields
+		if len(X) != self.N:
+			raise ValueError('Invalid word ' + X)
+		fields = []
+		start = 0
+		for fmt in self.formats:
+			fields.append(X[start:start + fmt.N])
+			start += fmt.N
+		return fields
+
+	def rank(self, X):
+		"""
+		rank(str) -> int
+
+		Returns integer ordinal of given word in sorted list of all words
+		from regular language. Word can be also given as list of words
+		of fields.
+		"""
+		if isinstance(X, str):
+			X = self.split(X)
+		elif len(X) != len(self.formats):
+			raise ValueError('Invalid number of fields: ' + str(len(X)))
+		c = 0
+		for fmt, field in zip(self.formats, X):
+			c = c * fmt.get_words_count() + fmt.rank(field)
+		return c
+
+	def unrank(self, c):
+		"""
+		unrank(int) -> str
+
+		Returns word with given integer ordinal in sorted list of all
+		words from regular language.
+		"""
+		fields = [None] * len(self.formats)
+		for i in range(len(self.formats) - 1, -1, -1):
+			c, fields[i] = divmod(c, self.formats[i].get_words_count())
+			fields[i] = self.formats[i].unrank(fields[i])
+		return self.separator.join(fields)
+
+	def rank_batch(self, words):
+		"""
+		rank_batch(iterable) -> list
+
+		Returns list of integer ordinals of given words. Every field
+		format ranks its whole column at once.
+		"""
+		records = [self.split(X) if isinstance(X, str) else X for X in words]
+		for record in records:
+			if len(record) != len(self.formats):
+				raise ValueError('Invalid number of fields: ' + str(len(record)))
+		ranks = [0] * len(records)
+		for i, fmt in enumerate(self.formats):
+			count = fmt.get_words_count()
+			column = fmt.rank_batch([record[i] for record in records])
+			ranks = [c * count + r for c, r in zip(ranks, column)]
+		return ranks
+
+	def unrank_batch(self, ranks):
+		"""
+		unrank_batch(iterable) -> list
+
+		Returns list of words with given integer ordinals. Every field
+		format unranks its whole column at once.
+		"""
+		ranks = list(ranks)
+		columns = [None] * len(self.formats)
+		for i in range(len(self.formats) - 1, -1, -1):
+			count = self.formats[i].get_words_count()
+			digits = []
+			for j, c in enumerate(ranks):
+				ranks[j], d = divmod(c, count)
+				digits.append(d)
+			columns[i] = self.formats[i].unrank_batch(digits)
+		return [self.separator.join(fields) for fields in zip(*columns)]
+
+	def _alphabet(self):
+		alphabet = set(self.separator)
+		for fmt in self.formats:
+			field = fmt._alphabet() if isinstance(fmt, FPE_Format) else None
+			if field is None:
+				return None
+			alphabet |= field
+		return alphabet
+
+
+class _TemporalFormat(FPE_Format):
+	# common part of DateFormat and TimestampFormat: rank is number of
+	# steps from min, subclasses define parsing and formatting of words
+
+	def __init__(self, fmt, min, max, step):
+		import datetime
+		import re
+		self._datetime = datetime
+		self.fmt = fmt
+		self.step = step
+		self._iso = (fmt == self._iso_format)
+		self.min = self._parse(min) if isinstance(min, str) else min
+		self.max = self._parse(max) if isinstance(max, str) else max
+		if self.max < self.min:
+			raise ValueError('Invalid range: ' + str(self.min) + ' > ' + str(self.max))
+		# distinct values must have distinct words, otherwise the format
+		# is not a bijection
+		resolution = _temporal_resolution(set(re.findall('%(.)', fmt)), datetime.timedelta)
+		if resolution is None or step % resolution or step <= datetime.timedelta(0):
+			raise ValueError('Step ' + str(step) + ' can not be represented by format ' + fmt)
+		for t in (self.min, self.max):
+			if self._parse(self._format(t)) != t:
+				raise ValueError('Bound ' + str(t) + ' can not be represented by format ' + fmt)
+		self.words_count = (self.max - self.min) // step + 1
+		self.N = None
+		first, last = self.unrank(0), self.unrank(self.words_count - 1)
+		# isoformat() pads years, strftime() does not pad years < 1000 everywhere
+		if len(first) == len(last) and (self._iso or self.min.year >= 1000 and all(d in 'YmdHMSfjy%' for d in re.findall('%(.)', fmt))):
+			self.N = len(first)
+
+	def rank(self, X):
+		"""
+		rank(str) -> int
+
+		Returns integer ordinal of given word in sorted list of all words
+		from regular language
+		"""
+		t = self._parse(X)
+		# strptime() also accepts unpadded fields, only canonical words
+		if t < self.min or t > self.max or (t - self.min) % self.step or self._format(t) != X:
+			raise ValueError('Invalid word ' + X)
+		return (t - self.min) // self.step
+
+	def unrank(self, c):
+		"""
+		unrank(int) -> str
+
+		Returns word with given integer ordinal in sorted list of all
+		words from regular language.
+		"""
+		return self._format(self.min + self.step * c)
+
+	def rank_array(self, values):
+		"""
+		rank_array(numpy.ndarray) -> numpy.ndarray
+
+		Returns int64 array of ordinals of given datetime64 values.
+		Requires NumPy.
+		"""
+		numpy = _optional.numpy()
+		unit = self._numpy_unit
+		offsets = numpy.asarray(values).astype('datetime64[' + unit + ']') - numpy.datetime64(self.min, unit)
+		step = numpy.timedelta64(self.step).astype('timedelta64[' + unit + ']')
+		ranks = offsets // step
+		if ((ranks < 0) | (ranks >= self.words_count) | (offsets % step != numpy.timedelta64(0, unit))).any():
+			raise ValueError('Invalid values out of range ' + str(self.min) + ' - ' + str(self.max))
+		return ranks
+
+	def unrank_array(self, ranks):
+		"""
+		unrank_array(iterable) -> numpy.ndarray
+
+		Returns datetime64 array of values with given ordinals.
+		Requires NumPy.
+		"""
+		numpy = _optional.numpy()
+		unit = self._numpy_unit
+		step = numpy.timedelta64(self.step).astype('timedelta64[' + unit + ']')
+		return numpy.datetime64(self.min, unit) + numpy.asarray(ranks, dtype=numpy.int64) * step
+
+	def rank_batch(self, words):
+		"""
+		rank_batch(iterable) -> list
+
+		Returns list of integer ordinals of given words. Words in ISO
+		format are parsed by NumPy if it is installed.
+		"""
+		words = list(words)
+		numpy = _optional.numpy()
+		if self._iso and numpy is not None and len(words) >= NUMPY_BATCH_THRESHOLD:
+			if self.N is not None and any(len(X) != self.N for X in words):
+				raise ValueError('Invalid words in batch')
+			values = numpy.array(words, dtype='datetime64[' + self._string_unit + ']')
+			if (self._iso_strings(numpy, values) != numpy.array(words)).any():
+				raise ValueError('Invalid words in batch')
+			return self.rank_array(values).tolist()
+		return super(_TemporalFormat, self).rank_batch(words)
+
+	def unrank_batch(self, ranks):
+		"""
+		unrank_batch(iterable) -> list
+
+		Returns list of words with given integer ordinals. Words in ISO
+		format are formatted by NumPy if it is installed.
+		"""
+		ranks = list(ranks)
+		numpy = _optional.numpy()
+		if self._iso and numpy is not None and len(ranks) >= NUMPY_BATCH_THRESHOLD:
+			return self._iso_strings(numpy, self.unrank_array(ranks)).tolist()
+		return super(_TemporalFormat, self).unrank_batch(ranks)
+
+	def _iso_strings(self, numpy, values):
+		words = numpy.datetime_as_string(values, unit=self._string_unit)
+		if self._string_separator != 'T':
+			words = numpy.char.replace(words, 'T', self._string_separator)
+		return words
+
+	def _alphabet(self):
+		import re
+		import string
+		alphabet = set()
+		for directive, literal in re.findall('%(.)|(.)', self.fmt, re.DOTALL):
+			if literal:
+				alphabet.add(literal)
+			elif directive in 'aAbBpZ':
+				alphabet |= set(string.ascii_letters)
+			elif directive == '%':
+				alphabet.add('%')
+			else:
+				alphabet |= set(string.digits + '+-')
+		return alphabet
+
+
+def _temporal_resolution(directives, timedelta):
+	# smallest step fmt with given directives writes unambiguously, None if
+	# words lose the year or the day of year
+	if not directives & set('YyG'):
+		return None
+	if 'j' not in directives and not (directives & set('mbB') and 'd' in directives):
+		return None
+	if 'I' in directives and not directives & set('Hp'):
+		return None
+	resolution = timedelta(days=1)
+	for unit, fields in ((timedelta(hours=1), 'HI'), (timedelta(minutes=1), 'M'), (timedelta(seconds=1), 'S'), (timedelta(microseconds=1), 'f')):
+		if not directives & set(fields):
+			break
+		resolution = unit
+	return resolution
+
+
+class DateFormat(_TemporalFormat):
+	"""
+	DateFormat([fmt[, min[, max[, days]]]]) -> DateFormat object
+
+	Format of calendar dates from min to max (inclusive). Rank of date is
+	number of days since min, so no DFA is needed and only valid dates
+	are ranked.
+
+	Arguments:
+	fmt -- strftime()/strptime() format of words (default '%Y-%m-%d'),
+		must contain the year and the day of year (e.g. %m and %d)
+	min, max -- datetime.date objects or strings in format fmt
+		(default date(1900, 1, 1) and date(2099, 12, 31))
+	days -- distance of consecutive dates in days (default 1)
+
+	Only canonical words (as written by unrank()) are ranked, e.g. not
+	'2020-2-29' for '%Y-%m-%d'.
+	"""
+
+	_iso_format = '%Y-%m-%d'
+	_numpy_unit = 'D'
+	_string_unit = 'D'
+	_string_separator = 'T'
+
+	def __init__(self, fmt='%Y-%m-%d', min=None, max=None, days=1):
+		import datetime
+		if min is None:
+			min = datetime.date(1900, 1, 1)
+		if max is None:
+			max = datetime.date(2099, 12, 31)
+		super(DateFormat, self).__init__(fmt, min, max, datetime.timedelta(days=days))
+
+	def _parse(self, X):
+		if self._iso and len(X) == 10 and X[4] == X[7] == '-':
+			return self._datetime.date(int(X[0:4]), int(X[5:7]), int(X[8:10]))
+		return self._datetime.datetime.strptime(X, self.fmt).date()
+
+	def _format(self, t):
+		if self._iso:
+			return t.isoformat()
+		return t.strftime(self.fmt)
+
+
+class TimestampFormat(_TemporalFormat):
+	"""
+	TimestampFormat([fmt[, min[, max[, seconds]]]]) -> TimestampFormat object
+
+	Format of (naive) timestamps from min to max (inclusive). Rank of
+	timestamp is number of steps since min.
+
+	Arguments:
+	fmt -- strftime()/strptime() format of words
+		(default '%Y-%m-%d %H:%M:%S')
+	min, max -- datetime.datetime objects or strings in format fmt
+		(default datetime(1970, 1, 1) and datetime(2099, 12, 31, 23, 59, 59))
+	seconds -- step between consecutive timestamps in seconds, can be
+		fractional for formats with microseconds (default 1). Steps
+		finer than the smallest field of fmt (e.g. 0.5 without %f)
+		raise ValueError.
+	"""
+
+	_iso_format = '%Y-%m-%d %H:%M:%S'
+	_numpy_unit = 'us'
+	_string_unit = 's'
+	_string_separator = ' '
+
+	def __init__(self, fmt='%Y-%m-%d %H:%M:%S', min=None, max=None, seconds=1):
+		import datetime
+		if min is None:
+			min = datetime.datetime(1970, 1, 1)
+		if max is None:
+			max = datetime.datetime(2099, 12, 31, 23, 59, 59)
+		super(TimestampFormat, self).__init__(fmt, min, max, datetime.timedelta(seconds=seconds))
+
+	def _parse(self, X):
+		if self._iso and len(X) == 19 and X[4] == X[7] == '-' and X[10] == ' ' and X[13] == X[16] == ':':
+			return self._datetime.datetime(int(X[0:4]), int(X[5:7]), int(X[8:10]), int(X[11:13]), int(X[14:16]), int(X[17:19]))
+		return self._datetime.datetime.strptime(X, self.fmt)
+
+	def _format(self, t):
+		if self._iso and not t.microsecond:
+			return t.isoformat(' ')
+		return t.strftime(self.fmt)
+
+
+class IntRangeFormat(FPE_Format):
+	"""
+	IntRangeFormat(min, max[, width]) -> IntRangeFormat object
+
+	Format of decimal integers from min to max (inclusive), e.g. bounded
+	amounts. Rank of number X is X - min.
+
+	Arguments:
+	min, max -- bounds of range
+	width -- optional fixed length of words, numbers are padded by zeros
+
+	Only canonical words (as written by unrank()) are ranked, e.g. not
+	'+05', '5_0' or non-ASCII digits.
+	"""
+
+	def __init__(self, min, max, width=None):
+		if max < min:
+			raise ValueError('Invalid range: ' + str(min) + ' > ' + str(max))
+		self.min = min
+		self.max = max
+		self.N = width
+		self.words_count = max - min + 1
+		if width is not None and (len(str(min)) > width or len(str(max)) > width):
+			raise ValueError('Range does not fit width ' + str(width))
+
+	def rank(self, X):
+		"""
+		rank(str) -> int
+
+		Returns integer ordinal of given word in sorted list of all words
+		from regular language
+		"""
+		v = int(X)
+		# int() also accepts signs, underscores and non-ASCII digits
+		if v < self.min or v > self.max or self.unrank(v - self.min) != X:
+			raise ValueError('Invalid word ' + X)
+		return v - self.min
+
+	def unrank(self, c):
+		"""
+		unrank(int) -> str
+
+		Returns word with given integer ordinal in sorted list of all
+		words from regular language.
+		"""
+		if self.N is None:
+			return str(self.min + c)
+		return '%0*d' % (self.N, self.min + c)
+
+	def _numpy_batch(self, count):
+		numpy = _optional.numpy()
+		if numpy is None or count < NUMPY_BATCH_THRESHOLD:
+			return None
+		if self.min < -2**63 or self.max >= 2**63:
+			return None
+		return numpy
+
+	def rank_batch(self, words):
+		"""
+		rank_batch(iterable) -> list
+
+		Returns list of integer ordinals of given words, parsed by NumPy
+		if it is installed and the range fits into int64.
+		"""
+		words = list(words)
+		numpy = self._numpy_batch(len(words))
+		if numpy is None:
+			return super(IntRangeFormat, self).rank_batch(words)
+		strings = numpy.array(words)
+		values = strings.astype(numpy.int64)
+		invalid = (values < self.min) | (values > self.max)
+		# only canonical words, as written by unrank_batch()
+		invalid |= self._numpy_words(numpy, values) != strings
+		if invalid.any():
+			raise ValueError('Invalid words in batch')
+		return (values - self.min).tolist()
+
+	def unrank_batch(self, ranks):
+		"""
+		unrank_batch(iterable) -> list
+
+		Returns list of words with given integer ordinals, formatted by
+		NumPy if it is installed and the range fits into int64.
+		"""
+		ranks = list(ranks)
+		numpy = self._numpy_batch(len(ranks))
+		if numpy is None:
+			return super(IntRangeFormat, self).unrank_batch(ranks)
+		return self._numpy_words(numpy, numpy.array(ranks, dtype=numpy.int64) + self.min).tolist()
+
+	def _numpy_words(self, numpy, values):
+		words = values.astype(str)
+		if self.N is not None:
+			words = numpy.char.zfill(words, self.N)
+		return words
+
+	def _alphabet(self):
+		return set('0123456789-' if self.min < 0 else '0123456789')
+
+
 class IPv4(FPE_Format):
 	"""
 	Class for IPv4 format.
 	"""
 
 	def __init__(self):
+		# socket and struct are imported only when IP formats are used
+		import socket
+		import struct
 		self.words_count = 2**32
+		self._inet_aton = socket.inet_aton
+		self._inet_ntoa = socket.inet_ntoa
+		self._struct = struct.Struct('!I')
 
 	def rank(self, ipv4):
 		"""
@@ -192,7 +1335,7 @@ class IPv4(FPE_Format):
 		Returns integer ordinal of given word in sorted list of all words
 		from regular language
 		"""
-		return struct.unpack('!I', socket.inet_aton(ipv4))[0]
+		return self._struct.unpack(self._inet_aton(ipv4))[0]
 
 	def unrank(self, c):
 		"""
@@ -201,7 +1344,10 @@ class IPv4(FPE_Format):
 		Returns word with given integer ordinal in sorted list of all
 		words from regular language.
 		"""
-		return socket.inet_ntoa(struct.pack('!I', c))
+		return self._inet_ntoa(self._struct.pack(c))
+
+	def _alphabet(self):
+		return set('0123456789.')
 
 
 class IPv6(FPE_Format):
@@ -210,7 +1356,13 @@ class IPv6(FPE_Format):
 	"""
 
 	def __init__(self):
+		import socket
+		import struct
 		self.words_count = 2**128
+		self._inet_pton = socket.inet_pton
+		self._inet_ntop = socket.inet_ntop
+		self._AF_INET6 = socket.AF_INET6
+		self._struct = struct.Struct('!QQ')
 
 	def rank(self, ipv6):
 		"""
@@ -219,7 +1371,7 @@ class IPv6(FPE_Format):
 		Returns integer ordinal of given word in sorted list of all words
 		from regular language
 		"""
-		h, l = struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, ipv6))
+		h, l = self._struct.unpack(self._inet_pton(self._AF_INET6, ipv6))
 		return (h << 64) | l
 		#return int(binascii.hexlify(socket.inet_pton(socket.AF_INET6, ipv6)), 16)
 
@@ -232,9 +1384,13 @@ class IPv6(FPE_Format):
 		"""
 		h = (c >> 64)
 		l = c ^ (h << 64)
-		return socket.inet_ntop(socket.AF_INET6, struct.pack('!QQ', h, l))
+		return self._inet_ntop(self._AF_INET6, self._struct.pack(h, l))
 		#return socket.inet_ntop(socket.AF_INET6, '{0:016x}'.format(c))
 
+	def _alphabet(self):
+		# IPv4 mapped addresses are written as ::ffff:1.2.3.4
+		return set('0123456789abcdef:.')
+
 
 class LuhnR(FPE_Format):
 	"""
@@ -3,20 +3,23 @@ Python bindings to libFNR from Cisco.
 
 For description of pyFNR see https://github.com/lacike/pyfnr
 For description of libFNR see https://github.com/cisco/libfnr
+
+Shared libraries are loaded on first FNR construction and submodules
+(Util, cache, ...) on first access.
 """
 import ctypes
 import math
 import binascii
 import sys
+import weakref
 
-_libfnr = ctypes.cdll.LoadLibrary('libfnr.so')
-_libssl = ctypes.cdll.LoadLibrary('libssl.so')
+from pyFNR import backends
 
 KEY_SIZE = 32 #bytes
 SALT_SIZE = 32 #bytes
-
-class _FNR_expanded_tweak(ctypes.Structure):
-	_fields_ = [("tweak", ctypes.c_ubyte * 15)] 
+PERMUTATION_CHUNK_SIZE = 4096
+DEDUP_THRESHOLD = 0.5 # unique ratio below which batches are deduplicated
+DEDUP_SAMPLE_SIZE = 4096 # prefix of batch used to estimate unique ratio
 
 class FNR(object):
 	"""
@@ -45,17 +48,35 @@ class FNR(object):
 		PKCS5_PBKDF2_HMAC_SHA1(). Salt should be a ASCII string or bytes
 		withsize of SALT_SIZE bytes. Can be generated by generate_salt()
 		function.
+	backend -- optional name of backend from pyFNR.backends, by
+		default 'ctypes' (libFNR).
+	kdf -- optional key derivation function from pyFNR.kdf, e.g.
+		pyFNR.kdf.PBKDF2('sha256', 100000). Default is
+		PBKDF2-HMAC-SHA1 with 1000 iterations.
+
+	FNR instance can be created from already derived master key with
+	FNR.from_master_key(), which skips key derivation.
+
+	Expanded key is released by close(), at the end of with statement or,
+	for instances which were not closed, when the instance is garbage
+	collected.
+
+	Expanded key and tweak are not modified after construction and every
+	call uses its own buffers, so one instance can be used by several
+	threads at once (also on free-threaded builds). close() must not
+	race with calls in other threads, see pyFNR.pool for shared
+	lifetimes.
 	"""
 
 	_block_size = 32 # bits
 	_block_size_bytes = 4
 	_raw_type = ctypes.c_char * _block_size_bytes
 
-	_fnr_expanded_key = None
-	_fnr_tweak = _FNR_expanded_tweak()
-	#_fnr_tweak = ctypes.create_string_buffer(15)
+	_cipher = None
+	_fnr_tweak = None
+	_finalizer = None
 
-	def __init__(self, key="0000000000000000", tweak="tweak-is-string", block_size=32, salt=""): #block_size: bites
+	def __init__(self, key="0000000000000000", tweak="tweak-is-string", block_size=32, salt="", backend=None, kdf=None): #block_size: bites
 		"""
 		Constructor of FNR class. For parameter description see FNR.__doc__
 		
@@ -66,40 +87,79 @@ class FNR(object):
 		FNR_expanded_tweak from parameter tweak by lib$FNR's
 		FNR_expand_tweak.
 		"""
-		self._block_size = block_size
-		self._block_size_bytes = int(math.ceil(1.0 * self._block_size / 8))
-		self._raw_type = ctypes.c_char*self._block_size_bytes
-		self._hex_format_string = "{0:0" + str(self._block_size_bytes*2) + "x}"
+		backend = backends.get_backend(backend)
+		if kdf is None:
+			from pyFNR.kdf import DEFAULT_KDF
+			kdf = DEFAULT_KDF
 
 		# convert Python3 strings to bytes
 		if (sys.hexversion >= 0x03000000):
 			key = key.encode()
-			tweak = tweak.encode()
 			if (type(salt) == str):
 				salt = salt.encode()
 
-		master_key = ctypes.create_string_buffer(KEY_SIZE)
+		# zero terminated key, zero padded salt
 		raw_key = ctypes.create_string_buffer(key)
 		raw_salt = ctypes.create_string_buffer(salt, SALT_SIZE)
-		raw_tweak = ctypes.create_string_buffer(tweak)
 
-		if (_libssl.PKCS5_PBKDF2_HMAC_SHA1(raw_key, len(raw_key), raw_salt, SALT_SIZE, 1000, KEY_SIZE, master_key) != 1):
-			raise EnvironmentError("call to OpenSSL's PKCS5_PBKDF2_HMAC_SHA1 failed")
+		master_key = kdf.derive(raw_key.raw, raw_salt.raw, KEY_SIZE, backend)
+		self._setup(master_key, tweak, block_size, backend)
+
+	@classmethod
+	def from_master_key(cls, master_key, tweak="tweak-is-string", block_size=32, backend=None):
+		"""
+		FNR.from_master_key(bytes[, tweak[, block_size[, backend]]]) -> FNR object
+
+		Creates FNR instance from already derived master key of KEY_SIZE
+		bytes (e.g. stored in a vault), without key derivation. For other
+		parameters see FNR.__doc__
+		"""
+		master_key = bytes(master_key)
+		if len(master_key) != KEY_SIZE:
+			raise ValueError("Master key must have " + str(KEY_SIZE) + " bytes")
+		fnr = cls.__new__(cls)
+		fnr._setup(master_key, tweak, block_size, backends.get_backend(backend))
+		return fnr
+
+	def _setup(self, master_key, tweak, block_size, backend):
+		if not (1 <= block_size <= backends.MAX_BLOCK_SIZE):
+			raise ValueError("Invalid block size: " + str(block_size))
+		self._backend = backend
+		self._block_size = block_size
+		self._block_size_bytes = int(math.ceil(1.0 * self._block_size / 8))
+		self._raw_type = ctypes.c_char*self._block_size_bytes
+		self._hex_format_string = "{0:0" + str(self._block_size_bytes*2) + "x}"
 
-		_libfnr.FNR_init()
-		self._fnr_expanded_key = _libfnr.FNR_expand_key(master_key, KEY_SIZE*8, self._block_size)
-		if (not self._fnr_expanded_key):
-			raise EnvironmentError("call to fnr_expanded_key failed")
+		if (sys.hexversion >= 0x03000000):
+			tweak = tweak.encode()
+		# zero terminated tweak
+		raw_tweak = ctypes.create_string_buffer(tweak)
 
-		_libfnr.FNR_expand_tweak(ctypes.byref(self._fnr_tweak), self._fnr_expanded_key, raw_tweak, len(raw_tweak))
+		self._cipher = self._backend.new_cipher(master_key, self._block_size)
+		self._fnr_tweak = self._cipher.expand_tweak(raw_tweak.raw)
+		# finalizer must not reference self, only the cipher
+		self._finalizer = weakref.finalize(self, self._cipher.release)
 
 
 	def close(self):
 		"""
 			Releases resources used by libFNR such as FNR_expanded_key.
+			Further operations raise ValueError, closing closed instance
+			does nothing.
 		"""
-		_libfnr.FNR_release_key(self._fnr_expanded_key)
-		_libfnr.FNR_shut()
+		if self._finalizer is not None:
+			self._finalizer()
+		self._cipher = _CLOSED
+
+	@property
+	def closed(self):
+		return self._cipher is _CLOSED
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
 
 	def encrypt_raw(self, plaintext, ciphertext):
 		"""
@@ -114,7 +174,7 @@ class FNR(object):
 		ciphertext -- ctypes.c_char_Array_N object to store the result.
 			N have to be ceil(block_size/8)
 		"""
-		_libfnr.FNR_encrypt(self._fnr_expanded_key, ctypes.byref(self._fnr_tweak), plaintext, ciphertext)
+		self._cipher.encrypt_raw(self._fnr_tweak, plaintext, ciphertext)
 
 	def decrypt_raw(self, ciphertext, plaintext):
 		"""
@@ -129,7 +189,7 @@ class FNR(object):
 		plaintext -- ctypes.c_char_Array_N object to store the result.
 			N have to be ceil(block_size/8)
 		"""
-		_libfnr.FNR_decrypt(self._fnr_expanded_key, ctypes.byref(self._fnr_tweak), ciphertext, plaintext)
+		self._cipher.decrypt_raw(self._fnr_tweak, ciphertext, plaintext)
 
 	
 	def encrypt_bytes(self, plaintext): # plaintext: bytearray
@@ -142,12 +202,7 @@ class FNR(object):
 		plaintext -- bytearray to be encrypted. It should have size
 			at least ceil(block_size/8) bytes 
 		"""
-		raw_plaintext = self._raw_type.from_buffer(plaintext)
-		raw_ciphertext = ctypes.create_string_buffer(self._block_size_bytes)
-
-		_libfnr.FNR_encrypt(self._fnr_expanded_key, ctypes.byref(self._fnr_tweak), raw_plaintext, raw_ciphertext)
-
-		return bytearray(raw_ciphertext.raw)
+		return self._cipher.encrypt_bytes(self._fnr_tweak, plaintext)
 
 	def decrypt_bytes(self, ciphertext): # ciphertext: bytearray
 		"""
@@ -159,12 +214,7 @@ class FNR(object):
 		ciphertext -- bytearray to be decrypted. It should have size
 			at least ceil(block_size/8) bytes 
 		"""
-		raw_plaintext = ctypes.create_string_buffer(self._block_size_bytes)
-		raw_ciphertext = self._raw_type.from_buffer(ciphertext)
-
-		_libfnr.FNR_decrypt(self._fnr_expanded_key, ctypes.byref(self._fnr_tweak), raw_ciphertext, raw_plaintext)
-
-		return bytearray(raw_plaintext.raw)
+		return self._cipher.decrypt_bytes(self._fnr_tweak, ciphertext)
 
 	def encrypt_str(self, plaintext, strip=True):
 		"""
@@ -238,6 +288,99 @@ class FNR(object):
 
 		return self._bytes_to_int(plaintext)
 
+	def encrypt_ints(self, plaintexts):
+		"""
+		encrypt_ints(iterable of ints) -> list of ints
+
+		Encrypts all given unsigned integers with key and tweak determined
+		during initialization. ctypes backend reuses the same buffers for
+		all calls of libFNR's FNR_encrypt().
+
+		plaintexts -- iterable of unsigned ints to be encrypted.
+		"""
+		return self._cipher.encrypt_ints(self._fnr_tweak, list(plaintexts))
+
+	def decrypt_ints(self, ciphertexts):
+		"""
+		decrypt_ints(iterable of ints) -> list of ints
+
+		Decrypts all given unsigned integers with key and tweak determined
+		during initialization. See encrypt_ints().
+
+		ciphertexts -- iterable of unsigned ints to be decrypted.
+		"""
+		return self._cipher.decrypt_ints(self._fnr_tweak, list(ciphertexts))
+
+	def encrypt_array(self, plaintexts):
+		"""
+		encrypt_array(numpy.ndarray) -> numpy.ndarray
+
+		Encrypts all values of given NumPy array of unsigned integers
+		(block size at most 64 bits) and returns uint64 array. Requires
+		NumPy.
+
+		plaintexts -- NumPy array of integers to be encrypted.
+		"""
+		return self._cipher.encrypt_array(self._fnr_tweak, self._check_array(plaintexts))
+
+	def decrypt_array(self, ciphertexts):
+		"""
+		decrypt_array(numpy.ndarray) -> numpy.ndarray
+
+		Decrypts all values of given NumPy array, see encrypt_array().
+
+		ciphertexts -- NumPy array of integers to be decrypted.
+		"""
+		return self._cipher.decrypt_array(self._fnr_tweak, self._check_array(ciphertexts))
+
+	def encrypt_packed(self, plaintexts):
+		"""
+		encrypt_packed(bytes) -> bytearray
+
+		Encrypts concatenated blocks of ceil(block_size/8) bytes (e.g.
+		packed IPv4 or IPv6 addresses) at once, every block exactly as
+		encrypt_bytes() would. Blocks of 8, 16, 32 or 64 bits are
+		enciphered by encrypt_array() if NumPy is available, other blocks
+		by encrypt_ints().
+
+		plaintexts -- bytes-like object with packed blocks.
+		"""
+		return self._packed(plaintexts, self.encrypt_ints, self.encrypt_array)
+
+	def decrypt_packed(self, ciphertexts):
+		"""
+		decrypt_packed(bytes) -> bytearray
+
+		Decrypts concatenated blocks, see encrypt_packed().
+
+		ciphertexts -- bytes-like object with packed blocks.
+		"""
+		return self._packed(ciphertexts, self.decrypt_ints, self.decrypt_array)
+
+	def _packed(self, data, ints, array):
+		size = self._block_size_bytes
+		if len(data) % size:
+			raise ValueError("Length of packed blocks is not a multiple of " + str(size) + ": " + str(len(data)))
+		from pyFNR import _optional
+		numpy = _optional.numpy()
+		if numpy is not None and self._block_size in (8, 16, 32, 64):
+			dtype = '<u' + str(size)
+			return bytearray(array(numpy.frombuffer(bytes(data), dtype=dtype)).astype(dtype).tobytes())
+		values = [self._bytes_to_int(bytearray(data[i:i + size])) for i in range(0, len(data), size)]
+		return bytearray(b''.join(bytes(self._int_to_bytes(v)) for v in ints(values)))
+
+	def _check_array(self, values):
+		from pyFNR import _optional
+		numpy = _optional.numpy()
+		if numpy is None:
+			raise ImportError("encrypt_array() requires NumPy")
+		if self._block_size > 64:
+			raise ValueError("Arrays are supported only for block size <= 64: " + str(self._block_size))
+		values = numpy.asarray(values)
+		if values.dtype.kind not in 'iu':
+			raise ValueError("Array of integers expected: " + str(values.dtype))
+		return values.reshape(-1)
+
 	# conversions str <-> bytearrays, because direct conversion ctypes.c_char_Array_N -> str via .value is not sufficient (problem with leading '\x00')
 	def _str_to_bytes(self, strval):
 		return bytearray([ord(x) for x in strval])
@@ -246,8 +389,9 @@ class FNR(object):
 		return "".join(map(chr, bytesval))
 
 	def _int_to_bytes(self, intval):
-		#if sys.hexversion >= 0x03020000:
-		#	return bytearray(int(intval).to_bytes(self._block_size_bytes, byteorder='little'))
+		if sys.hexversion >= 0x03020000:
+			# limb export without hex strings, int() accepts gmpy2.mpz too
+			return bytearray(int(intval).to_bytes(self._block_size_bytes, byteorder='little'))
 		hexval = self._hex_format_string.format(intval)
 		if sys.hexversion >= 0x02070000:
 			bytesval = bytearray.fromhex(hexval)
@@ -283,13 +427,23 @@ class FNR(object):
 			intval += bytesval[self._block_size_bytes-byte-1]
 		return intval
 
+class _ClosedCipher(object):
+	# replaces cipher of closed FNR, native key must not be used anymore
+
+	def __getattr__(self, name):
+		raise ValueError("Operation on closed FNR instance")
+
+_CLOSED = _ClosedCipher()
+
+
 class FNR2(object):
 	"""
 	FNR2([key[, tweak[, domain[, salt]]]]) -> FNR2 object
 
 	FNR wrapper with cycle walking method for extending FNR enciphering
-	scheme to all size of domains < 2**128, not only for sizes which are
-	powers of two (2**block_size).
+	scheme to all size of domains, not only for sizes which are powers of
+	two (2**block_size). Domains of more than 2**128 elements are
+	enciphered by Feistel network over FNR (see pyFNR.engines).
 
 	Keyword arguments:
 	key -- ASCII string key ("password"). Constructor determines FNR
@@ -312,34 +466,122 @@ class FNR2(object):
 		PKCS5_PBKDF2_HMAC_SHA1(). Salt should be a ASCII string or bytes
 		withsize of SALT_SIZE bytes. Can be generated by generate_salt()
 		function.
+	backend -- optional name of backend from pyFNR.backends.
+	kdf -- optional key derivation function from pyFNR.kdf.
+	cache -- optional bounded cache of plaintext/ciphertext pairs for
+		skewed workloads. Can be pyFNR.cache.LRUCache or
+		pyFNR.cache.ClockCache instance, int with maximal number of
+		entries of a new LRUCache, True for LRUCache of default size or
+		False for no cache. Both encrypt() and decrypt() fill
+		the cache in both directions. A cache instance can be used by
+		one FNR2 instance at a time, see pyFNR.cache. Hit rate
+		statistics are available via cache.stats().
+	engine -- method of extending FNR to the domain, see pyFNR.engines:
+		'cycle-walking' (default), 'feistel', which has fixed cost per
+		value (rounds FNR calls, rarely walked with a bounded number of
+		steps), or 'wide-feistel' (default for domains of more than 128
+		bits).
+	rounds -- optional number of rounds of 'feistel' and 'wide-feistel'
+		engines.
+	dedup -- unique ratio threshold of batches (default DEDUP_THRESHOLD).
+		If unique ratio of the first DEDUP_SAMPLE_SIZE values of a batch
+		is below threshold, batch methods encipher every distinct value
+		only once and scatter results back to all rows. None disables
+		deduplication. Statistics are available via batch_stats().
+
+	Like FNR, one instance can be used by several threads at once,
+	caches lock their maps.
 	"""
 	_fnr = None
+	_engine = None
 	domain = 0
+	cache = None
+	dedup = None
+
+	def __init__(self, key="0000000000000000", tweak="tweak-is-string", domain=2**32-1, salt="", cache=None, backend=None, kdf=None, engine=None, rounds=None, dedup=DEDUP_THRESHOLD): # uses domain [domain]=0..domain
+		engine = self._get_engine(engine, domain)
+		block_size = engine.block_size(domain, rounds)
+		self._setup(FNR(key, tweak, block_size, salt, backend, kdf), domain, cache, engine, rounds, dedup)
+
+	@classmethod
+	def from_master_key(cls, master_key, tweak="tweak-is-string", domain=2**32-1, cache=None, backend=None, engine=None, rounds=None, dedup=DEDUP_THRESHOLD):
+		"""
+		FNR2.from_master_key(bytes[, tweak[, domain[, cache[, backend[, engine[, rounds[, dedup]]]]]]]) -> FNR2 object
 
-	def __init__(self, key="0000000000000000", tweak="tweak-is-string", domain=2**32-1, salt=""): # uses domain [domain]=0..domain
+		Creates FNR2 instance from already derived master key of KEY_SIZE
+		bytes, without key derivation. See FNR.from_master_key().
+		"""
+		engine = cls._get_engine(engine, domain)
+		block_size = engine.block_size(domain, rounds)
+		fnr2 = cls.__new__(cls)
+		fnr2._setup(FNR.from_master_key(master_key, tweak, block_size, backend), domain, cache, engine, rounds, dedup)
+		return fnr2
+
+	@staticmethod
+	def _get_engine(name, domain):
+		from pyFNR import engines
+		if name is None:
+			name = engines.default_engine(domain)
+		return engines.get_engine(name)
+
+	def _setup(self, fnr, domain, cache, engine, rounds, dedup):
 		self.domain = domain
-		block_size = int(math.ceil(math.log(self.domain + 1, 2)))
-		self._fnr = FNR(key, tweak, block_size, salt)
+		self._fnr = fnr
+		self._engine = engine(fnr, domain, rounds)
+		# bool is int, True would be LRUCache(1)
+		if cache is True:
+			from pyFNR.cache import LRUCache
+			cache = LRUCache()
+		elif cache is False:
+			cache = None
+		elif isinstance(cache, int):
+			from pyFNR.cache import LRUCache
+			cache = LRUCache(cache)
+		if cache is not None:
+			cache._bind(self)
+		self.cache = cache
+		self.dedup = dedup
+		# batches, deduplicated batches, rows, enciphered rows
+		self._batch_stats = [0, 0, 0, 0]
 
 	def close(self):
 		"""
-			Releases resources used by libFNR such as FNR_expanded_key.
+			Releases resources used by libFNR such as FNR_expanded_key
+			and clears the cache of plaintext/ciphertext pairs.
 		"""
+		if self.cache is not None:
+			self.cache.clear()
+			self.cache._unbind()
 		self._fnr.close()
 
+	@property
+	def closed(self):
+		return self._fnr.closed
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
 	def encrypt(self, plaintext):
 		"""
 		encrypt(int) -> int
 
 		Encrypts given plaintext using underlaying FNR encryption and
-		cycle walking method.
+		cycle walking method (or other engine).
 
 		plaintext -- unsigned int to be encrypted.
 		"""
-		ciphertext = self._fnr.encrypt_int(plaintext)
-		while (ciphertext > self.domain):
-			ciphertext = self._fnr.encrypt_int(ciphertext)
+		if self.cache is not None:
+			ciphertext = self.cache.get(plaintext)
+			if ciphertext is not None:
+				return ciphertext
 
+		ciphertext = self._engine.encrypt(plaintext)
+
+		if self.cache is not None:
+			self.cache.put(plaintext, ciphertext)
 		return ciphertext
 
 	def decrypt(self, ciphertext):
@@ -347,23 +589,247 @@ class FNR2(object):
 		decrypt(int) -> int
 
 		Decrypts given ciphertext using underlaying FNR decryption and
-		cycle walking method.
+		cycle walking method (or other engine).
 
 		ciphertext -- unsigned int to be decrypted.
 		"""
-		plaintext = self._fnr.decrypt_int(ciphertext)
-		while (plaintext > self.domain):
-			plaintext = self._fnr.decrypt_int(plaintext)
+		if self.cache is not None:
+			plaintext = self.cache.get_inverse(ciphertext)
+			if plaintext is not None:
+				return plaintext
+
+		plaintext = self._engine.decrypt(ciphertext)
 
+		if self.cache is not None:
+			self.cache.put(plaintext, ciphertext)
 		return plaintext
 
+	def encrypt_batch(self, plaintexts):
+		"""
+		encrypt_batch(iterable of ints) -> list of ints
+
+		Encrypts all given plaintexts using batch path of underlaying FNR
+		encryption. Cycle walking continues only with values which are
+		still out of domain, feistel engine enciphers whole batch round
+		by round. Batches with many repeated values are
+		deduplicated, see dedup.
+
+		plaintexts -- iterable of unsigned ints to be encrypted.
+		"""
+		return self._deduplicated(list(plaintexts), lambda values: self._batch(values, False, self.cache))
+
+	def decrypt_batch(self, ciphertexts):
+		"""
+		decrypt_batch(iterable of ints) -> list of ints
+
+		Decrypts all given ciphertexts using batch path of underlaying FNR
+		decryption. See encrypt_batch().
+
+		ciphertexts -- iterable of unsigned ints to be decrypted.
+		"""
+		return self._deduplicated(list(ciphertexts), lambda values: self._batch(values, True, self.cache))
+
+	def encrypt_array(self, plaintexts):
+		"""
+		encrypt_array(numpy.ndarray) -> numpy.ndarray
+
+		Encrypts all values of given NumPy integer array (domain < 2**64)
+		and returns uint64 array. Values stay in NumPy arrays during cycle
+		walking, cache is not used. Requires NumPy.
+
+		plaintexts -- NumPy array of ints from 0..domain.
+		"""
+		return self._deduplicated_array(self._check_array(plaintexts), self._engine.encrypt_array)
+
+	def decrypt_array(self, ciphertexts):
+		"""
+		decrypt_array(numpy.ndarray) -> numpy.ndarray
+
+		Decrypts all values of given NumPy integer array, see
+		encrypt_array().
+
+		ciphertexts -- NumPy array of ints from 0..domain.
+		"""
+		return self._deduplicated_array(self._check_array(ciphertexts), self._engine.decrypt_array)
+
+	def _check_array(self, values):
+		from pyFNR import _optional
+		numpy = _optional.numpy()
+		if numpy is None:
+			raise ImportError("encrypt_array() requires NumPy")
+		if self.domain >= 2**64:
+			raise ValueError("Arrays are supported only for domains < 2**64")
+		values = numpy.asarray(values)
+		if values.dtype.kind not in 'iu':
+			raise ValueError("Array of integers expected: " + str(values.dtype))
+		values = values.reshape(-1)
+		if len(values) and (values.min() < 0 or values.max() > self.domain):
+			raise ValueError("Values out of domain 0.." + str(self.domain))
+		return values
+
+	def encrypt_words(self, fmt, words):
+		"""
+		encrypt_words(FPE_Format, iterable of str) -> list of str
+
+		Encrypts all given words of format fmt (rank-then-encipher [2])
+		using batch paths of format and encryption. Domain should be
+		fmt.get_words_count() - 1. Repeated words are ranked, enciphered
+		and unranked only once if batch is deduplicated, see dedup.
+
+		fmt -- format from pyFNR.Util, e.g. ECV or DateFormat.
+		words -- iterable of words from fmt.
+		"""
+		return self._deduplicated(list(words), lambda words: fmt.unrank_batch(self._batch(fmt.rank_batch(words), False, self.cache)))
+
+	def decrypt_words(self, fmt, words):
+		"""
+		decrypt_words(FPE_Format, iterable of str) -> list of str
+
+		Decrypts all given words of format fmt, see encrypt_words().
+		"""
+		return self._deduplicated(list(words), lambda words: fmt.unrank_batch(self._batch(fmt.rank_batch(words), True, self.cache)))
+
+	def permutation(self, start=0, stop=None, chunk_size=PERMUTATION_CHUNK_SIZE):
+		"""
+		permutation([start[, stop[, chunk_size]]]) -> generator of ints
+
+		Lazily yields encrypt(i) for i in range(start, stop), i.e. part of
+		pseudorandom permutation of domain 0..domain, which can be used for
+		shuffling of datasets too large for random.shuffle(). Values are
+		enciphered in chunks by the batch path, cache is not used.
+
+		Permutation is stateless: iteration can start at any position
+		(seek) and disjoint ranges from shard_range() can be iterated by
+		parallel workers. Position of given value in the permutation is
+		returned by position().
+
+		start -- first position, default is 0.
+		stop -- position after the last one, default is domain + 1.
+		chunk_size -- number of values enciphered at once.
+		"""
+		if stop is None:
+			stop = self.domain + 1
+		for chunk_start in range(start, stop, chunk_size):
+			chunk = range(chunk_start, min(chunk_start + chunk_size, stop))
+			for value in self._engine.encrypt_batch(list(chunk)):
+				yield value
+
+	def shard_range(self, shard, shards, start=0, stop=None):
+		"""
+		shard_range(int, int[, start[, stop]]) -> (int, int)
+
+		Splits positions range(start, stop) of permutation into given
+		number of disjoint contiguous shards of (almost) equal size and
+		returns (start, stop) of shard with given index, so that
+		permutation(*shard_range(k, n)) for k in range(n) together yield
+		the whole permutation exactly once.
+		"""
+		if not (0 <= shard < shards):
+			raise ValueError("Invalid shard index: " + str(shard))
+		if stop is None:
+			stop = self.domain + 1
+		size = stop - start
+		return (start + size * shard // shards, start + size * (shard + 1) // shards)
+
+	def position(self, value):
+		"""
+		position(int) -> int
+
+		Inverse lookup for permutation(): returns index i such that
+		encrypt(i) == value.
+		"""
+		return self.decrypt(value)
+
+	def batch_stats(self):
+		"""
+		batch_stats() -> dict
+
+		Returns statistics of batch methods: number of batches and
+		deduplicated batches, number of rows and rows actually enciphered
+		(distinct values of deduplicated batches) and unique_ratio of
+		enciphered rows to all rows. Counters are updated without locking,
+		so they are approximate for batches of concurrent threads.
+		"""
+		return _batch_report(self._batch_stats)
+
+	def _use_dedup(self, sample_unique, sample_size):
+		return self.dedup is not None and sample_size > 1 and sample_unique < self.dedup * sample_size
+
+	def _deduplicated(self, values, operation, stats=None):
+		# factorizes values into distinct values and codes of rows, counted
+		# in stats (default batch_stats() of this instance)
+		if stats is None:
+			stats = self._batch_stats
+		stats[0] += 1
+		stats[2] += len(values)
+		sample = values[:DEDUP_SAMPLE_SIZE]
+		if not self._use_dedup(len(set(sample)), len(sample)):
+			stats[3] += len(values)
+			return operation(values)
+		index = {}
+		codes = [index.setdefault(value, len(index)) for value in values]
+		stats[1] += 1
+		stats[3] += len(index)
+		results = operation(list(index))
+		return [results[code] for code in codes]
+
+	def _deduplicated_array(self, values, operation, stats=None):
+		from pyFNR import _optional
+		numpy = _optional.numpy()
+		if stats is None:
+			stats = self._batch_stats
+		stats[0] += 1
+		stats[2] += len(values)
+		sample = values[:DEDUP_SAMPLE_SIZE]
+		if not self._use_dedup(len(numpy.unique(sample)), len(sample)):
+			stats[3] += len(values)
+			return operation(values)
+		uniques, codes = numpy.unique(values, return_inverse=True)
+		stats[1] += 1
+		stats[3] += len(uniques)
+		return operation(uniques)[codes.reshape(-1)]
+
+	def _batch(self, values, inverse, cache):
+		operation = self._engine.decrypt_batch if inverse else self._engine.encrypt_batch
+		if cache is None:
+			return operation(values)
+		lookup = cache.get_inverse if inverse else cache.get
+		results = [lookup(value) for value in values]
+		pending = [i for i, result in enumerate(results) if result is None]
+		if pending:
+			for i, result in zip(pending, operation([values[i] for i in pending])):
+				results[i] = result
+		for value, result in zip(values, results):
+			if inverse:
+				cache.put(result, value)
+			else:
+				cache.put(value, result)
+		return results
+
+def _batch_report(stats):
+	# batch_stats() dictionary of counters [batches, deduplicated, rows, enciphered]
+	batches, deduplicated, rows, enciphered = stats
+	return {
+		'batches': batches,
+		'deduplicated_batches': deduplicated,
+		'rows': rows,
+		'enciphered_rows': enciphered,
+		'unique_ratio': (1.0 * enciphered / rows) if rows else 1.0,
+	}
+
 def generate_salt():
 	"""
 	generate_salt() -> str
 
 	Generates salt of SALT_SIZE size using OpenSSL's RAND_bytes().
 	"""
-	salt = ctypes.create_string_buffer(SALT_SIZE)
-	if (_libssl.RAND_bytes(salt, SALT_SIZE) != 1 ):
-		raise EnvironmentError("call to OpenSSL's RAND_bytes failed")
-	return salt.raw
+	return backends.get_backend().random_bytes(SALT_SIZE)
+
+_lazy_submodules = ('Util', 'arrow', 'cache', 'codegen', 'engines', 'kdf', 'metrics', 'pandas', 'pool', 'rekey', 'shared', 'tools')
+
+def __getattr__(name):
+	# import submodules on first access of pyFNR.<submodule> (Python 3.7+)
+	if name in _lazy_submodules:
+		import importlib
+		return importlib.import_module('pyFNR.' + name)
+	raise AttributeError("module 'pyFNR' has no attribute " + repr(name))
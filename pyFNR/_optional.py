@@ -0,0 +1,35 @@
+"""
+Lazy imports of optional dependencies.
+
+Optional modules are imported on first use, so that `import pyFNR` stays
+cheap, and missing modules are reported as None.
+"""
+import importlib
+
+_modules = {}
+
+def load(name):
+	"""
+	load(str) -> module or None
+
+	Imports module with given name on first call and returns it, or
+	returns None if the module is not installed.
+	"""
+	if name not in _modules:
+		try:
+			_modules[name] = importlib.import_module(name)
+		except ImportError:
+			_modules[name] = None
+	return _modules[name]
+
+def numpy():
+	"""
+	numpy() -> numpy module or None
+	"""
+	return load('numpy')
+
+def gmpy2():
+	"""
+	gmpy2() -> gmpy2 module or None
+	"""
+	return load('gmpy2')
@@ -0,0 +1,72 @@
+"""
+Apache Arrow integration: encryption of whole Arrow columns.
+
+	import pyFNR.arrow
+	encrypted = pyFNR.arrow.encrypt(fnr2, table.column('id'))
+	plates = pyFNR.arrow.encrypt(fnr2, table.column('plate'), pyFNR.Util.ECV())
+
+Integer arrays are read through their value buffers without copying and
+enciphered by FNR2.encrypt_array(). String arrays of a format are
+dictionary encoded, so every distinct word is ranked, enciphered and
+unranked once (arrays with dictionary type keep it and only their
+dictionary is enciphered). Nulls stay null and chunked arrays are
+enciphered chunk by chunk. Requires pyarrow and NumPy.
+"""
+from pyFNR import _optional
+
+def encrypt(fnr2, array, fmt=None):
+	"""
+	encrypt(FNR2, pyarrow.Array[, fmt]) -> pyarrow.Array
+
+	Encrypts all values of given Array or ChunkedArray. Integer values
+	are encrypted directly, strings are words of format fmt.
+	"""
+	return _operate(fnr2, array, fmt, False)
+
+def decrypt(fnr2, array, fmt=None):
+	"""
+	decrypt(FNR2, pyarrow.Array[, fmt]) -> pyarrow.Array
+
+	Decrypts all values of given Array or ChunkedArray, see encrypt().
+	"""
+	return _operate(fnr2, array, fmt, True)
+
+def _operate(fnr2, array, fmt, inverse):
+	pyarrow = _optional.load('pyarrow')
+	if pyarrow is None:
+		raise ImportError("pyFNR.arrow requires pyarrow")
+	if isinstance(array, pyarrow.ChunkedArray):
+		chunks = [_operate(fnr2, chunk, fmt, inverse) for chunk in array.chunks]
+		return pyarrow.chunked_array(chunks, type=array.type)
+	if fmt is not None:
+		return _operate_words(pyarrow, fnr2, array, fmt, inverse)
+	if pyarrow.types.is_integer(array.type):
+		return _operate_ints(pyarrow, fnr2, array, inverse)
+	raise ValueError("Format is needed for column of type " + str(array.type))
+
+def _operate_ints(pyarrow, fnr2, array, inverse):
+	numpy = _optional.numpy()
+	dtype = numpy.dtype(array.type.to_pandas_dtype())
+	if fnr2.domain > numpy.iinfo(dtype).max:
+		raise ValueError("Domain does not fit column type " + str(array.type))
+	# zero-copy view of the value buffer
+	values = numpy.frombuffer(array.buffers()[1], dtype=dtype, count=len(array), offset=array.offset * dtype.itemsize)
+	mask = None
+	if array.null_count:
+		# values under nulls are undefined, encipher zeros instead
+		mask = numpy.asarray(array.is_null().to_numpy(zero_copy_only=False))
+		values = numpy.where(mask, 0, values)
+	operation = fnr2.decrypt_array if inverse else fnr2.encrypt_array
+	result = operation(values).astype(dtype)
+	return pyarrow.array(result, type=array.type, mask=mask)
+
+def _operate_words(pyarrow, fnr2, array, fmt, inverse):
+	if pyarrow.types.is_dictionary(array.type):
+		encoded = array
+	else:
+		encoded = array.dictionary_encode()
+	operation = fnr2.decrypt_words if inverse else fnr2.encrypt_words
+	dictionary = pyarrow.array(operation(fmt, encoded.dictionary.to_pylist()), type=encoded.dictionary.type)
+	if encoded is array:
+		return pyarrow.DictionaryArray.from_arrays(array.indices, dictionary)
+	return dictionary.take(encoded.indices)
@@ -0,0 +1,287 @@
+"""
+Cipher backends for pyFNR.
+
+Backend provides key derivation, random bytes and ciphers for given
+expanded key and block size. Built-in backend ctypes binds libFNR and
+OpenSSL shared libraries, other backends can be added by
+register_backend() and selected by set_default_backend() or environment
+variable PYFNR_BACKEND.
+
+get_backend() without arguments returns ctypes backend and raises
+OSError if libFNR can not be loaded. Shared libraries are loaded on
+first use, not on import.
+
+Paths to shared libraries can be configured with set_library_paths() or
+environment variables PYFNR_LIBFNR and PYFNR_LIBCRYPTO. Otherwise they
+are resolved by ctypes.util.find_library().
+
+Backends and ciphers can be shared by threads (also on free-threaded
+builds): ciphers keep no state between calls besides the expanded key,
+lazily built tables are published at once and FNR_init()/FNR_shut() of
+libFNR are reference counted under a lock. Module state is private to
+every interpreter, libFNR is not, so sub-interpreters never call
+FNR_shut().
+"""
+import ctypes
+import os
+import threading
+
+from pyFNR import _optional
+
+TWEAK_SIZE = 15 # bytes of libFNR's fnr_expanded_tweak
+MAX_BLOCK_SIZE = 128 # bits
+
+# guards backend instances and reference counts of libFNR initialization
+_lock = threading.Lock()
+# handle of libFNR -> number of expanded keys
+_native_users = {}
+
+
+class _FNR_expanded_tweak(ctypes.Structure):
+	_fields_ = [("tweak", ctypes.c_ubyte * TWEAK_SIZE)]
+
+
+_library_paths = {
+	'fnr': os.environ.get('PYFNR_LIBFNR'),
+	'crypto': os.environ.get('PYFNR_LIBCRYPTO'),
+}
+
+def set_library_paths(libfnr=None, libcrypto=None):
+	"""
+	set_library_paths([libfnr[, libcrypto]])
+
+	Sets paths to libFNR and OpenSSL's libcrypto (or libssl) shared
+	libraries used by ctypes backend created after this call.
+	"""
+	if libfnr is not None:
+		_library_paths['fnr'] = libfnr
+	if libcrypto is not None:
+		_library_paths['crypto'] = libcrypto
+	global _default
+	with _lock:
+		_backends.pop('ctypes', None)
+		_default = None
+
+def _find_library(names, fallback):
+	# ctypes.util imports subprocess, so it is imported only when needed
+	import ctypes.util
+	for name in names:
+		path = ctypes.util.find_library(name)
+		if path is not None:
+			return path
+	return fallback
+
+
+class CtypesBackend(object):
+	"""
+	Backend with bindings to libFNR and OpenSSL shared libraries.
+	Raises OSError if libraries can not be loaded.
+	"""
+
+	name = 'ctypes'
+
+	def __init__(self):
+		libfnr = _library_paths['fnr'] or _find_library(['fnr'], 'libfnr.so')
+		libcrypto = _library_paths['crypto'] or _find_library(['crypto', 'ssl'], 'libssl.so')
+		self.libfnr = ctypes.cdll.LoadLibrary(libfnr)
+		self.libssl = ctypes.cdll.LoadLibrary(libcrypto)
+
+	def pbkdf2_hmac(self, hash_name, password, salt, iterations, size):
+		"""
+		pbkdf2_hmac(str, bytes, bytes, int, int) -> bytes
+
+		Derives key of given size using OpenSSL's PKCS5_PBKDF2_HMAC()
+		with EVP digest of given name.
+		"""
+		derived_key = ctypes.create_string_buffer(size)
+		if hash_name == 'sha1':
+			result = self.libssl.PKCS5_PBKDF2_HMAC_SHA1(password, len(password), salt, len(salt), iterations, size, derived_key)
+		else:
+			self.libssl.EVP_get_digestbyname.restype = ctypes.c_void_p
+			digest = self.libssl.EVP_get_digestbyname(hash_name.encode())
+			if not digest:
+				raise ValueError("Unknown digest: " + str(hash_name))
+			result = self.libssl.PKCS5_PBKDF2_HMAC(password, len(password), salt, len(salt), iterations, ctypes.c_void_p(digest), size, derived_key)
+		if (result != 1):
+			raise EnvironmentError("call to OpenSSL's PKCS5_PBKDF2_HMAC failed")
+		return derived_key.raw
+
+	def random_bytes(self, size):
+		"""
+		random_bytes(int) -> bytes
+
+		Generates random bytes using OpenSSL's RAND_bytes().
+		"""
+		buf = ctypes.create_string_buffer(size)
+		if (self.libssl.RAND_bytes(buf, size) != 1):
+			raise EnvironmentError("call to OpenSSL's RAND_bytes failed")
+		return buf.raw
+
+	def new_cipher(self, master_key, block_size):
+		"""
+		new_cipher(bytes, int) -> cipher
+
+		Returns cipher for given master key and block size in bits.
+		"""
+		return _CtypesCipher(self, master_key, block_size)
+
+	def _init(self):
+		# FNR_init() before the first key, FNR_shut() after the last one;
+		# counted per library, backends of one library share its state
+		with _lock:
+			users = _native_users.get(self.libfnr._handle, 0)
+			if users == 0:
+				self.libfnr.FNR_init()
+			_native_users[self.libfnr._handle] = users + 1
+
+	def _shut(self):
+		with _lock:
+			users = _native_users[self.libfnr._handle] - 1
+			_native_users[self.libfnr._handle] = users
+			if users == 0 and _is_main_interpreter():
+				self.libfnr.FNR_shut()
+
+
+def _is_main_interpreter():
+	# other interpreters may still use libFNR initialized by this process
+	for name in ('_interpreters', '_xxsubinterpreters'):
+		module = _optional.load(name)
+		if module is not None:
+			current, main = module.get_current(), module.get_main()
+			# Python 3.13+ returns (id, whence)
+			if isinstance(current, tuple):
+				current, main = current[0], main[0]
+			return int(current) == int(main)
+	return True
+
+
+class _CtypesCipher(object):
+
+	_expanded_key = None
+
+	def __init__(self, backend, master_key, block_size):
+		self._backend = backend
+		self._libfnr = libfnr = backend.libfnr
+		self._block_size_bytes = (block_size + 7) // 8
+		self._raw_type = ctypes.c_char * self._block_size_bytes
+		backend._init()
+		self._expanded_key = libfnr.FNR_expand_key(master_key, len(master_key)*8, block_size)
+		if (not self._expanded_key):
+			backend._shut()
+			raise EnvironmentError("call to fnr_expanded_key failed")
+
+	def release(self):
+		if self._expanded_key is None:
+			return
+		self._libfnr.FNR_release_key(self._expanded_key)
+		self._expanded_key = None
+		self._backend._shut()
+
+	def expand_tweak(self, tweak):
+		expanded_tweak = _FNR_expanded_tweak()
+		self._libfnr.FNR_expand_tweak(ctypes.byref(expanded_tweak), self._expanded_key, tweak, len(tweak))
+		return expanded_tweak
+
+	def encrypt_raw(self, tweak, plaintext, ciphertext):
+		self._libfnr.FNR_encrypt(self._expanded_key, ctypes.byref(tweak), plaintext, ciphertext)
+
+	def decrypt_raw(self, tweak, ciphertext, plaintext):
+		self._libfnr.FNR_decrypt(self._expanded_key, ctypes.byref(tweak), ciphertext, plaintext)
+
+	def encrypt_bytes(self, tweak, plaintext):
+		raw_plaintext = self._raw_type.from_buffer(plaintext)
+		raw_ciphertext = ctypes.create_string_buffer(self._block_size_bytes)
+		self._libfnr.FNR_encrypt(self._expanded_key, ctypes.byref(tweak), raw_plaintext, raw_ciphertext)
+		return bytearray(raw_ciphertext.raw)
+
+	def decrypt_bytes(self, tweak, ciphertext):
+		raw_plaintext = ctypes.create_string_buffer(self._block_size_bytes)
+		raw_ciphertext = self._raw_type.from_buffer(ciphertext)
+		self._libfnr.FNR_decrypt(self._expanded_key, ctypes.byref(tweak), raw_ciphertext, raw_plaintext)
+		return bytearray(raw_plaintext.raw)
+
+	def encrypt_ints(self, tweak, ints):
+		return self._operate_ints(self._libfnr.FNR_encrypt, tweak, ints)
+
+	def decrypt_ints(self, tweak, ints):
+		return self._operate_ints(self._libfnr.FNR_decrypt, tweak, ints)
+
+	def encrypt_array(self, tweak, values):
+		numpy = _optional.numpy()
+		return numpy.array(self.encrypt_ints(tweak, values.tolist()), dtype=numpy.uint64)
+
+	def decrypt_array(self, tweak, values):
+		numpy = _optional.numpy()
+		return numpy.array(self.decrypt_ints(tweak, values.tolist()), dtype=numpy.uint64)
+
+	def _operate_ints(self, operation, tweak, ints):
+		# reuse the same buffers for the whole batch
+		size = self._block_size_bytes
+		raw_in = ctypes.create_string_buffer(size)
+		raw_out = ctypes.create_string_buffer(size)
+		key = self._expanded_key
+		tweak_ref = ctypes.byref(tweak)
+		result = []
+		for intval in ints:
+			raw_in.raw = intval.to_bytes(size, 'little')
+			operation(key, tweak_ref, raw_in, raw_out)
+			result.append(int.from_bytes(raw_out.raw, 'little'))
+		return result
+
+
+_backend_classes = {'ctypes': CtypesBackend}
+_backends = {}
+_default = None
+_default_name = os.environ.get('PYFNR_BACKEND') or 'ctypes'
+
+def _set_default():
+	global _default
+	default = get_backend(_default_name)
+	with _lock:
+		if _default is None:
+			_default = default
+
+def set_default_backend(name):
+	"""
+	set_default_backend(str or None)
+
+	Selects backend returned by get_backend() without arguments (and used
+	by FNR without backend argument), None restores ctypes backend.
+	"""
+	global _default, _default_name
+	if name is not None and name not in _backend_classes:
+		raise ValueError("Unknown backend: " + str(name))
+	with _lock:
+		_default_name = name or 'ctypes'
+		_default = None
+
+def register_backend(name, backend_class):
+	"""
+	register_backend(str, class)
+
+	Registers custom backend class under given name.
+	"""
+	_backend_classes[name] = backend_class
+
+def get_backend(name=None):
+	"""
+	get_backend([name]) -> backend
+
+	Returns (shared) instance of backend with given name. If name is None,
+	returns default backend (ctypes unless set_default_backend() or
+	PYFNR_BACKEND selects other one), raises OSError if it can not be
+	loaded.
+	"""
+	if name is None:
+		if _default is None:
+			_set_default()
+		return _default
+	backend = _backends.get(name)
+	if backend is None:
+		if name not in _backend_classes:
+			raise ValueError("Unknown backend: " + str(name))
+		# concurrent first calls may construct more instances, one is kept
+		backend = _backend_classes[name]()
+		with _lock:
+			backend = _backends.setdefault(name, backend)
+	return backend
@@ -0,0 +1,275 @@
+"""
+Bounded memoizing caches for FNR2.
+
+Both caches keep separate forward (plaintext -> ciphertext) and inverse
+(ciphertext -> plaintext) maps, which are filled at once, so a value
+enciphered once can be deciphered from the cache too and vice versa.
+Memory usage is bounded by max_entries pairs. Every lookup and update
+holds a lock of the cache, so one cache can be shared by threads.
+
+Pairs are not keyed by key, tweak or domain, so a cache serves a single
+FNR2 instance: passing it to another instance raises ValueError until
+the first one is closed (or garbage collected).
+"""
+
+import collections
+import threading
+import weakref
+
+class _CacheStats(object):
+	"""
+	Hit/miss counters and owner shared by LRUCache and ClockCache.
+	"""
+
+	_owner = None
+
+	def _bind(self, owner):
+		# called by FNR2, pairs of another instance would be wrong ciphertexts
+		with self._lock:
+			bound = self._owner() if self._owner is not None else None
+			if bound is owner:
+				return
+			if bound is not None:
+				raise ValueError("Cache is already used by another FNR2 instance")
+			# previous owner was collected without close()
+			stale = self._owner is not None
+			self._owner = weakref.ref(owner)
+		if stale:
+			self.clear()
+
+	def _unbind(self):
+		self._owner = None
+
+	def _reset_stats(self):
+		self.hits = 0
+		self.misses = 0
+		self.inverse_hits = 0
+		self.inverse_misses = 0
+		self.evictions = 0
+
+	def hit_rate(self):
+		"""
+		hit_rate() -> float
+
+		Returns ratio of successful lookups (in both directions) to all
+		lookups, or 0.0 if there was no lookup yet.
+		"""
+		lookups = self.hits + self.misses + self.inverse_hits + self.inverse_misses
+		if lookups == 0:
+			return 0.0
+		return 1.0 * (self.hits + self.inverse_hits) / lookups
+
+	def stats(self):
+		"""
+		stats() -> dict
+
+		Returns dictionary with counters of this cache: hits, misses,
+		inverse_hits, inverse_misses, evictions, entries, max_entries
+		and hit_rate.
+		"""
+		return {
+			'hits': self.hits,
+			'misses': self.misses,
+			'inverse_hits': self.inverse_hits,
+			'inverse_misses': self.inverse_misses,
+			'evictions': self.evictions,
+			'entries': len(self),
+			'max_entries': self.max_entries,
+			'hit_rate': self.hit_rate(),
+		}
+
+
+class LRUCache(_CacheStats):
+	"""
+	LRUCache([max_entries]) -> LRUCache object
+
+	Bounded cache of plaintext/ciphertext pairs with least recently used
+	eviction policy. Lookup in either direction marks the pair as
+	recently used.
+
+	Keyword arguments:
+	max_entries -- maximal number of stored pairs.
+	"""
+
+	def __init__(self, max_entries=4096):
+		if max_entries < 1:
+			raise ValueError("max_entries must be positive: " + str(max_entries))
+		self.max_entries = max_entries
+		self._forward = collections.OrderedDict()
+		self._inverse = {}
+		self._lock = threading.Lock()
+		self._reset_stats()
+
+	def __len__(self):
+		return len(self._forward)
+
+	def get(self, plaintext):
+		"""
+		get(int) -> int or None
+
+		Returns cached ciphertext for given plaintext or None.
+		"""
+		with self._lock:
+			ciphertext = self._forward.get(plaintext)
+			if ciphertext is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+			self._touch(plaintext, ciphertext)
+			return ciphertext
+
+	def get_inverse(self, ciphertext):
+		"""
+		get_inverse(int) -> int or None
+
+		Returns cached plaintext for given ciphertext or None.
+		"""
+		with self._lock:
+			plaintext = self._inverse.get(ciphertext)
+			if plaintext is None:
+				self.inverse_misses += 1
+				return None
+			self.inverse_hits += 1
+			self._touch(plaintext, ciphertext)
+			return plaintext
+
+	def put(self, plaintext, ciphertext):
+		"""
+		put(int, int)
+
+		Stores pair plaintext/ciphertext into both maps, evicting least
+		recently used pair if the cache is full.
+		"""
+		with self._lock:
+			if plaintext in self._forward:
+				self._touch(plaintext, ciphertext)
+				return
+			if len(self._forward) >= self.max_entries:
+				old_plaintext, old_ciphertext = self._forward.popitem(last=False)
+				del self._inverse[old_ciphertext]
+				self.evictions += 1
+			self._forward[plaintext] = ciphertext
+			self._inverse[ciphertext] = plaintext
+
+	def clear(self):
+		"""
+		Removes all stored pairs and resets counters.
+
+		Python ints are immutable, so their memory can not be overwritten,
+		but the cache drops every reference to stored pairs.
+		"""
+		with self._lock:
+			while self._forward:
+				self._forward.popitem()
+			self._inverse.clear()
+			self._reset_stats()
+
+	def _touch(self, plaintext, ciphertext):
+		# move pair to the most recently used end
+		del self._forward[plaintext]
+		self._forward[plaintext] = ciphertext
+
+
+class ClockCache(_CacheStats):
+	"""
+	ClockCache([max_entries]) -> ClockCache object
+
+	Bounded cache of plaintext/ciphertext pairs with CLOCK (second
+	chance) eviction policy. Unlike LRUCache, a hit only sets a reference
+	bit, so lookups are cheaper under heavy skew.
+
+	Keyword arguments:
+	max_entries -- maximal number of stored pairs.
+	"""
+
+	def __init__(self, max_entries=4096):
+		if max_entries < 1:
+			raise ValueError("max_entries must be positive: " + str(max_entries))
+		self.max_entries = max_entries
+		self._plaintexts = [None] * max_entries
+		self._ciphertexts = [None] * max_entries
+		self._referenced = bytearray(max_entries)
+		self._forward = {} # plaintext -> slot
+		self._inverse = {} # ciphertext -> slot
+		self._hand = 0
+		self._lock = threading.Lock()
+		self._reset_stats()
+
+	def __len__(self):
+		return len(self._forward)
+
+	def get(self, plaintext):
+		"""
+		get(int) -> int or None
+
+		Returns cached ciphertext for given plaintext or None.
+		"""
+		with self._lock:
+			slot = self._forward.get(plaintext)
+			if slot is None:
+				self.misses += 1
+				return None
+			self.hits += 1
+			self._referenced[slot] = 1
+			return self._ciphertexts[slot]
+
+	def get_inverse(self, ciphertext):
+		"""
+		get_inverse(int) -> int or None
+
+		Returns cached plaintext for given ciphertext or None.
+		"""
+		with self._lock:
+			slot = self._inverse.get(ciphertext)
+			if slot is None:
+				self.inverse_misses += 1
+				return None
+			self.inverse_hits += 1
+			self._referenced[slot] = 1
+			return self._plaintexts[slot]
+
+	def put(self, plaintext, ciphertext):
+		"""
+		put(int, int)
+
+		Stores pair plaintext/ciphertext into both maps, evicting the first
+		pair without reference bit under the clock hand if the cache is full.
+		"""
+		with self._lock:
+			if plaintext in self._forward:
+				self._referenced[self._forward[plaintext]] = 1
+				return
+			if len(self._forward) < self.max_entries:
+				slot = len(self._forward)
+			else:
+				while self._referenced[self._hand]:
+					self._referenced[self._hand] = 0
+					self._hand = (self._hand + 1) % self.max_entries
+				slot = self._hand
+				self._hand = (self._hand + 1) % self.max_entries
+				del self._forward[self._plaintexts[slot]]
+				del self._inverse[self._ciphertexts[slot]]
+				self.evictions += 1
+			self._plaintexts[slot] = plaintext
+			self._ciphertexts[slot] = ciphertext
+			self._referenced[slot] = 0
+			self._forward[plaintext] = slot
+			self._inverse[ciphertext] = slot
+
+	def clear(self):
+		"""
+		Removes all stored pairs and resets counters.
+
+		Slots are overwritten before the maps are emptied. Python ints are
+		immutable, so their memory can not be overwritten, but the cache
+		drops every reference to stored pairs.
+		"""
+		with self._lock:
+			for slot in range(self.max_entries):
+				self._plaintexts[slot] = None
+				self._ciphertexts[slot] = None
+				self._referenced[slot] = 0
+			self._forward.clear()
+			self._inverse.clear()
+			self._hand = 0
+			self._reset_stats()
@@ -0,0 +1,228 @@
+"""
+Rank and unrank functions generated for one format.
+
+specialize() generates Python source of rank() and unrank() for a DFA
+based format and its word length N, executes it and installs the
+functions on the format instance, so rank_batch(), unrank_batch(),
+sample() and FNR2.encrypt_words() use them too:
+
+	import pyFNR.codegen
+	fmt = pyFNR.codegen.specialize(pyFNR.Util.LuhnR(0, 16))
+	# or pyFNR.Util.LuhnR(0, 16).specialize()
+
+Generated functions have positions of the DFA walk unrolled. Counts and
+transitions of every position are inlined as constants bound to local
+variables: rank() looks up (count of smaller words, next state) by state
+and character, unrank() bisects cumulative counts of the state. The
+positional tail is plain mixed-radix arithmetic and words are built by
+a single join(), so symbols of the format must be strings (other symbols
+raise ValueError, generic methods of the format are kept). Unlike
+generic methods, generated ones raise ValueError
+for words of other length than N and for ranks out of range.
+
+Generated modules are cached in directory cache_dir (default CACHE_DIR,
+or environment variable PYFNR_CACHE_DIR, created with mode 0700) under
+a hash of the tables, so later processes read them instead of generating
+them again. Cached source starts with its sha256 digest and is executed
+only if the digest matches and the file is owned by the current user and
+not writable by others, otherwise it is generated and written again.
+"""
+import hashlib
+import os
+import threading
+import types
+
+VERSION = 1 # of generated source, part of cache key
+CACHE_DIR = os.environ.get('PYFNR_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'pyFNR')
+MAX_ENTRIES = 2**18 # transitions inlined into generated source
+
+def specialize(fmt, cache_dir=None):
+	"""
+	specialize(FPE_Format[, cache_dir]) -> FPE_Format
+
+	Replaces rank() and unrank() of given format instance by functions
+	generated for its tables and returns the format. Generated module is
+	cached in cache_dir (default CACHE_DIR), False disables the cache.
+	"""
+	if getattr(fmt, '_transitions', None) is None or getattr(fmt, '_columns', None) is None:
+		raise ValueError('Format has no DFA tables: ' + fmt.__class__.__name__)
+	module = load(fmt, cache_dir)
+	fmt.rank = module.rank
+	fmt.unrank = module.unrank
+	import pyFNR.metrics
+	pyFNR.metrics._specialized(fmt)
+	return fmt
+
+def load(fmt, cache_dir=None):
+	"""
+	load(FPE_Format[, cache_dir]) -> module
+
+	Returns module with generated rank() and unrank() of given format,
+	imported from cache_dir if it was generated before.
+	"""
+	if cache_dir is None:
+		cache_dir = CACHE_DIR
+	name = 'pyfnr_format_' + _key(fmt)
+	path = os.path.join(cache_dir, name + '.py') if cache_dir else None
+	source = _read(path) if path is not None else None
+	if source is None:
+		source = generate(fmt)
+		if path is not None:
+			_write(cache_dir, path, source)
+	module = types.ModuleType(name)
+	module.__file__ = path
+	exec(compile(source, path or '<' + name + '>', 'exec'), module.__dict__)
+	return module
+
+def _digest(source):
+	return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def _read(path):
+	# source of cached module, None if missing, tampered with or not private
+	try:
+		with open(path, 'rb') as f:
+			info = os.fstat(f.fileno())
+			data = f.read()
+	except (IOError, OSError):
+		return None
+	if hasattr(os, 'getuid') and (info.st_uid != os.getuid() or info.st_mode & 0o022):
+		return None
+	header, _, source = data.decode('utf-8', 'replace').partition('\n')
+	if header != '# sha256 ' + _digest(source):
+		return None
+	return source
+
+def _write(cache_dir, path, source):
+	# written atomically: concurrent processes and threads write the same source
+	if not os.path.isdir(cache_dir):
+		os.makedirs(cache_dir, 0o700)
+	temporary = path + '.' + str(os.getpid()) + '.' + str(threading.get_ident()) + '.tmp'
+	fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+	with os.fdopen(fd, 'w') as f:
+		f.write('# sha256 ' + _digest(source) + '\n' + source)
+	os.replace(temporary, path)
+
+def _key(fmt):
+	# hash of everything generated source depends on
+	N = fmt.N
+	h = hashlib.sha256(repr((VERSION, N, fmt._sigma, fmt._q0, fmt._invalid_q, fmt._tail_start, fmt._tail_chars)).encode('utf-8'))
+	h.update(repr([list(row) for row in fmt._transitions]).encode('utf-8'))
+	for column in fmt._columns[:N + 1]:
+		h.update(repr([int(v) for v in column]).encode('utf-8'))
+	return h.hexdigest()[:32]
+
+def _live_states(fmt):
+	# states at positions 0..tail_start reachable from q0 which accept some suffix
+	N = fmt.N
+	columns = fmt._columns
+	live = []
+	states = [fmt._q0]
+	for i in range(fmt._tail_start + 1):
+		states = sorted(q for q in set(states) if q != fmt._invalid_q and columns[N-i][q] > 0)
+		live.append(states)
+		states = [t for q in states for t in fmt._transitions[q]]
+	return live
+
+def generate(fmt):
+	"""
+	generate(FPE_Format) -> str
+
+	Returns source of module with rank() and unrank() specialised to
+	given format.
+	"""
+	N = fmt.N
+	sigma = fmt._sigma
+	columns = fmt._columns
+	# constants are written by repr() and words built by join()
+	for a in list(sigma) + [a for chars in fmt._tail_chars for a in chars]:
+		if not isinstance(a, str):
+			raise ValueError('Format symbols must be strings for code generation: ' + repr(a))
+	live = _live_states(fmt)
+	if sum(len(states) for states in live) * len(sigma) > MAX_ENTRIES:
+		raise ValueError('Format is too large for code generation: ' + str(N) + ' positions')
+	constants = []
+	rank_lines = []
+	unrank_lines = []
+	parts = []
+	for i in range(fmt._tail_start):
+		column = columns[N-i-1]
+		ranks = {}
+		unranks = {}
+		for q in live[i]:
+			row = fmt._transitions[q]
+			ranks[q] = {}
+			bounds = []
+			entries = []
+			c = 0
+			for a, t in zip(sigma, row):
+				count = int(column[t])
+				if count:
+					ranks[q][a] = (c, t)
+					entries.append((c, a, t))
+					bounds.append(c + count)
+				c += count
+			unranks[q] = (tuple(bounds), tuple(entries))
+		single = len(live[i]) <= 1
+		if single:
+			constants.append(('_R' + str(i), ranks[live[i][0]] if live[i] else {}))
+			constants.append(('_U' + str(i), unranks[live[i][0]] if live[i] else ((), ())))
+			state = ''
+		else:
+			constants.append(('_R' + str(i), tuple(ranks.get(q) for q in range(max(live[i]) + 1))))
+			constants.append(('_U' + str(i), tuple(unranks.get(q) for q in range(max(live[i]) + 1))))
+			state = '[q]'
+		if i == 0:
+			rank_lines.append('c, q = _R0' + state + '[X[0]]')
+		else:
+			rank_lines.append('a, q = _R' + str(i) + state + '[X[' + str(i) + ']]; c += a')
+		unrank_lines.append('B, E = _U' + str(i) + state)
+		unrank_lines.append('s, x' + str(i) + ', q = E[_bisect(B, c)]; c -= s')
+		parts.append('x' + str(i))
+	if fmt._tail_start == 0:
+		rank_lines.append('c = 0')
+	# positional tail, identical character sets share constants
+	digits = []
+	tail_parts = []
+	for k, chars in enumerate(fmt._tail_chars):
+		if chars not in [d[0] for d in digits]:
+			digits.append((chars, len(digits)))
+			constants.append(('_D' + str(len(digits) - 1), fmt._tail_digits[k]))
+			constants.append(('_C' + str(len(digits) - 1), ''.join(chars) if all(len(a) == 1 for a in chars) else tuple(chars)))
+		index = str([d[0] for d in digits].index(chars))
+		i = str(fmt._tail_start + k)
+		if k == 0:
+			rank_lines.append('t = _D' + index + '[X[' + i + ']]')
+		else:
+			rank_lines.append('t = t * ' + str(len(chars)) + ' + _D' + index + '[X[' + i + ']]')
+		tail_parts.append((index, len(chars), 'y' + str(k)))
+	for k in range(len(tail_parts) - 1, 0, -1):
+		index, radix, name = tail_parts[k]
+		unrank_lines.append('c, d = divmod(c, ' + str(radix) + '); ' + name + ' = _C' + index + '[d]')
+	if tail_parts:
+		unrank_lines.append(tail_parts[0][2] + ' = _C' + tail_parts[0][0] + '[c]')
+		rank_lines.append('c += t')
+	parts.extend(name for _, _, name in tail_parts)
+
+	# every function binds only its own constants as locals
+	rank_defaults = ''.join(', ' + name + '=' + name for name, _ in constants if name[1] in 'RD')
+	unrank_defaults = ''.join(', ' + name + '=' + name for name, _ in constants if name[1] in 'UC')
+	lines = ['# generated by pyFNR.codegen for ' + fmt.__class__.__name__ + ' with N=' + str(N) + ', do not edit', 'import bisect', '']
+	for name, value in constants:
+		lines.append(name + ' = ' + repr(value))
+	lines += ['', 'def rank(X' + rank_defaults + ', _len=len):']
+	lines.append('\tif _len(X) != ' + str(N) + ':')
+	lines.append('\t\traise ValueError("Invalid word " + X)')
+	lines.append('\ttry:')
+	lines += ['\t\t' + line for line in rank_lines]
+	lines.append('\texcept (KeyError, TypeError):')
+	lines.append('\t\traise ValueError("Invalid word " + X)')
+	lines.append('\treturn c')
+	lines += ['', 'def unrank(c' + unrank_defaults + ', _bisect=bisect.bisect_right):']
+	lines.append('\tif not 0 <= c < ' + str(int(fmt.words_count)) + ':')
+	lines.append('\t\traise ValueError("Invalid rank " + str(c))')
+	lines += ['\t' + line for line in unrank_lines]
+	if len(parts) <= 1:
+		lines.append('\treturn ' + (parts[0] if parts else '""'))
+	else:
+		lines.append('\treturn "".join((' + ', '.join(parts) + '))')
+	return '\n'.join(lines) + '\n'
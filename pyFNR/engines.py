@@ -0,0 +1,380 @@
+"""
+Domain extension engines of FNR2.
+
+FNR enciphers blocks of block_size bits, i.e. domains with 2**block_size
+elements. Engine turns FNR into permutation of [domain] = 0..domain:
+
+* 'cycle-walking' (CycleWalking): FNR with the smallest sufficient block
+  size, ciphertexts out of domain are enciphered again [2]. Less than
+  two FNR calls are expected per value, but the number of calls is not
+  bounded.
+* 'feistel' (Feistel): FF1-like Feistel network over mixed-radix halves
+  of the domain with FNR as round function, a fixed number of rounds
+  (default 8, one FNR call each). Halves cover at most a few values
+  above domain, so cycle walking is rare and its steps are bounded, and
+  batches are enciphered round by round.
+* 'wide-feistel' (WideFeistel): Feistel network over halves of arbitrary
+  bit length with FNR of 128 bits as block cipher of FF1-like round
+  function, combined with cycle walking. Used for domains of more than
+  2**128 elements, e.g. ranks of long FPE_Format words.
+"""
+import math
+
+from pyFNR import _optional
+
+MAX_BLOCK_SIZE = 128 # bits
+
+# counter [steps, 0.0] of pyFNR.metrics while it is enabled, else None
+_walk_steps = None
+
+def _bits(domain):
+	return max(domain.bit_length(), 1)
+
+def _walked(count):
+	# cycle walking steps are counted where they are taken, by every engine
+	if _walk_steps is not None:
+		_walk_steps[0] += count
+
+
+class CycleWalking(object):
+	"""
+	CycleWalking(fnr, domain) -> CycleWalking object
+
+	Cycle walking with given FNR instance of block size needed for domain.
+	"""
+
+	name = 'cycle-walking'
+
+	@staticmethod
+	def block_size(domain, rounds=None):
+		"""
+		block_size(int) -> int
+
+		Returns block size of FNR needed for given domain.
+		"""
+		return _bits(domain)
+
+	def __init__(self, fnr, domain, rounds=None):
+		self._fnr = fnr
+		self.domain = domain
+
+	def encrypt(self, plaintext):
+		ciphertext = self._fnr.encrypt_int(plaintext)
+		while (ciphertext > self.domain):
+			ciphertext = self._fnr.encrypt_int(ciphertext)
+			_walked(1)
+		return ciphertext
+
+	def decrypt(self, ciphertext):
+		plaintext = self._fnr.decrypt_int(ciphertext)
+		while (plaintext > self.domain):
+			plaintext = self._fnr.decrypt_int(plaintext)
+			_walked(1)
+		return plaintext
+
+	def encrypt_batch(self, values):
+		return self._walk_batch(values, self._fnr.encrypt_ints)
+
+	def decrypt_batch(self, values):
+		return self._walk_batch(values, self._fnr.decrypt_ints)
+
+	def _walk_batch(self, values, operation):
+		# cycle walking continues only with values still out of domain
+		results = operation(values)
+		pending = [i for i, value in enumerate(results) if value > self.domain]
+		while pending:
+			_walked(len(pending))
+			walked = operation([results[i] for i in pending])
+			for i, value in zip(pending, walked):
+				results[i] = value
+			pending = [i for i in pending if results[i] > self.domain]
+		return results
+
+	def encrypt_array(self, values):
+		return self._walk_array(values, self._fnr.encrypt_array)
+
+	def decrypt_array(self, values):
+		return self._walk_array(values, self._fnr.decrypt_array)
+
+	def _walk_array(self, values, operation):
+		numpy = _optional.numpy()
+		domain = numpy.uint64(self.domain)
+		results = operation(values)
+		pending = numpy.flatnonzero(results > domain)
+		while len(pending):
+			_walked(len(pending))
+			walked = operation(results[pending])
+			results[pending] = walked
+			pending = pending[walked > domain]
+		return results
+
+
+class Feistel(object):
+	"""
+	Feistel(fnr, domain[, rounds]) -> Feistel object
+
+	Feistel network over mixed-radix halves of [domain] = 0..domain.
+	Domain size domain + 1 is covered by a * b values with
+	a = ceil(sqrt(domain + 1)) and b = ceil((domain + 1) / a), value X is
+	split into L, R = divmod(X, b), even rounds update L = (L + F_i(R)) % a
+	and odd rounds update R = (R + F_i(L)) % b (like FF1), decryption
+	subtracts in reverse order.
+
+	Round function F_i(Y) is FNR encryption of (i << h) | Y, where h is
+	number of bits of max(a, b) - 1. FNR block size is h plus bits of
+	rounds - 1 plus 64 bits (at most 128), so F_i(Y) % a is uniform up to
+	2**-64. The a * b - domain - 1 < a values above domain are cycle
+	walked, so a walk has at most that many steps and only a fraction
+	less than 1 / b of values is walked at all.
+
+	rounds -- number of Feistel rounds, default is 8.
+	"""
+
+	name = 'feistel'
+	default_rounds = 8
+
+	@staticmethod
+	def _radices(domain):
+		size = domain + 1
+		a = math.isqrt(size - 1) + 1 if size > 1 else 1
+		return a, -(-size // a)
+
+	@staticmethod
+	def block_size(domain, rounds=None):
+		"""
+		block_size(int[, rounds]) -> int
+
+		Returns block size of FNR needed for given domain and rounds.
+		"""
+		if rounds is None:
+			rounds = Feistel.default_rounds
+		if _bits(domain) > MAX_BLOCK_SIZE:
+			raise ValueError("Domain is too large for feistel engine: " + str(domain))
+		a, b = Feistel._radices(domain)
+		return min(_bits(max(a, b) - 1) + (rounds - 1).bit_length() + 64, MAX_BLOCK_SIZE)
+
+	def __init__(self, fnr, domain, rounds=None):
+		if rounds is None:
+			rounds = self.default_rounds
+		if rounds < 1:
+			raise ValueError("Invalid number of rounds: " + str(rounds))
+		a, b = self._radices(domain)
+		self._shift = _bits(max(a, b) - 1)
+		if self._shift + (rounds - 1).bit_length() > fnr._block_size:
+			raise ValueError("Too many rounds for FNR of block size " + str(fnr._block_size) + ": " + str(rounds))
+		self._fnr = fnr
+		self.domain = domain
+		self.rounds = rounds
+		self._a = a
+		self._b = b
+
+	def encrypt(self, plaintext):
+		ciphertext = self._feistel(plaintext, 1)
+		while ciphertext > self.domain:
+			ciphertext = self._feistel(ciphertext, 1)
+			_walked(1)
+		return ciphertext
+
+	def decrypt(self, ciphertext):
+		plaintext = self._feistel(ciphertext, -1)
+		while plaintext > self.domain:
+			plaintext = self._feistel(plaintext, -1)
+			_walked(1)
+		return plaintext
+
+	def _feistel(self, x, sign):
+		encrypt_int = self._fnr.encrypt_int
+		a, b, shift = self._a, self._b, self._shift
+		left, right = divmod(x, b)
+		rounds = range(self.rounds) if sign > 0 else range(self.rounds - 1, -1, -1)
+		for i in rounds:
+			if i & 1:
+				right = (right + sign * encrypt_int((i << shift) | left)) % b
+			else:
+				left = (left + sign * encrypt_int((i << shift) | right)) % a
+		return left * b + right
+
+	def encrypt_batch(self, values):
+		return self._walk_batch(values, 1)
+
+	def decrypt_batch(self, values):
+		return self._walk_batch(values, -1)
+
+	def _walk_batch(self, values, sign):
+		# all values go through the same round at once, walks are rare
+		results = self._feistel_batch(list(values), sign)
+		pending = [i for i, value in enumerate(results) if value > self.domain]
+		while pending:
+			_walked(len(pending))
+			walked = self._feistel_batch([results[i] for i in pending], sign)
+			for i, value in zip(pending, walked):
+				results[i] = value
+			pending = [i for i in pending if results[i] > self.domain]
+		return results
+
+	def _feistel_batch(self, xs, sign):
+		encrypt_ints = self._fnr.encrypt_ints
+		a, b, shift = self._a, self._b, self._shift
+		lefts = [x // b for x in xs]
+		rights = [x % b for x in xs]
+		rounds = range(self.rounds) if sign > 0 else range(self.rounds - 1, -1, -1)
+		for i in rounds:
+			if i & 1:
+				outputs = encrypt_ints([(i << shift) | l for l in lefts])
+				rights = [(r + sign * o) % b for r, o in zip(rights, outputs)]
+			else:
+				outputs = encrypt_ints([(i << shift) | r for r in rights])
+				lefts = [(l + sign * o) % a for l, o in zip(lefts, outputs)]
+		return [l * b + r for l, r in zip(lefts, rights)]
+
+	def encrypt_array(self, values):
+		numpy = _optional.numpy()
+		return numpy.array(self.encrypt_batch(values.tolist()), dtype=numpy.uint64)
+
+	def decrypt_array(self, values):
+		numpy = _optional.numpy()
+		return numpy.array(self.decrypt_batch(values.tolist()), dtype=numpy.uint64)
+
+
+class WideFeistel(CycleWalking):
+	"""
+	WideFeistel(fnr, domain[, rounds]) -> WideFeistel object
+
+	Cycle walking with Feistel network of n bits, where n is number of
+	bits of domain and may exceed 128. Value X is split into left half L
+	(n // 2 bits) and right half R (remaining bits), even rounds update
+	L ^= F_i(R) and odd rounds update R ^= F_i(L), so halves keep their
+	lengths and decryption runs rounds in reverse order.
+
+	Round function F_i is built from given FNR instance of block size 128
+	like in FF1: CBC-MAC of the half (in 128-bit blocks) starting from
+	E((i << 16) | n) gives block S, output bits are S, E(S ^ 1), E(S ^ 2),
+	... truncated to the length of the updated half.
+
+	rounds -- number of Feistel rounds, default is 10.
+	"""
+
+	name = 'wide-feistel'
+	default_rounds = 10
+
+	@staticmethod
+	def block_size(domain, rounds=None):
+		return MAX_BLOCK_SIZE
+
+	def __init__(self, fnr, domain, rounds=None):
+		super(WideFeistel, self).__init__(fnr, domain, rounds)
+		if rounds is None:
+			rounds = self.default_rounds
+		if rounds < 1:
+			raise ValueError("Invalid number of rounds: " + str(rounds))
+		self.rounds = rounds
+		bits = _bits(domain)
+		self._left_bits = bits // 2
+		self._right_bits = bits - self._left_bits
+		# first CBC-MAC block of every round does not depend on the value
+		self._initial = fnr.encrypt_ints([(i << 16) | bits for i in range(rounds)])
+
+	def encrypt(self, plaintext):
+		ciphertext = self._feistel(plaintext, range(self.rounds))
+		while (ciphertext > self.domain):
+			ciphertext = self._feistel(ciphertext, range(self.rounds))
+			_walked(1)
+		return ciphertext
+
+	def decrypt(self, ciphertext):
+		rounds = range(self.rounds - 1, -1, -1)
+		plaintext = self._feistel(ciphertext, rounds)
+		while (plaintext > self.domain):
+			plaintext = self._feistel(plaintext, rounds)
+			_walked(1)
+		return plaintext
+
+	def encrypt_batch(self, values):
+		return self._walk_batch(values, lambda xs: self._feistel_batch(xs, range(self.rounds)))
+
+	def decrypt_batch(self, values):
+		return self._walk_batch(values, lambda xs: self._feistel_batch(xs, range(self.rounds - 1, -1, -1)))
+
+	def encrypt_array(self, values):
+		numpy = _optional.numpy()
+		return numpy.array(self.encrypt_batch(values.tolist()), dtype=numpy.uint64)
+
+	def decrypt_array(self, values):
+		numpy = _optional.numpy()
+		return numpy.array(self.decrypt_batch(values.tolist()), dtype=numpy.uint64)
+
+	def _feistel(self, x, rounds):
+		right_bits = self._right_bits
+		right_mask = (1 << right_bits) - 1
+		left, right = x >> right_bits, x & right_mask
+		for i in rounds:
+			if i & 1:
+				right ^= self._round_function(i, left, self._left_bits, right_bits)
+			else:
+				left ^= self._round_function(i, right, right_bits, self._left_bits)
+		return (left << right_bits) | right
+
+	def _round_function(self, i, x, in_bits, out_bits):
+		encrypt_int = self._fnr.encrypt_int
+		s = self._initial[i]
+		for shift in range(0, max(in_bits, 1), 128):
+			s = encrypt_int(s ^ ((x >> shift) & 0xffffffffffffffffffffffffffffffff))
+		output = s
+		for k in range(1, (out_bits + 127) // 128):
+			output |= encrypt_int(s ^ k) << (128 * k)
+		return output & ((1 << out_bits) - 1)
+
+	def _feistel_batch(self, xs, rounds):
+		right_bits = self._right_bits
+		right_mask = (1 << right_bits) - 1
+		lefts = [x >> right_bits for x in xs]
+		rights = [x & right_mask for x in xs]
+		for i in rounds:
+			if i & 1:
+				outputs = self._round_function_batch(i, lefts, self._left_bits, right_bits)
+				rights = [r ^ o for r, o in zip(rights, outputs)]
+			else:
+				outputs = self._round_function_batch(i, rights, right_bits, self._left_bits)
+				lefts = [l ^ o for l, o in zip(lefts, outputs)]
+		return [(l << right_bits) | r for l, r in zip(lefts, rights)]
+
+	def _round_function_batch(self, i, xs, in_bits, out_bits):
+		# every CBC-MAC and output block is one batch call for all values
+		encrypt_ints = self._fnr.encrypt_ints
+		mask = 0xffffffffffffffffffffffffffffffff
+		states = [self._initial[i]] * len(xs)
+		for shift in range(0, max(in_bits, 1), 128):
+			states = encrypt_ints([s ^ ((x >> shift) & mask) for s, x in zip(states, xs)])
+		outputs = states
+		for k in range(1, (out_bits + 127) // 128):
+			blocks = encrypt_ints([s ^ k for s in states])
+			outputs = [o | (b << (128 * k)) for o, b in zip(outputs, blocks)]
+		out_mask = (1 << out_bits) - 1
+		return [o & out_mask for o in outputs]
+
+
+ENGINES = {
+	CycleWalking.name: CycleWalking,
+	Feistel.name: Feistel,
+	WideFeistel.name: WideFeistel,
+}
+
+def default_engine(domain):
+	"""
+	default_engine(int) -> str
+
+	Returns name of engine used by FNR2 for given domain when no engine
+	is selected: 'cycle-walking' for domains up to 128 bits, otherwise
+	'wide-feistel'.
+	"""
+	if _bits(domain) > MAX_BLOCK_SIZE:
+		return WideFeistel.name
+	return CycleWalking.name
+
+def get_engine(name):
+	"""
+	get_engine(str) -> engine class
+	"""
+	if name not in ENGINES:
+		raise ValueError("Unknown engine: " + str(name))
+	return ENGINES[name]
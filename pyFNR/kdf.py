@@ -0,0 +1,55 @@
+"""
+Key derivation functions for FNR.
+
+FNR master key (KEY_SIZE bytes) is derived from ASCII string key and
+salt by PBKDF2. Default PBKDF2-HMAC-SHA1 with 1000 iterations keeps
+compatibility with previous versions of pyFNR, stronger settings
+can be chosen per deployment, e.g.
+
+	fnr = pyFNR.FNR(key, tweak, kdf=pyFNR.kdf.PBKDF2('sha256', 100000))
+
+Services which already hold derived master keys can skip key
+derivation entirely with FNR.from_master_key().
+"""
+
+class PBKDF2(object):
+	"""
+	PBKDF2([hash_name[, iterations[, engine]]]) -> PBKDF2 object
+
+	PBKDF2-HMAC key derivation function.
+
+	Keyword arguments:
+	hash_name -- name of HMAC hash function, e.g. 'sha1' or 'sha256'.
+	iterations -- number of PBKDF2 iterations.
+	engine -- None to use key derivation of the backend (OpenSSL's
+		PKCS5_PBKDF2_HMAC() with ctypes backend), 'openssl' or 'hashlib'
+		(hashlib.pbkdf2_hmac()) to force given implementation.
+	"""
+
+	def __init__(self, hash_name='sha1', iterations=1000, engine=None):
+		if iterations < 1:
+			raise ValueError("Invalid number of iterations: " + str(iterations))
+		if engine not in (None, 'openssl', 'hashlib'):
+			raise ValueError("Unknown PBKDF2 engine: " + str(engine))
+		self.hash_name = hash_name
+		self.iterations = iterations
+		self.engine = engine
+
+	def derive(self, password, salt, size, backend):
+		"""
+		derive(bytes, bytes, int, backend) -> bytes
+
+		Derives key of given size from password and salt.
+		"""
+		if self.engine == 'hashlib':
+			import hashlib
+			return hashlib.pbkdf2_hmac(self.hash_name, password, salt, self.iterations, size)
+		if self.engine == 'openssl':
+			from pyFNR import backends
+			backend = backends.get_backend('ctypes')
+		return backend.pbkdf2_hmac(self.hash_name, password, salt, self.iterations, size)
+
+	def __repr__(self):
+		return 'PBKDF2(' + repr(self.hash_name) + ', ' + str(self.iterations) + ')'
+
+DEFAULT_KDF = PBKDF2('sha1', 1000)
@@ -0,0 +1,179 @@
+"""
+Opt-in instrumentation of FNR, FNR2 and FPE_Format hot paths.
+
+Instrumentation is disabled by default and costs nothing: enable()
+replaces instrumented methods by timing wrappers and disable() puts the
+original methods back.
+
+	import pyFNR.metrics
+	pyFNR.metrics.enable(tracer=lambda name, start, duration: ...)
+	...
+	pyFNR.metrics.snapshot()
+	# {'FNR.encrypt_int': {'count': 1000, 'total_time': 0.0123}, ...}
+
+Every instrumented operation has a counter of calls and cumulative time
+in seconds (inclusive of nested operations). Cycle walking steps of FNR2
+engines (single values, batches and arrays) are counted in
+'FNR2.cycle_walk_steps'. Spans (construction by constructors and
+from_master_key(), key derivation and expansion, batch calls and table
+builds) are reported to the tracer, a callable tracer(name, start,
+duration) with times from time.perf_counter().
+
+rank() and unrank() are counted for FPE_Format and every subclass
+defining them when enable() is called ('CompositeFormat.rank', ...),
+and for formats specialised by pyFNR.codegen under their class name.
+
+Counters are plain Python ints updated without locking, so counts from
+concurrent threads are approximate.
+"""
+import time
+import weakref
+
+_clock = time.perf_counter
+
+# name -> [count, total_time]
+_stats = {}
+_tracer = None
+# (class, attribute) -> original method
+_originals = {}
+# format specialised by pyFNR.codegen -> its generated (rank, unrank)
+_specialized_formats = weakref.WeakKeyDictionary()
+
+def _counter(name, func):
+	stat = _stats.setdefault(name, [0, 0.0])
+	def wrapper(*args, **kwargs):
+		start = _clock()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			stat[0] += 1
+			stat[1] += _clock() - start
+	return wrapper
+
+def _span(name, func):
+	stat = _stats.setdefault(name, [0, 0.0])
+	def wrapper(*args, **kwargs):
+		start = _clock()
+		try:
+			return func(*args, **kwargs)
+		finally:
+			duration = _clock() - start
+			stat[0] += 1
+			stat[1] += duration
+			if _tracer is not None:
+				_tracer(name, start, duration)
+	return wrapper
+
+def _targets():
+	import pyFNR
+	import pyFNR.kdf
+	import pyFNR.Util
+	Util = pyFNR.Util
+	return [
+		(pyFNR.FNR, '__init__', 'FNR.construct', _span),
+		(pyFNR.FNR, 'from_master_key', 'FNR.construct', _span),
+		(pyFNR.FNR, '_setup', 'FNR.expand_key', _span),
+		(pyFNR.kdf.PBKDF2, 'derive', 'kdf.derive', _span),
+		(pyFNR.FNR, 'encrypt_int', 'FNR.encrypt_int', _counter),
+		(pyFNR.FNR, 'decrypt_int', 'FNR.decrypt_int', _counter),
+		(pyFNR.FNR, 'encrypt_bytes', 'FNR.encrypt_bytes', _counter),
+		(pyFNR.FNR, 'decrypt_bytes', 'FNR.decrypt_bytes', _counter),
+		(pyFNR.FNR, 'encrypt_str', 'FNR.encrypt_str', _counter),
+		(pyFNR.FNR, 'decrypt_str', 'FNR.decrypt_str', _counter),
+		(pyFNR.FNR, '_int_to_bytes', 'FNR._int_to_bytes', _counter),
+		(pyFNR.FNR, '_bytes_to_int', 'FNR._bytes_to_int', _counter),
+		(pyFNR.FNR, 'encrypt_ints', 'FNR.encrypt_ints', _span),
+		(pyFNR.FNR, 'decrypt_ints', 'FNR.decrypt_ints', _span),
+		(pyFNR.FNR2, '__init__', 'FNR2.construct', _span),
+		(pyFNR.FNR2, 'from_master_key', 'FNR2.construct', _span),
+		(pyFNR.FNR2, 'encrypt', 'FNR2.encrypt', _counter),
+		(pyFNR.FNR2, 'decrypt', 'FNR2.decrypt', _counter),
+		(pyFNR.FNR2, 'encrypt_batch', 'FNR2.encrypt_batch', _span),
+		(pyFNR.FNR2, 'decrypt_batch', 'FNR2.decrypt_batch', _span),
+		(Util.FPE_Format, '__init__', 'FPE_Format.construct', _span),
+		(Util.FPE_Format, '_FPE_Format__buildTable', 'FPE_Format.build_table', _span),
+	] + [(cls, attribute, cls.__name__ + '.' + attribute, _counter)
+		for cls in _formats(Util.FPE_Format)
+		for attribute in ('rank', 'unrank') if attribute in cls.__dict__]
+
+def _formats(cls):
+	# cls and its subclasses, each once
+	classes = [cls]
+	for subclass in cls.__subclasses__():
+		classes.extend(c for c in _formats(subclass) if c not in classes)
+	return classes
+
+def _wrap_specialized(fmt, functions):
+	name = fmt.__class__.__name__
+	fmt.rank = _counter(name + '.rank', functions[0])
+	fmt.unrank = _counter(name + '.unrank', functions[1])
+
+def _specialized(fmt):
+	# called by pyFNR.codegen after it sets rank() and unrank() of fmt
+	functions = _specialized_formats[fmt] = (fmt.rank, fmt.unrank)
+	if _originals:
+		_wrap_specialized(fmt, functions)
+
+def enable(tracer=None):
+	"""
+	enable([tracer])
+
+	Installs timing wrappers on instrumented methods. Optional tracer is
+	a callable tracer(name, start, duration) called after every span.
+	"""
+	global _tracer
+	import pyFNR.engines
+	_tracer = tracer
+	if _originals:
+		return
+	for cls, attribute, name, wrap in _targets():
+		original = cls.__dict__[attribute]
+		_originals[(cls, attribute)] = original
+		if isinstance(original, classmethod):
+			setattr(cls, attribute, classmethod(wrap(name, original.__func__)))
+		else:
+			setattr(cls, attribute, wrap(name, original))
+	pyFNR.engines._walk_steps = _stats.setdefault('FNR2.cycle_walk_steps', [0, 0.0])
+	for fmt, functions in list(_specialized_formats.items()):
+		_wrap_specialized(fmt, functions)
+
+def disable():
+	"""
+	disable()
+
+	Restores original methods. Collected counters are kept.
+	"""
+	global _tracer
+	import pyFNR.engines
+	_tracer = None
+	pyFNR.engines._walk_steps = None
+	for (cls, attribute), original in _originals.items():
+		setattr(cls, attribute, original)
+	_originals.clear()
+	for fmt, functions in list(_specialized_formats.items()):
+		fmt.rank, fmt.unrank = functions
+
+def is_enabled():
+	"""
+	is_enabled() -> bool
+	"""
+	return bool(_originals)
+
+def snapshot():
+	"""
+	snapshot() -> dict
+
+	Returns copy of counters: dictionary operation name ->
+	{'count': int, 'total_time': float (seconds)}.
+	"""
+	return dict((name, {'count': stat[0], 'total_time': stat[1]}) for name, stat in _stats.items())
+
+def reset():
+	"""
+	reset()
+
+	Sets all counters to zero.
+	"""
+	for stat in _stats.values():
+		stat[0] = 0
+		stat[1] = 0.0
@@ -0,0 +1,70 @@
+"""
+pandas integration: encryption of whole Series (DataFrame columns).
+
+	import pyFNR.pandas
+	df['id'] = pyFNR.pandas.encrypt(fnr2, df['id'])
+	df['plate'] = pyFNR.pandas.encrypt(fnr2, df['plate'], pyFNR.Util.ECV())
+
+Integer columns are enciphered by FNR2.encrypt_array() on their NumPy
+values without copying. Columns of format words are factorized, so every
+distinct word is ranked, enciphered and unranked once (categorical
+columns only have their categories enciphered). Missing values stay
+missing. Requires pandas and NumPy.
+"""
+from pyFNR import _optional
+
+def encrypt(fnr2, series, fmt=None):
+	"""
+	encrypt(FNR2, pandas.Series[, fmt]) -> pandas.Series
+
+	Encrypts all values of given Series. Integer values are encrypted
+	directly, strings are words of format fmt.
+	"""
+	return _operate(fnr2, series, fmt, False)
+
+def decrypt(fnr2, series, fmt=None):
+	"""
+	decrypt(FNR2, pandas.Series[, fmt]) -> pandas.Series
+
+	Decrypts all values of given Series, see encrypt().
+	"""
+	return _operate(fnr2, series, fmt, True)
+
+def _operate(fnr2, series, fmt, inverse):
+	pandas = _optional.load('pandas')
+	if pandas is None:
+		raise ImportError("pyFNR.pandas requires pandas")
+	if fmt is not None:
+		return _operate_words(pandas, fnr2, series, fmt, inverse)
+	if pandas.api.types.is_integer_dtype(series.dtype):
+		return _operate_ints(pandas, fnr2, series, inverse)
+	raise ValueError("Format is needed for column of type " + str(series.dtype))
+
+def _operate_ints(pandas, fnr2, series, inverse):
+	numpy = _optional.numpy()
+	dtype = numpy.dtype(series.dtype.numpy_dtype if hasattr(series.dtype, 'numpy_dtype') else series.dtype)
+	if fnr2.domain > numpy.iinfo(dtype).max:
+		raise ValueError("Domain does not fit column type " + str(series.dtype))
+	mask = None
+	if series.hasnans:
+		mask = series.isna().to_numpy()
+		values = series.to_numpy(dtype=dtype, na_value=0)
+	else:
+		values = series.to_numpy(dtype=dtype)
+	operation = fnr2.decrypt_array if inverse else fnr2.encrypt_array
+	result = pandas.Series(operation(values).astype(dtype), index=series.index, name=series.name)
+	result = result.astype(series.dtype)
+	if mask is not None:
+		result[mask] = None
+	return result
+
+def _operate_words(pandas, fnr2, series, fmt, inverse):
+	numpy = _optional.numpy()
+	operation = fnr2.decrypt_words if inverse else fnr2.encrypt_words
+	if isinstance(series.dtype, pandas.CategoricalDtype):
+		return series.cat.rename_categories(operation(fmt, list(series.cat.categories)))
+	codes, uniques = pandas.factorize(series)
+	# missing values have code -1, i.e. the last item
+	words = numpy.array(operation(fmt, list(uniques)) + [None], dtype=object)
+	result = pandas.Series(words[codes], index=series.index, name=series.name)
+	return result.astype(series.dtype)
@@ -0,0 +1,297 @@
+"""
+Pool of reusable FNR and FNR2 instances for long-running services.
+
+Key expansion (and for FNR2 engine setup) is expensive and expanded keys
+are native resources, so services should neither build an instance per
+request nor keep unbounded numbers of them. Pool keeps instances keyed
+by (key id, tweak, block size or domain) and lends them out:
+
+	import pyFNR.pool
+	pool = pyFNR.pool.Pool({'customers-2024': master_key}, max_size=32)
+	with pool.lease('customers-2024', 'emails', domain=10**9) as fnr2:
+		fnr2.encrypt_batch(values)
+	...
+	pool.close()
+
+Master keys are resolved by key id through a dict or a callable (e.g. a
+vault client), the pool stores only the instances. At most max_size
+instances exist at once (idle and lent out), the least recently used idle
+instance is closed to make room for a new one and instances idle for more
+than idle_timeout seconds are closed. Instances lent out and never
+returned are released by their finalizers when garbage collected, and
+free their place in the pool.
+"""
+import threading
+import time
+import weakref
+
+from pyFNR import FNR, FNR2
+
+MAX_SIZE = 64 # instances
+IDLE_TIMEOUT = 300.0 # seconds
+
+
+class PoolExhausted(RuntimeError):
+	"""
+	Raised by Pool.checkout() if max_size instances are lent out.
+	"""
+
+
+class Pool(object):
+	"""
+	Pool(keys[, max_size[, idle_timeout[, backend]]]) -> Pool object
+
+	Registry of reusable FNR and FNR2 instances.
+
+	Keyword arguments:
+	keys -- dict key id -> master key (KEY_SIZE bytes) or callable
+		key_id -> master key.
+	max_size -- maximal number of instances (idle and lent out).
+	idle_timeout -- seconds after which idle instances are closed, None
+		keeps them until evicted by max_size.
+	backend -- optional name of backend from pyFNR.backends.
+	clock -- optional function returning current time in seconds.
+	"""
+
+	def __init__(self, keys, max_size=MAX_SIZE, idle_timeout=IDLE_TIMEOUT, backend=None, clock=time.monotonic):
+		if max_size < 1:
+			raise ValueError("max_size must be positive: " + str(max_size))
+		self._keys = keys if callable(keys) else keys.__getitem__
+		self.max_size = max_size
+		self.idle_timeout = idle_timeout
+		self.backend = backend
+		self._clock = clock
+		self._condition = threading.Condition()
+		# pool key -> list of (time of return, instance), most recent last
+		self._idle = {}
+		self._idle_count = 0
+		# id of instance -> (weak reference, pool key), references of
+		# collected instances remove their entries and wake up waiters
+		self._leased = {}
+		# slots reserved by checkouts creating instances outside the lock
+		self._creating = 0
+		self._closed = False
+		self._stats = {'created': 0, 'reused': 0, 'evicted': 0, 'expired': 0}
+		self._finalizer = weakref.finalize(self, _close_all, self._idle)
+
+	def __len__(self):
+		return self._idle_count + len(self._leased) + self._creating
+
+	def checkout(self, key_id, tweak="tweak-is-string", block_size=None, domain=None, timeout=0, **options):
+		"""
+		checkout(key_id[, tweak[, block_size[, domain[, timeout]]]], **options) -> FNR or FNR2
+
+		Lends instance for given key id and tweak: FNR with block_size or
+		FNR2 with domain (and options of FNR2.from_master_key(), e.g.
+		engine or cache). Instance must be returned by checkin() (see
+		lease()). If max_size instances are lent out, waits at most
+		timeout seconds (None waits forever) for a returned one and then
+		raises PoolExhausted.
+		"""
+		if (block_size is None) == (domain is None):
+			raise ValueError("Exactly one of block_size and domain expected")
+		key = (key_id, tweak, block_size, domain, _freeze(options))
+		deadline = None if timeout is None else self._clock() + timeout
+		with self._condition:
+			while True:
+				if self._closed:
+					raise ValueError("Operation on closed pool")
+				self._expire()
+				idle = self._idle.get(key)
+				if idle:
+					instance = idle.pop()[1]
+					self._idle_count -= 1
+					self._stats['reused'] += 1
+					break
+				if len(self) >= self.max_size:
+					self._evict()
+				if len(self) < self.max_size:
+					# reserve the slot, key lookup and expansion run unlocked
+					self._creating += 1
+					instance = None
+					break
+				remaining = None if deadline is None else deadline - self._clock()
+				if remaining is not None and remaining <= 0:
+					raise PoolExhausted("All " + str(self.max_size) + " instances are lent out")
+				self._condition.wait(remaining)
+			if instance is not None:
+				self._lend(instance, key)
+				return instance
+		try:
+			instance = self._create(key_id, tweak, block_size, domain, options)
+		except BaseException:
+			with self._condition:
+				self._creating -= 1
+				self._condition.notify()
+			raise
+		with self._condition:
+			self._creating -= 1
+			if self._closed:
+				instance.close()
+				self._condition.notify()
+				raise ValueError("Operation on closed pool")
+			self._stats['created'] += 1
+			self._lend(instance, key)
+		return instance
+
+	def checkin(self, instance):
+		"""
+		checkin(FNR or FNR2)
+
+		Returns lent instance to the pool. Instances of closed pool are
+		closed.
+		"""
+		with self._condition:
+			entry = self._leased.get(id(instance))
+			if entry is None or entry[0]() is not instance:
+				raise ValueError("Instance was not lent by this pool")
+			del self._leased[id(instance)]
+			key = entry[1]
+			if self._closed or instance.closed:
+				instance.close()
+			else:
+				self._idle.setdefault(key, []).append((self._clock(), instance))
+				self._idle_count += 1
+				self._expire()
+			self._condition.notify()
+
+	def lease(self, key_id, tweak="tweak-is-string", block_size=None, domain=None, timeout=0, **options):
+		"""
+		lease(key_id[, tweak[, block_size[, domain[, timeout]]]], **options) -> context manager
+
+		Context manager which checks out instance (see checkout()) at the
+		beginning of with statement and returns it at the end.
+		"""
+		return _Lease(self, (key_id, tweak, block_size, domain, timeout), options)
+
+	def evict_idle(self):
+		"""
+		evict_idle() -> int
+
+		Closes instances idle for more than idle_timeout seconds and returns
+		their number. Pool does it also on every checkout and checkin.
+		"""
+		with self._condition:
+			return self._expire()
+
+	def stats(self):
+		"""
+		stats() -> dict
+
+		Returns counters of this pool: instances, idle, leased, created,
+		reused, evicted (for max_size) and expired (idle timeout).
+		"""
+		with self._condition:
+			stats = dict(self._stats)
+			stats['instances'] = len(self)
+			stats['idle'] = self._idle_count
+			stats['leased'] = len(self._leased)
+			return stats
+
+	def close(self):
+		"""
+		Closes idle instances, instances lent out are closed when they are
+		returned. Closing closed pool does nothing.
+		"""
+		with self._condition:
+			self._closed = True
+			self._finalizer()
+			self._idle_count = 0
+			self._condition.notify_all()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def _lend(self, instance, key):
+		# weak reference, instances lent and never returned free their slot
+		self._leased[id(instance)] = (weakref.ref(instance, _reclaimer(weakref.ref(self), id(instance))), key)
+
+	def _reclaim(self, identity):
+		with self._condition:
+			self._leased.pop(identity, None)
+			self._condition.notify()
+
+	def _create(self, key_id, tweak, block_size, domain, options):
+		master_key = self._keys(key_id)
+		if block_size is not None:
+			return FNR.from_master_key(master_key, tweak, block_size, self.backend, **options)
+		return FNR2.from_master_key(master_key, tweak, domain, backend=self.backend, **options)
+
+	def _expire(self):
+		# closes instances idle for more than idle_timeout
+		if self.idle_timeout is None or not self._idle_count:
+			return 0
+		limit = self._clock() - self.idle_timeout
+		expired = 0
+		for key in list(self._idle):
+			idle = self._idle[key]
+			while idle and idle[0][0] < limit:
+				idle.pop(0)[1].close()
+				expired += 1
+			if not idle:
+				del self._idle[key]
+		self._idle_count -= expired
+		self._stats['expired'] += expired
+		return expired
+
+	def _evict(self):
+		# closes least recently returned idle instance
+		if not self._idle_count:
+			return
+		key = min(self._idle, key=lambda key: self._idle[key][0][0])
+		self._idle[key].pop(0)[1].close()
+		if not self._idle[key]:
+			del self._idle[key]
+		self._idle_count -= 1
+		self._stats['evicted'] += 1
+
+
+class _Lease(object):
+
+	def __init__(self, pool, args, options):
+		self._pool = pool
+		self._args = args
+		self._options = options
+		self.instance = None
+
+	def __enter__(self):
+		self.instance = self._pool.checkout(*self._args, **self._options)
+		return self.instance
+
+	def __exit__(self, *exc_info):
+		instance, self.instance = self.instance, None
+		self._pool.checkin(instance)
+
+def _reclaimer(pool_reference, identity):
+	# callback of weak reference to lent instance, must not reference the pool
+	def callback(reference):
+		pool = pool_reference()
+		if pool is not None:
+			pool._reclaim(identity)
+	return callback
+
+def _freeze(options):
+	# hashable form of options of FNR2.from_master_key(), part of pool key
+	def freeze(value):
+		if isinstance(value, dict):
+			return tuple(sorted((k, freeze(v)) for k, v in value.items()))
+		if isinstance(value, (list, tuple)):
+			return tuple(freeze(v) for v in value)
+		if isinstance(value, (set, frozenset)):
+			return frozenset(freeze(v) for v in value)
+		try:
+			hash(value)
+		except TypeError:
+			raise ValueError("Unhashable option value: " + repr(value))
+		return value
+	return freeze(options)
+
+def _close_all(idle):
+	# finalizer of Pool, must not reference the pool
+	for instances in idle.values():
+		for _, instance in instances:
+			instance.close()
+	idle.clear()
@@ -0,0 +1,239 @@
+"""
+Key rotation: re-encryption of stored ciphertexts under a new key.
+
+Rekeyer composes decryption by the old FNR2 instance and encryption by
+the new one (which may differ in key, tweak, engine or backend) into one
+batch pipeline:
+
+	import pyFNR.rekey
+	rekeyer = pyFNR.rekey.Rekeyer(old, new, fmt=pyFNR.Util.ECV())
+	rekeyer.rekey_batch(tokens)                     # list of tokens
+	rekeyer.rekey_file('tokens.txt', 'rotated.txt', checkpoint='rotation.json')
+
+Tokens of a format are ranked and unranked only once, intermediate
+plaintexts stay integers. Batches are deduplicated and enciphered by
+batch (or NumPy array) paths of both engines. For domains of less than
+TABLE_SIZE elements the composed permutation is precomputed as a table
+once the rotation has enciphered as many tokens as the domain has
+elements (the table costs about the same), then every further token
+costs a single lookup.
+
+Long rotations stream tokens in chunks and record progress in a
+checkpoint file after every chunk, so an interrupted rotation resumes
+after the last finished chunk instead of starting again.
+"""
+import itertools
+import json
+import os
+
+from pyFNR import _optional
+
+CHUNK_SIZE = 65536 # tokens re-encrypted at once by streaming methods
+TABLE_SIZE = 2**20 # domains with fewer elements get precomputed table
+
+
+class Rekeyer(object):
+	"""
+	Rekeyer(old, new[, fmt[, table]]) -> Rekeyer object
+
+	Re-encrypts ciphertexts of FNR2 instance old as ciphertexts of FNR2
+	instance new, i.e. new.encrypt(old.decrypt(x)).
+
+	Keyword arguments:
+	old -- FNR2 instance with the retired key or tweak.
+	new -- FNR2 instance with the new key or tweak, with the same domain.
+	fmt -- optional format from pyFNR.Util, tokens are then words of fmt
+		(rank-then-encipher), otherwise ints from 0..domain.
+	table -- whether composed permutation is precomputed: True (in
+		constructor), False or None (default) for domains of less than
+		TABLE_SIZE elements after domain + 1 tokens are enciphered.
+	"""
+	_table = None
+	_auto_table = False
+	_enciphered = 0
+
+	def __init__(self, old, new, fmt=None, table=None):
+		if old.domain != new.domain:
+			raise ValueError("Domains differ: " + str(old.domain) + " and " + str(new.domain))
+		if fmt is not None and fmt.get_words_count() - 1 != old.domain:
+			raise ValueError("Domain does not match format with " + str(fmt.get_words_count()) + " words")
+		self.old = old
+		self.new = new
+		self.fmt = fmt
+		self.domain = old.domain
+		# own counters, batch_stats() of old and new count their own traffic
+		self._batch_stats = [0, 0, 0, 0]
+		if table:
+			self._table = self._build_table()
+		elif table is None:
+			self._auto_table = self.domain < TABLE_SIZE
+
+	def _build_table(self):
+		# table[old.encrypt(p)] = new.encrypt(p) for all plaintexts p
+		numpy = _optional.numpy()
+		if numpy is not None and self.domain < 2**64:
+			plaintexts = numpy.arange(self.domain + 1, dtype=numpy.uint64)
+			table = numpy.empty(self.domain + 1, dtype=numpy.uint64)
+			table[self.old._engine.encrypt_array(plaintexts)] = self.new._engine.encrypt_array(plaintexts)
+			return table
+		plaintexts = list(range(self.domain + 1))
+		table = [0] * (self.domain + 1)
+		for x, y in zip(self.old._engine.encrypt_batch(plaintexts), self.new._engine.encrypt_batch(plaintexts)):
+			table[x] = y
+		return table
+
+	def rekey(self, token):
+		"""
+		rekey(token) -> token
+
+		Re-encrypts one token (int or word of fmt).
+		"""
+		value = token if self.fmt is None else self.fmt.rank(token)
+		self._count(1)
+		if self._table is not None:
+			value = int(self._table[value])
+		else:
+			value = self.new._engine.encrypt(self.old._engine.decrypt(value))
+		return value if self.fmt is None else self.fmt.unrank(value)
+
+	def rekey_batch(self, tokens):
+		"""
+		rekey_batch(iterable of tokens) -> list of tokens
+
+		Re-encrypts all given tokens (ints or words of fmt). Batches with
+		many repeated tokens are deduplicated according to new.dedup, see
+		batch_stats().
+		"""
+		if self.fmt is None:
+			return self.new._deduplicated(list(tokens), self._rekey_ints, self._batch_stats)
+		fmt = self.fmt
+		return self.new._deduplicated(list(tokens), lambda words: fmt.unrank_batch(self._rekey_ints(fmt.rank_batch(words))), self._batch_stats)
+
+	def rekey_array(self, values):
+		"""
+		rekey_array(numpy.ndarray) -> numpy.ndarray
+
+		Re-encrypts all values of given NumPy integer array (domain <
+		2**64) and returns uint64 array. Requires NumPy.
+		"""
+		values = self.new._check_array(values)
+		self._count(len(values))
+		if self._table is not None:
+			numpy = _optional.numpy()
+			return numpy.asarray(self._table, dtype=numpy.uint64)[values]
+		return self.new._deduplicated_array(values, self._rekey_array, self._batch_stats)
+
+	def batch_stats(self):
+		"""
+		batch_stats() -> dict
+
+		Returns statistics of rekey_batch() and rekey_array() calls of this
+		Rekeyer, see FNR2.batch_stats().
+		"""
+		import pyFNR
+		return pyFNR._batch_report(self._batch_stats)
+
+	def _count(self, enciphered):
+		# builds table after as many tokens as domain has elements
+		if self._auto_table:
+			self._enciphered += enciphered
+			if self._enciphered > self.domain:
+				self._auto_table = False
+				self._table = self._build_table()
+
+	def _rekey_ints(self, values):
+		self._count(len(values))
+		if self._table is not None:
+			if isinstance(self._table, list):
+				return [self._table[v] for v in values]
+			numpy = _optional.numpy()
+			return self._table[numpy.asarray(values, dtype=numpy.uint64)].tolist()
+		return self.new._engine.encrypt_batch(self.old._engine.decrypt_batch(values))
+
+	def _rekey_array(self, values):
+		return self.new._engine.encrypt_array(self.old._engine.decrypt_array(values))
+
+	def stream(self, tokens, checkpoint=None, chunk_size=CHUNK_SIZE):
+		"""
+		stream(iterable of tokens[, checkpoint[, chunk_size]]) -> generator of lists
+
+		Lazily re-encrypts given tokens in chunks of chunk_size tokens and
+		yields lists of re-encrypted tokens.
+
+		With checkpoint (path of a JSON file) number of finished tokens is
+		saved when the consumer asks for the next chunk, i.e. after it has
+		stored the previous one. If the checkpoint exists, already finished
+		tokens of the same input are skipped, so a restarted rotation
+		continues where it stopped.
+		"""
+		state = _load_checkpoint(checkpoint, {'rows': 0})
+		tokens = iter(tokens)
+		if state['rows']:
+			# consume finished prefix of input
+			next(itertools.islice(tokens, state['rows'], state['rows']), None)
+		while True:
+			chunk = list(itertools.islice(tokens, chunk_size))
+			if not chunk:
+				break
+			yield self.rekey_batch(chunk)
+			state['rows'] += len(chunk)
+			_save_checkpoint(checkpoint, state)
+
+	def rekey_file(self, source, target, checkpoint=None, chunk_size=CHUNK_SIZE):
+		"""
+		rekey_file(str, str[, checkpoint[, chunk_size]]) -> int
+
+		Re-encrypts text file source with one token per line into file
+		target and returns number of re-encrypted lines.
+
+		With checkpoint (path of a JSON file) byte offsets of both files
+		are saved after every chunk is written and synced to disk. If the
+		checkpoint exists, reading continues at its offset of source and
+		target is truncated to its offset, so lines are neither lost nor
+		duplicated by an interrupted run. If target was removed (or is
+		shorter than its offset), rotation starts again from the first
+		line. Running again a finished rotation does nothing.
+		"""
+		state = _load_checkpoint(checkpoint, {'source': source, 'target': target, 'rows': 0, 'source_offset': 0, 'target_offset': 0})
+		if state['source'] != source or state['target'] != target:
+			raise ValueError("Checkpoint belongs to other files: " + state['source'] + " -> " + state['target'])
+		if state['target_offset'] and (not os.path.exists(target) or os.path.getsize(target) < state['target_offset']):
+			# target was removed or truncated since the checkpoint, start again
+			state.update(rows=0, source_offset=0, target_offset=0)
+		rows = 0
+		with open(source, 'rb') as src, open(target, 'r+b' if state['target_offset'] else 'wb') as dst:
+			src.seek(state['source_offset'])
+			dst.seek(state['target_offset'])
+			dst.truncate()
+			while True:
+				lines = list(itertools.islice(src, chunk_size))
+				if not lines:
+					break
+				tokens = [line.rstrip(b'\r\n').decode('utf-8') for line in lines]
+				if self.fmt is None:
+					tokens = [int(token) for token in tokens]
+				dst.write(''.join(str(token) + '\n' for token in self.rekey_batch(tokens)).encode('utf-8'))
+				dst.flush()
+				os.fsync(dst.fileno())
+				rows += len(lines)
+				state['rows'] += len(lines)
+				state['source_offset'] += sum(len(line) for line in lines)
+				state['target_offset'] = dst.tell()
+				_save_checkpoint(checkpoint, state)
+		return rows
+
+def _load_checkpoint(path, state):
+	if path is not None and os.path.exists(path):
+		with open(path) as f:
+			state.update(json.load(f))
+	return state
+
+def _save_checkpoint(path, state):
+	# written atomically: old or new checkpoint survives interruption
+	if path is None:
+		return
+	with open(path + '.tmp', 'w') as f:
+		json.dump(state, f)
+		f.flush()
+		os.fsync(f.fileno())
+	os.replace(path + '.tmp', path)
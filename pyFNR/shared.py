@@ -0,0 +1,256 @@
+"""
+Sharing of compiled FPE_Format tables between processes.
+
+Parent process builds format once and publishes its tables (transition
+table and counting table T) into shared memory or a file, worker
+processes attach them read-only instead of building their own copies:
+
+	import pyFNR.shared
+	tables = pyFNR.shared.publish(fmt)              # in parent
+	fmt = pyFNR.shared.attach(tables.name)          # in workers
+	...
+	tables.close(); tables.unlink()                 # in parent at exit
+
+With path argument tables are written to a file and attached by mmap,
+which also works between unrelated processes and survives restarts.
+
+Attached format is an instance of the class of the published one (e.g.
+LuhnR) if that class can be imported by the worker, otherwise of
+FPE_Format. Subclasses overriding rank() or unrank() need state beyond
+the tables and cannot be published.
+
+Counts of the counting table are stored by columns (word lengths) with
+fixed width of limbs 64-bit limbs (little-endian) for all entries,
+transitions as int32 (little-endian). Attached format reads counts
+directly from the shared buffer: tables with one limb are indexed by
+memoryview, wider counts are decoded on access. Big-endian hosts copy
+and byteswap transitions and one-limb columns instead. Binary layout:
+
+	MAGIC, uint32 header size, JSON header, padding to 8 bytes,
+	transitions (states x symbols int32), padding to 8 bytes,
+	counts ((N + 1) x states x limbs uint64)
+"""
+import array
+import json
+import struct
+import sys
+
+from pyFNR.Util import FPE_Format
+
+MAGIC = b'PYFNRTBL'
+VERSION = 2
+LIMB_SIZE = 8 # bytes
+
+# names of shared memory blocks published by this process
+_published = set()
+# methods which attached formats take from FPE_Format
+_TABLE_METHODS = ('rank', 'unrank', 'rank_batch', 'unrank_batch')
+
+def _pad(size):
+	return (size + LIMB_SIZE - 1) // LIMB_SIZE * LIMB_SIZE
+
+def _cast(view, typecode):
+	# little-endian items of view, copied and byteswapped on big-endian hosts
+	if sys.byteorder == 'little':
+		return view.cast(typecode)
+	items = array.array(typecode, bytes(view))
+	items.byteswap()
+	return items
+
+def dumps(fmt):
+	"""
+	dumps(FPE_Format) -> bytes
+
+	Serializes compiled tables of given DFA based format.
+	"""
+	cls = fmt.__class__
+	if getattr(fmt, '_transitions', None) is None:
+		raise ValueError('Format has no DFA tables: ' + cls.__name__)
+	for name in _TABLE_METHODS:
+		if getattr(cls, name) is not getattr(FPE_Format, name):
+			raise ValueError('Format overrides ' + name + '(), its tables cannot be shared: ' + cls.__name__)
+	N = fmt.N
+	columns = fmt._columns[:N + 1]
+	states = len(fmt._transitions)
+	limbs = max(1, (max(max(column) if len(column) else 0 for column in columns).bit_length() + 63) // 64)
+	header = {
+		'version': VERSION,
+		'class': cls.__module__ + ':' + cls.__qualname__,
+		'N': N,
+		'states': states,
+		'sigma': fmt._sigma,
+		'q0': fmt._q0,
+		'invalid_q': fmt._invalid_q,
+		'limbs': limbs,
+		'tail_start': fmt._tail_start,
+		'tail_state': getattr(fmt, '_tail_state', None),
+		'tail_chars': fmt._tail_chars,
+	}
+	header = json.dumps(header).encode('utf-8')
+	data = bytearray(MAGIC + struct.pack('<I', len(header)) + header)
+	data += bytearray(_pad(len(data)) - len(data))
+	data += struct.pack('<%di' % (states * len(fmt._sigma)), *[t for row in fmt._transitions for t in row])
+	data += bytearray(_pad(len(data)) - len(data))
+	width = limbs * LIMB_SIZE
+	for column in columns:
+		if limbs == 1 and isinstance(column, array.array) and sys.byteorder == 'little':
+			data += column.tobytes()
+		else:
+			data += b''.join(int(v).to_bytes(width, 'little') for v in column)
+	return bytes(data)
+
+def loads(buffer):
+	"""
+	loads(buffer) -> FPE_Format
+
+	Creates format with tables backed by given buffer (bytes, mmap or
+	shared memory), tables are not copied.
+	"""
+	view = memoryview(buffer).toreadonly()
+	if bytes(view[:len(MAGIC)]) != MAGIC:
+		raise ValueError('Invalid format tables')
+	offset = len(MAGIC)
+	size, = struct.unpack('<I', view[offset:offset + 4])
+	offset += 4
+	header = json.loads(bytes(view[offset:offset + size]).decode('utf-8'))
+	if header['version'] != VERSION:
+		raise ValueError('Unsupported version of format tables: ' + str(header['version']))
+	offset = _pad(offset + size)
+	N = header['N']
+	states = header['states']
+	symbols = len(header['sigma'])
+	transitions = _cast(view[offset:offset + 4 * states * symbols], 'i')
+	offset = _pad(offset + 4 * states * symbols)
+	limbs = header['limbs']
+	column_size = states * limbs * LIMB_SIZE
+	if limbs == 1:
+		columns = [_cast(view[offset + i * column_size:offset + (i + 1) * column_size], 'Q') for i in range(N + 1)]
+	else:
+		columns = [_LimbColumn(view[offset + i * column_size:offset + (i + 1) * column_size], limbs * LIMB_SIZE) for i in range(N + 1)]
+
+	fmt = FPE_Format.__new__(_format_class(header.get('class')))
+	fmt.DFA = None
+	fmt.N = N
+	fmt._columns = columns
+	fmt._transitions = [transitions[q * symbols:(q + 1) * symbols] for q in range(states)]
+	fmt._sigma = header['sigma']
+	fmt._sigma_ord = dict((a, j) for j, a in enumerate(fmt._sigma))
+	fmt._q0 = header['q0']
+	fmt._invalid_q = header['invalid_q']
+	fmt._tail_start = header['tail_start']
+	fmt._tail_chars = header['tail_chars']
+	fmt._tail_digits = [dict((a, d) for d, a in enumerate(chars)) for chars in fmt._tail_chars]
+	if header['tail_state'] is not None:
+		fmt._tail_state = header['tail_state']
+	fmt.words_count = columns[N][fmt._q0]
+	return fmt
+
+
+def _format_class(name):
+	# class of published format if it can be imported, otherwise FPE_Format
+	if name is None:
+		return FPE_Format
+	import importlib
+	module, qualname = name.split(':')
+	try:
+		cls = importlib.import_module(module)
+		for attribute in qualname.split('.'):
+			cls = getattr(cls, attribute)
+	except (ImportError, AttributeError):
+		return FPE_Format
+	if not isinstance(cls, type) or not issubclass(cls, FPE_Format):
+		return FPE_Format
+	if any(getattr(cls, name) is not getattr(FPE_Format, name) for name in _TABLE_METHODS):
+		raise ValueError('Format overrides rank() or unrank(), its tables cannot be shared: ' + name)
+	return cls
+
+
+class _LimbColumn(object):
+	# column of counting table with counts wider than one limb
+
+	def __init__(self, view, width):
+		self._view = view
+		self._width = width
+
+	def __getitem__(self, i):
+		return int.from_bytes(self._view[i * self._width:(i + 1) * self._width], 'little')
+
+	def __len__(self):
+		return len(self._view) // self._width
+
+
+class SharedTables(object):
+	"""
+	SharedTables -> handle of published tables
+
+	Returned by publish(). Attributes name (shared memory block) or path
+	(file) identify tables for attach(). Publisher should call close()
+	and unlink() when workers do not need tables anymore.
+	"""
+
+	def __init__(self, name=None, path=None, size=0, shm=None):
+		self.name = name
+		self.path = path
+		self.size = size
+		self._shm = shm
+
+	def close(self):
+		if self._shm is not None:
+			self._shm.close()
+
+	def unlink(self):
+		if self._shm is not None:
+			self._shm.unlink()
+			_published.discard(self.name)
+		elif self.path is not None:
+			import os
+			os.unlink(self.path)
+
+def publish(fmt, name=None, path=None):
+	"""
+	publish(FPE_Format[, name[, path]]) -> SharedTables
+
+	Publishes tables of given format into new block of
+	multiprocessing.shared_memory (with optional name) or into file at
+	given path.
+	"""
+	data = dumps(fmt)
+	if path is not None:
+		with open(path, 'wb') as f:
+			f.write(data)
+		return SharedTables(path=path, size=len(data))
+	from multiprocessing import shared_memory
+	shm = shared_memory.SharedMemory(name=name, create=True, size=len(data))
+	shm.buf[:len(data)] = data
+	_published.add(shm.name)
+	return SharedTables(name=shm.name, size=len(data), shm=shm)
+
+def attach(name=None, path=None):
+	"""
+	attach([name[, path]]) -> FPE_Format
+
+	Attaches tables published under given shared memory name or at given
+	path read-only and returns format using them. Shared memory (or map
+	of file) is kept open while the format exists.
+	"""
+	if path is not None:
+		import mmap
+		with open(path, 'rb') as f:
+			buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+		fmt = loads(buffer)
+		fmt._shared = buffer
+		return fmt
+	from multiprocessing import shared_memory
+	try:
+		# publisher owns the block, attached process must not unlink it
+		shm = shared_memory.SharedMemory(name=name, track=False)
+	except TypeError:
+		# before Python 3.13 attaching registers the block with resource
+		# tracker, which would unlink it when this process exits
+		shm = shared_memory.SharedMemory(name=name)
+		if getattr(shared_memory, '_USE_POSIX', False) and shm.name not in _published:
+			from multiprocessing import resource_tracker
+			resource_tracker.unregister(shm._name, 'shared_memory')
+	fmt = loads(shm.buf)
+	fmt._shared = shm
+	return fmt
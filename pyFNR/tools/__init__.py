@@ -0,0 +1,5 @@
+"""
+Tools built on pyFNR for common pseudonymisation jobs.
+
+pcap -- streaming anonymiser of IP addresses in pcap captures.
+"""
@@ -0,0 +1,321 @@
+"""
+Streaming anonymiser of IP addresses in packet captures.
+
+Reads classic pcap files (microsecond or nanosecond timestamps, both
+byte orders) and writes copies in which source and destination
+addresses of IPv4 and IPv6 packets are enciphered by FNR, i.e. replaced
+by consistent pseudonyms which can be deciphered again with the same key:
+
+	import pyFNR, pyFNR.tools.pcap
+	anonymiser = pyFNR.tools.pcap.Anonymiser(pyFNR.FNR(key, tweak, 32), pyFNR.FNR(key, tweak, 128))
+	stats = anonymiser.anonymise('capture.pcap', 'anonymised.pcap')
+
+or from the command line:
+
+	python -m pyFNR.tools.pcap --key KEY capture.pcap anonymised.pcap
+
+Packets are rewritten in place in chunks of chunk_size packets, so memory
+use is bounded by the chunk and by the cache of address pseudonyms
+(repeated flows hit the cache). Distinct uncached addresses of a chunk
+are enciphered at once by FNR.encrypt_packed(). IPv4 header checksums
+and TCP, UDP and ICMPv6 checksums are updated incrementally (RFC 1624),
+so they stay valid (or stay wrong, e.g. in captures with checksum
+offloading) without access to the whole payload of truncated packets.
+
+Supported link types are Ethernet (with VLAN tags), Linux cooked
+capture, BSD loopback and raw IPv4/IPv6. Only addresses of the outermost
+IP header are rewritten; addresses inside payloads (ICMP errors,
+tunnels, application protocols) and other link types are copied as they
+are.
+"""
+import argparse
+import contextlib
+import struct
+import sys
+import time
+
+CHUNK_SIZE = 4096 # packets rewritten at once
+CACHE_SIZE = 65536 # cached address pseudonyms
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_IPV6 = 229
+
+_MAGICS = {
+	b'\xd4\xc3\xb2\xa1': '<', b'\xa1\xb2\xc3\xd4': '>', # microseconds
+	b'\x4d\x3c\xb2\xa1': '<', b'\xa1\xb2\x3c\x4d': '>', # nanoseconds
+}
+_HEADER_SIZE = 24
+_RECORD_SIZE = 16
+
+_ETHERTYPES = (0x0800, 0x86dd) # IPv4, IPv6
+_VLAN_ETHERTYPES = (0x8100, 0x88a8, 0x9100)
+_UDP = 17
+_CHECKSUMS = {6: 16, 17: 6} # protocol -> offset of checksum in header (TCP, UDP)
+_CHECKSUMS_IPV6 = {6: 16, 17: 6, 58: 2} # ICMPv6 checksum covers addresses too
+_IPV6_EXTENSIONS = (0, 43, 44, 51, 60) # hop-by-hop, routing, fragment, AH, destination
+
+
+class Anonymiser(object):
+	"""
+	Anonymiser([ipv4[, ipv6[, cache[, decrypt]]]]) -> Anonymiser object
+
+	Rewrites IP addresses of packets by FNR.
+
+	Keyword arguments:
+	ipv4 -- FNR instance with block_size 32 for IPv4 addresses, or None
+		to keep IPv4 addresses.
+	ipv6 -- FNR instance with block_size 128 for IPv6 addresses, or None
+		to keep IPv6 addresses.
+	cache -- int with maximal number of cached pseudonyms (default
+		CACHE_SIZE) or pyFNR.cache.LRUCache or pyFNR.cache.ClockCache
+		instance, or None to disable caching.
+	decrypt -- if True, pseudonyms are deciphered back to addresses.
+	"""
+
+	def __init__(self, ipv4=None, ipv6=None, cache=CACHE_SIZE, decrypt=False):
+		for fnr, block_size in ((ipv4, 32), (ipv6, 128)):
+			if fnr is not None and fnr._block_size != block_size:
+				raise ValueError("FNR with block size " + str(block_size) + " expected: " + str(fnr._block_size))
+		if isinstance(cache, int):
+			from pyFNR.cache import LRUCache
+			cache = LRUCache(cache)
+		self._fnr = {4: ipv4, 6: ipv6}
+		self.cache = cache
+		self.decrypt = decrypt
+		self.enciphered = 0
+
+	def map_addresses(self, addresses):
+		"""
+		map_addresses(iterable of bytes) -> dict
+
+		Returns pseudonyms (or addresses if decrypt) of given packed IPv4 (4
+		bytes) or IPv6 (16 bytes) addresses in network byte order. Uncached
+		addresses are enciphered at once.
+		"""
+		mapping = {}
+		missing = {4: [], 16: []}
+		for address in addresses:
+			if address in mapping:
+				continue
+			cached = None
+			if self.cache is not None:
+				cached = self.cache.get_inverse(address) if self.decrypt else self.cache.get(address)
+			if cached is None:
+				missing[len(address)].append(address)
+				mapping[address] = None
+			else:
+				mapping[address] = cached
+		for size, version in ((4, 4), (16, 6)):
+			if not missing[size]:
+				continue
+			fnr = self._fnr[version]
+			packed = (fnr.decrypt_packed if self.decrypt else fnr.encrypt_packed)(b''.join(missing[size]))
+			self.enciphered += len(missing[size])
+			for i, address in enumerate(missing[size]):
+				mapped = bytes(packed[i * size:(i + 1) * size])
+				mapping[address] = mapped
+				if self.cache is not None:
+					if self.decrypt:
+						self.cache.put(mapped, address)
+					else:
+						self.cache.put(address, mapped)
+		return mapping
+
+	def rewrite(self, packets, linktype=LINKTYPE_ETHERNET):
+		"""
+		rewrite(list of bytearrays[, linktype]) -> int
+
+		Rewrites addresses and checksums of given packets (data of pcap
+		records with given link type) in place and returns number of
+		rewritten packets.
+		"""
+		parsed = []
+		addresses = []
+		for packet in packets:
+			offset = _network_offset(packet, linktype)
+			if offset is None:
+				continue
+			fields = _ip_fields(packet, offset)
+			if fields is None or self._fnr[fields[0]] is None:
+				continue
+			version, position, size, checksums = fields
+			old = bytes(packet[position:position + 2 * size])
+			parsed.append((packet, position, size, old, checksums))
+			addresses.append(old[:size])
+			addresses.append(old[size:])
+		mapping = self.map_addresses(addresses)
+		for packet, position, size, old, checksums in parsed:
+			new = mapping[old[:size]] + mapping[old[size:]]
+			packet[position:position + 2 * size] = new
+			if checksums:
+				difference = int.from_bytes(new, 'big') - int.from_bytes(old, 'big')
+				for checksum, udp in checksums:
+					_adjust_checksum(packet, checksum, difference, udp)
+		return len(parsed)
+
+	def anonymise(self, source, target, chunk_size=CHUNK_SIZE):
+		"""
+		anonymise(source, target[, chunk_size]) -> dict
+
+		Reads pcap file source, rewrites addresses of its packets in chunks
+		of chunk_size packets and writes them to pcap file target. Source
+		and target are paths or binary file objects. Returns statistics:
+		packets, rewritten (packets), enciphered (addresses), seconds,
+		packets_per_second and cache hit_rate.
+		"""
+		start = time.perf_counter()
+		enciphered = self.enciphered
+		packets = rewritten = 0
+		# files opened here are closed even if opening the other one fails
+		with contextlib.ExitStack() as stack:
+			src = stack.enter_context(open(source, 'rb')) if isinstance(source, str) else source
+			dst = stack.enter_context(open(target, 'wb')) if isinstance(target, str) else target
+			header = src.read(_HEADER_SIZE)
+			order, linktype = _parse_header(header)
+			dst.write(header)
+			while True:
+				records = _read_records(src, order, chunk_size)
+				if not records:
+					break
+				rewritten += self.rewrite([packet for _, packet in records], linktype)
+				packets += len(records)
+				dst.write(b''.join(record + packet for record, packet in records))
+		seconds = time.perf_counter() - start
+		return {
+			'packets': packets,
+			'rewritten': rewritten,
+			'enciphered': self.enciphered - enciphered,
+			'seconds': seconds,
+			'packets_per_second': packets / seconds if seconds else 0.0,
+			'hit_rate': self.cache.hit_rate() if self.cache is not None else 0.0,
+		}
+
+def _parse_header(header):
+	# returns byte order and link type of pcap global header
+	if len(header) < _HEADER_SIZE or bytes(header[:4]) not in _MAGICS:
+		raise ValueError("Not a classic pcap file")
+	order = _MAGICS[bytes(header[:4])]
+	return order, struct.unpack(order + 'I', header[20:24])[0] & 0x0fffffff
+
+def _read_records(src, order, count):
+	# list of (record header, packet data) of at most count records
+	records = []
+	while len(records) < count:
+		record = src.read(_RECORD_SIZE)
+		if not record:
+			break
+		if len(record) < _RECORD_SIZE:
+			raise ValueError("Truncated pcap record header")
+		length = struct.unpack(order + 'I', record[8:12])[0]
+		packet = bytearray(src.read(length))
+		if len(packet) < length:
+			raise ValueError("Truncated pcap record: " + str(len(packet)) + " of " + str(length) + " bytes")
+		records.append((record, packet))
+	return records
+
+def _network_offset(packet, linktype):
+	# offset of IP header in packet or None
+	if linktype == LINKTYPE_ETHERNET:
+		offset = 12
+		while offset + 2 <= len(packet) and (packet[offset] << 8 | packet[offset + 1]) in _VLAN_ETHERTYPES:
+			offset += 4
+		if offset + 2 > len(packet) or (packet[offset] << 8 | packet[offset + 1]) not in _ETHERTYPES:
+			return None
+		return offset + 2
+	if linktype == LINKTYPE_LINUX_SLL:
+		if len(packet) < 16 or (packet[14] << 8 | packet[15]) not in _ETHERTYPES:
+			return None
+		return 16
+	if linktype == LINKTYPE_NULL:
+		return 4 # address family in host byte order, IP version decides
+	if linktype in (LINKTYPE_RAW, LINKTYPE_IPV4, LINKTYPE_IPV6):
+		return 0
+	return None
+
+def _ip_fields(packet, offset):
+	# (IP version, offset of source address followed by destination
+	# address, address size, [(checksum offset, udp)]) or None
+	if offset >= len(packet):
+		return None
+	version = packet[offset] >> 4
+	if version == 4:
+		if offset + 20 > len(packet):
+			return None
+		checksums = [(offset + 10, False)]
+		protocol = packet[offset + 9]
+		fragment = (packet[offset + 6] & 0x1f) << 8 | packet[offset + 7]
+		transport = offset + (packet[offset] & 0x0f) * 4
+		offsets = _CHECKSUMS
+		addresses = offset + 12
+		size = 4
+	elif version == 6:
+		if offset + 40 > len(packet):
+			return None
+		checksums = []
+		protocol = packet[offset + 6]
+		fragment = 0
+		transport = offset + 40
+		while protocol in _IPV6_EXTENSIONS and transport + 8 <= len(packet):
+			if protocol == 44:
+				fragment = (packet[transport + 2] << 8 | packet[transport + 3]) >> 3
+				length = 8
+			elif protocol == 51:
+				length = (packet[transport + 1] + 2) * 4
+			else:
+				length = (packet[transport + 1] + 1) * 8
+			protocol = packet[transport]
+			transport += length
+		offsets = _CHECKSUMS_IPV6
+		addresses = offset + 8
+		size = 16
+	else:
+		return None
+	# only first fragments carry transport headers
+	if fragment == 0 and protocol in offsets and transport + offsets[protocol] + 2 <= len(packet):
+		checksums.append((transport + offsets[protocol], protocol == _UDP))
+	return version, addresses, size, checksums
+
+def _adjust_checksum(packet, position, difference, udp):
+	# incremental update of Internet checksum (RFC 1624) after covered
+	# 16-bit words changed by difference of their big-endian values, sums
+	# of 16-bit words are congruent with big-endian values modulo 0xffff
+	checksum = packet[position] << 8 | packet[position + 1]
+	if udp and checksum == 0:
+		return # UDP over IPv4 without checksum
+	total = (0xffff - checksum + difference) % 0xffff
+	if total:
+		checksum = 0xffff - total
+	else:
+		checksum = 0xffff if udp else 0 # UDP transmits zero as 0xffff
+	packet[position] = checksum >> 8
+	packet[position + 1] = checksum & 0xff
+
+def main(argv):
+	import pyFNR
+	parser = argparse.ArgumentParser(description='Anonymise IP addresses of pcap file by FNR')
+	parser.add_argument('source', help='input pcap file')
+	parser.add_argument('target', help='output pcap file')
+	parser.add_argument('--key', required=True, help='FNR key (password)')
+	parser.add_argument('--tweak', default='tweak-is-string', help='FNR tweak')
+	parser.add_argument('--backend', help='cipher backend (default ctypes, see pyFNR.backends)')
+	parser.add_argument('--decrypt', action='store_true', help='restore addresses of anonymised file')
+	parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='packets rewritten at once')
+	parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='cached address pseudonyms')
+	args = parser.parse_args(argv)
+	ipv4 = pyFNR.FNR(args.key, args.tweak, 32, backend=args.backend)
+	ipv6 = pyFNR.FNR(args.key, args.tweak, 128, backend=args.backend)
+	try:
+		anonymiser = Anonymiser(ipv4, ipv6, args.cache_size or None, args.decrypt)
+		stats = anonymiser.anonymise(args.source, args.target, args.chunk_size)
+	finally:
+		ipv4.close()
+		ipv6.close()
+	print(str(stats['packets']) + ' packets (' + str(stats['rewritten']) + ' rewritten) in {0:.2f}s: {1:.0f} packets/s, {2} addresses enciphered, cache hit rate {3:.1%}'.format(stats['seconds'], stats['packets_per_second'], stats['enciphered'], stats['hit_rate']))
+	return 0
+
+if __name__ == '__main__':
+	sys.exit(main(sys.argv[1:]))
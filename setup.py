@@ -4,4 +4,8 @@ from distutils.core import setup
 
 setup(name='pyFNR',
       version='0.8',
-      py_modules=['pyFNR/__init__', 'pyFNR/Util'])
+      py_modules=['pyFNR/__init__', 'pyFNR/Util', 'pyFNR/cache',
+                  'pyFNR/backends', 'pyFNR/_optional', 'pyFNR/kdf',
+                  'pyFNR/metrics', 'pyFNR/engines', 'pyFNR/arrow', 'pyFNR/codegen',
+                  'pyFNR/pandas', 'pyFNR/shared',
+                  'pyFNR/rekey', 'pyFNR/pool', 'pyFNR/tools/__init__', 'pyFNR/tools/pcap'])
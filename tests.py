@@ -3,8 +3,30 @@ import math
 import random
 import string
 import ctypes
+import binascii
+import subprocess
+import sys
 import pyFNR
 import pyFNR.Util
+import pyFNR.cache
+import pyFNR.backends
+import pyFNR.kdf
+import pyFNR.metrics
+import pyFNR._optional
+import pyFNR.arrow
+import pyFNR.pandas
+import pyFNR.shared
+import pyFNR.rekey
+import pyFNR.tools.pcap
+import pyFNR.pool
+import pyFNR.codegen
+import itertools
+import os
+import tempfile
+import struct
+import threading
+import time
+import types
 
 TEST_COUNT = 10
 
@@ -266,6 +288,518 @@ class TestFNR2Crypt(unittest.TestCase):
 		# check nonidentity transformation
 		self.assertEqual(nonidentity > 9*identity, True)
 
+class TestFNRBatch(unittest.TestCase):
+
+	def setUp(self):
+		# prepare instances for some interesting block sizes
+		self.fnr = [(i, pyFNR.FNR(block_size=i)) for i in (1, 7, 8, 63, 64, 65, 127, 128)]
+
+	def tearDown(self):
+		for fnr in self.fnr:
+			fnr[1].close()
+
+	def test_batch_encryption_and_decryption(self):
+		for block_size, fnr in self.fnr:
+			for count in (TEST_COUNT, 128):
+				ints = Helper.generate_random_ints(0, 2**block_size, count)
+				c = fnr.encrypt_ints(ints)
+				# check batch encryption is the same as single encryption
+				self.assertEqual(c, [fnr.encrypt_int(p) for p in ints])
+				self.assertEqual(fnr.decrypt_ints(c), ints)
+
+	def test_packed_encryption_and_decryption(self):
+		for block_size, fnr in self.fnr:
+			blocks = Helper.generate_random_bytearrays(block_size, TEST_COUNT)
+			c = fnr.encrypt_packed(b''.join(blocks))
+			self.assertEqual(c, b''.join(fnr.encrypt_bytes(b) for b in blocks))
+			self.assertEqual(fnr.decrypt_packed(c), b''.join(blocks))
+		self.assertRaises(ValueError, self.fnr[-1][1].encrypt_packed, b'\x00' * 17)
+
+class TestFNR2Batch(unittest.TestCase):
+
+	def setUp(self):
+		# prepare one instance for 10 random domains
+		domains = Helper.generate_random_ints(1, 2**128, 10)
+		self.fnr2 = [(i, pyFNR.FNR2(domain=i)) for i in domains]
+
+	def tearDown(self):
+		for fnr2 in self.fnr2:
+			fnr2[1].close()
+
+	def test_batch_encryption_and_decryption(self):
+		for domain, fnr2 in self.fnr2:
+			ints = Helper.generate_random_ints(0, domain+1, 4 * TEST_COUNT)
+			c = fnr2.encrypt_batch(ints)
+			# check batch encryption is the same as single encryption
+			self.assertEqual(c, [fnr2.encrypt(p) for p in ints])
+			self.assertEqual(fnr2.decrypt_batch(c), ints)
+
+class TestFNR2Array(unittest.TestCase):
+
+	def setUp(self):
+		# prepare instances for small domain and the largest domain of arrays
+		self.numpy = pyFNR._optional.numpy()
+		if self.numpy is None:
+			self.skipTest('NumPy is not installed')
+		self.fnr2 = pyFNR.FNR2(domain=10**6)
+		self.fnr2_64 = pyFNR.FNR2(domain=2**64-1)
+
+	def tearDown(self):
+		self.fnr2.close()
+		self.fnr2_64.close()
+
+	def test_array_equals_batch(self):
+		for fnr2 in (self.fnr2, self.fnr2_64):
+			ints = Helper.generate_random_ints(0, min(fnr2.domain, 2**63), 100)
+			ciphertexts = fnr2.encrypt_array(self.numpy.array(ints, dtype=self.numpy.uint64))
+			self.assertEqual(ciphertexts.tolist(), fnr2.encrypt_batch(ints))
+			self.assertEqual(fnr2.decrypt_array(ciphertexts).tolist(), ints)
+
+	def test_invalid_arrays(self):
+		self.assertRaises(ValueError, self.fnr2.encrypt_array, self.numpy.array([-1, 2]))
+		self.assertRaises(ValueError, self.fnr2.encrypt_array, self.numpy.array([10**6 + 1]))
+		self.assertRaises(ValueError, self.fnr2.encrypt_array, self.numpy.array([1.0]))
+
+class TestColumns(unittest.TestCase):
+
+	def setUp(self):
+		# prepare instances for integer and ECV columns
+		self.pyarrow = pyFNR._optional.load('pyarrow')
+		self.pandas = pyFNR._optional.load('pandas')
+		self.ECV = pyFNR.Util.ECV()
+		self.fnr2 = pyFNR.FNR2(domain=10**6)
+		self.fnr2_ECV = pyFNR.FNR2(domain=self.ECV.get_words_count()-1)
+		self.plates = ['KE007JB', None, 'KE007JB', 'BA123AB']
+
+	def tearDown(self):
+		self.fnr2.close()
+		self.fnr2_ECV.close()
+
+	def test_arrow_columns(self):
+		if self.pyarrow is None:
+			self.skipTest('pyarrow is not installed')
+		pa = self.pyarrow
+		ints = pa.chunked_array([pa.array([1, None, 10**6], type=pa.int32()), pa.array([7], type=pa.int32()).slice(0)])
+		encrypted = pyFNR.arrow.encrypt(self.fnr2, ints)
+		self.assertEqual(encrypted.type, pa.int32())
+		self.assertEqual(encrypted.to_pylist()[1], None)
+		self.assertEqual(encrypted.to_pylist()[0], self.fnr2.encrypt(1))
+		self.assertEqual(pyFNR.arrow.decrypt(self.fnr2, encrypted).to_pylist(), ints.to_pylist())
+		plates = pa.array(self.plates)
+		for array in (plates, plates.dictionary_encode()):
+			encrypted = pyFNR.arrow.encrypt(self.fnr2_ECV, array, self.ECV)
+			self.assertEqual(encrypted.type, array.type)
+			self.assertEqual(encrypted.to_pylist()[0], encrypted.to_pylist()[2])
+			self.assertEqual(pyFNR.arrow.decrypt(self.fnr2_ECV, encrypted, self.ECV).to_pylist(), self.plates)
+		self.assertRaises(ValueError, pyFNR.arrow.encrypt, self.fnr2, plates)
+
+	def test_pandas_columns(self):
+		if self.pandas is None:
+			self.skipTest('pandas is not installed')
+		pd = self.pandas
+		for series in (pd.Series([1, 2, 10**6]), pd.Series([1, None, 10**6], dtype='Int64')):
+			encrypted = pyFNR.pandas.encrypt(self.fnr2, series)
+			self.assertEqual(encrypted.dtype, series.dtype)
+			self.assertEqual(encrypted.iloc[0], self.fnr2.encrypt(1))
+			self.assertEqual(pyFNR.pandas.decrypt(self.fnr2, encrypted).tolist(), series.tolist())
+		plates = pd.Series(self.plates)
+		for series in (plates, plates.astype('category')):
+			encrypted = pyFNR.pandas.encrypt(self.fnr2_ECV, series, self.ECV)
+			self.assertEqual(encrypted.isna().tolist(), [False, True, False, False])
+			self.assertEqual(encrypted.iloc[0], self.ECV.unrank(self.fnr2_ECV.encrypt(self.ECV.rank('KE007JB'))))
+			decrypted = pyFNR.pandas.decrypt(self.fnr2_ECV, encrypted, self.ECV)
+			self.assertEqual(decrypted.isna().tolist(), plates.isna().tolist())
+			self.assertEqual(decrypted.dropna().tolist(), plates.dropna().tolist())
+
+class TestFNR2Dedup(unittest.TestCase):
+
+	def setUp(self):
+		# prepare instances with and without deduplication
+		self.ECV = pyFNR.Util.ECV()
+		self.fnr2 = pyFNR.FNR2(domain=self.ECV.get_words_count()-1)
+		self.plain = pyFNR.FNR2(domain=self.ECV.get_words_count()-1, dedup=None)
+
+	def tearDown(self):
+		self.fnr2.close()
+		self.plain.close()
+
+	def test_deduplicated_batches(self):
+		words = [self.ECV.unrank(c) for c in Helper.generate_random_ints(0, self.ECV.get_words_count(), TEST_COUNT)]
+		rows = [random.choice(words) for _ in range(1000)]
+		ciphertexts = self.fnr2.encrypt_words(self.ECV, rows)
+		self.assertEqual(ciphertexts, self.plain.encrypt_words(self.ECV, rows))
+		self.assertEqual(self.fnr2.decrypt_words(self.ECV, ciphertexts), rows)
+		ranks = [self.ECV.rank(w) for w in rows]
+		self.assertEqual(self.fnr2.encrypt_batch(ranks), [self.fnr2.encrypt(c) for c in ranks])
+
+	def test_batch_statistics(self):
+		rows = [47, 42] * 500
+		self.fnr2.encrypt_batch(rows)
+		self.fnr2.encrypt_batch(range(100))
+		stats = self.fnr2.batch_stats()
+		self.assertEqual(stats['batches'], 2)
+		self.assertEqual(stats['deduplicated_batches'], 1)
+		self.assertEqual(stats['rows'], 1100)
+		self.assertEqual(stats['enciphered_rows'], 102)
+		self.assertEqual(stats['unique_ratio'], 102.0 / 1100)
+		self.plain.encrypt_batch(rows)
+		self.assertEqual(self.plain.batch_stats()['deduplicated_batches'], 0)
+
+	def test_deduplicated_arrays(self):
+		numpy = pyFNR._optional.numpy()
+		if numpy is None:
+			self.skipTest('NumPy is not installed')
+		values = numpy.array([47, 42, 47, 0] * 100)
+		ciphertexts = self.fnr2.encrypt_array(values)
+		self.assertEqual(ciphertexts.tolist(), self.plain.encrypt_array(values).tolist())
+		self.assertEqual(self.fnr2.decrypt_array(ciphertexts).tolist(), values.tolist())
+		self.assertEqual(self.fnr2.batch_stats()['enciphered_rows'], 6)
+
+class TestBackends(unittest.TestCase):
+
+	def test_missing_library(self):
+		# import works without libFNR, default backend raises
+		statement = 'import pyFNR.backends as b; b.set_library_paths(libfnr="/nonexistent/libfnr.so"); b.get_backend()'
+		process = subprocess.Popen([sys.executable, '-c', statement], stderr=subprocess.PIPE)
+		self.assertNotEqual(process.wait(), 0)
+		self.assertIn(b'OSError', process.stderr.read())
+		process.stderr.close()
+		self.assertRaises(ValueError, pyFNR.backends.set_default_backend, 'rust')
+		self.assertRaises(ValueError, pyFNR.backends.get_backend, 'rust')
+
+class TestKDF(unittest.TestCase):
+
+	def test_default_kdf(self):
+		fnr = pyFNR.FNR(block_size=64)
+		fnr_sha1 = pyFNR.FNR(block_size=64, kdf=pyFNR.kdf.PBKDF2('sha1', 1000))
+		fnr_sha256 = pyFNR.FNR(block_size=64, kdf=pyFNR.kdf.PBKDF2('sha256', 2000))
+		ints = Helper.generate_random_ints(0, 2**64, TEST_COUNT)
+		# check default kdf is PBKDF2-HMAC-SHA1 with 1000 iterations
+		self.assertEqual(fnr.encrypt_ints(ints), fnr_sha1.encrypt_ints(ints))
+		self.assertNotEqual(fnr.encrypt_ints(ints), fnr_sha256.encrypt_ints(ints))
+		for f in (fnr, fnr_sha1, fnr_sha256):
+			f.close()
+
+	def test_hashlib_engine(self):
+		# RFC 6070 test vector of PBKDF2-HMAC-SHA1
+		key = pyFNR.kdf.PBKDF2('sha1', 2, engine='hashlib').derive(b'password', b'salt', 20, None)
+		self.assertEqual(binascii.hexlify(key).decode(), 'ea6c014dc72d6f8ccd1ed92ace1d41f0d8de8957')
+		kdf = pyFNR.kdf.PBKDF2('sha256', 10)
+		kdf_hashlib = pyFNR.kdf.PBKDF2('sha256', 10, engine='hashlib')
+		backend = pyFNR.backends.get_backend()
+		self.assertEqual(kdf.derive(b'key', b'salt', 32, backend), kdf_hashlib.derive(b'key', b'salt', 32, backend))
+
+	def test_from_master_key(self):
+		master_key = bytearray(range(pyFNR.KEY_SIZE))
+		kdf = pyFNR.kdf.PBKDF2()
+		# master key derived the same way as by constructor
+		derived_key = kdf.derive(b'password\x00', bytes(pyFNR.SALT_SIZE), pyFNR.KEY_SIZE, pyFNR.backends.get_backend())
+		fnr = pyFNR.FNR(key='password', block_size=40)
+		fnr_master = pyFNR.FNR.from_master_key(derived_key, block_size=40)
+		fnr_other = pyFNR.FNR.from_master_key(master_key, block_size=40)
+		ints = Helper.generate_random_ints(0, 2**40, TEST_COUNT)
+		self.assertEqual(fnr.encrypt_ints(ints), fnr_master.encrypt_ints(ints))
+		self.assertNotEqual(fnr.encrypt_ints(ints), fnr_other.encrypt_ints(ints))
+		self.assertEqual(fnr_other.decrypt_ints(fnr_other.encrypt_ints(ints)), ints)
+		fnr2 = pyFNR.FNR2.from_master_key(master_key, domain=10**9)
+		self.assertEqual(fnr2.decrypt(fnr2.encrypt(47)), 47)
+		for f in (fnr, fnr_master, fnr_other, fnr2):
+			f.close()
+		self.assertRaises(ValueError, pyFNR.FNR.from_master_key, b'short')
+
+class TestMetrics(unittest.TestCase):
+
+	def tearDown(self):
+		pyFNR.metrics.disable()
+		pyFNR.metrics.reset()
+
+	def test_counters_and_spans(self):
+		spans = []
+		original = pyFNR.FNR.__dict__['encrypt_int']
+		pyFNR.metrics.enable(tracer=lambda name, start, duration: spans.append(name))
+		self.assertEqual(pyFNR.metrics.is_enabled(), True)
+		fnr2 = pyFNR.FNR2(domain=2**20)
+		for p in range(TEST_COUNT):
+			fnr2.encrypt(p)
+		stats = pyFNR.metrics.snapshot()
+		# every encryption needs at least one FNR call, walks need more
+		self.assertEqual(stats['FNR.encrypt_int']['count'], TEST_COUNT + stats['FNR2.cycle_walk_steps']['count'])
+		fnr2.encrypt_batch(range(TEST_COUNT))
+		ecv = pyFNR.Util.ECV()
+		ecv.unrank(ecv.rank('BA000AA'))
+		fnr2.close()
+		stats = pyFNR.metrics.snapshot()
+		self.assertEqual(stats['FNR2.encrypt']['count'], TEST_COUNT)
+		self.assertEqual(stats['FPE_Format.rank']['count'], 1)
+		self.assertEqual(stats['FPE_Format.build_table']['count'], 1)
+		for name in ('FNR2.construct', 'FNR.construct', 'kdf.derive', 'FNR.expand_key', 'FNR2.encrypt_batch', 'FPE_Format.build_table'):
+			self.assertEqual(name in spans, True)
+			self.assertEqual(stats[name]['total_time'] > 0, True)
+		# check disabled mode restores original methods
+		pyFNR.metrics.disable()
+		self.assertEqual(pyFNR.FNR.__dict__['encrypt_int'] is original, True)
+		pyFNR.metrics.reset()
+		self.assertEqual(pyFNR.metrics.snapshot()['FNR2.encrypt']['count'], 0)
+
+	def test_cycle_walk_steps(self):
+		spans = []
+		pyFNR.metrics.enable(tracer=lambda name, start, duration: spans.append(name))
+		fnr2 = pyFNR.FNR2.from_master_key(bytes(bytearray(32)), domain=1008, engine='feistel')
+		self.assertEqual(spans.count('FNR.construct'), 1)
+		self.assertEqual(spans.count('FNR2.construct'), 1)
+		expected = 0
+		for p in range(fnr2.domain + 1):
+			c = fnr2._engine._feistel(p, 1)
+			while c > fnr2.domain:
+				c = fnr2._engine._feistel(c, 1)
+				expected += 1
+		self.assertEqual(expected > 0, True)
+		for p in range(fnr2.domain + 1):
+			fnr2.encrypt(p)
+		self.assertEqual(pyFNR.metrics.snapshot()['FNR2.cycle_walk_steps']['count'], expected)
+		fnr2.encrypt_batch(list(range(fnr2.domain + 1)))
+		self.assertEqual(pyFNR.metrics.snapshot()['FNR2.cycle_walk_steps']['count'], 2 * expected)
+		fnr2.close()
+		# FNR used directly does not walk
+		fnr = pyFNR.FNR.from_master_key(bytes(bytearray(32)), block_size=10)
+		for p in range(1024):
+			fnr.encrypt_int(p)
+		fnr.close()
+		self.assertEqual(pyFNR.metrics.snapshot()['FNR2.cycle_walk_steps']['count'], 2 * expected)
+		self.assertEqual(spans.count('FNR.construct'), 2)
+		pyFNR.metrics.disable()
+		self.assertEqual(isinstance(pyFNR.FNR.__dict__['from_master_key'], classmethod), True)
+
+	def test_subclasses_and_specialized(self):
+		specialized = pyFNR.Util.LuhnR(0, 16).specialize(False)
+		pyFNR.metrics.enable()
+		composite = pyFNR.Util.CompositeFormat([pyFNR.Util.IntRangeFormat(0, 99), pyFNR.Util.DateFormat()], '|')
+		composite.unrank(composite.rank('42|2020-02-29'))
+		specialized.unrank(specialized.rank(specialized.unrank(7)))
+		stats = pyFNR.metrics.snapshot()
+		for name in ('CompositeFormat.rank', 'CompositeFormat.unrank', 'IntRangeFormat.rank'):
+			self.assertEqual(stats[name]['count'], 1)
+		# temporal formats also rank and unrank their bounds
+		for name in ('_TemporalFormat.rank', '_TemporalFormat.unrank'):
+			self.assertEqual(stats[name]['count'] >= 1, True)
+		self.assertEqual(stats['LuhnR.unrank']['count'], 2)
+		self.assertEqual(stats['LuhnR.rank']['count'], 1)
+		pyFNR.metrics.disable()
+		specialized.rank(specialized.unrank(7))
+		self.assertEqual(pyFNR.metrics.snapshot()['LuhnR.rank']['count'], 1)
+
+class TestLazyLoading(unittest.TestCase):
+
+	def test_import_does_not_load_optional_modules(self):
+		statement = 'import sys, pyFNR; print(sorted(m for m in ("numpy", "socket", "ctypes.util", "pyFNR.Util") if m in sys.modules))'
+		output = subprocess.check_output([sys.executable, '-c', statement])
+		self.assertEqual(output.strip(), b'[]')
+
+	def test_formats_do_not_load_random(self):
+		statement = 'import sys, pyFNR.Util; pyFNR.Util.LuhnR(0, 16); print("random" in sys.modules)'
+		output = subprocess.check_output([sys.executable, '-c', statement])
+		self.assertEqual(output.strip(), b'False')
+
+	def test_lazy_submodule_access(self):
+		statement = 'import pyFNR; print(pyFNR.Util.IPv4().get_words_count())'
+		output = subprocess.check_output([sys.executable, '-c', statement])
+		self.assertEqual(output.strip(), b'4294967296')
+
+	def test_configurable_library_path(self):
+		statement = 'import pyFNR, pyFNR.backends as b; b.set_library_paths(libfnr="/nonexistent/libfnr.so"); print(b._library_paths["fnr"]); b.get_backend("ctypes")'
+		process = subprocess.Popen([sys.executable, '-c', statement], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+		output, error = process.communicate()
+		self.assertEqual(output.strip(), b'/nonexistent/libfnr.so')
+		self.assertIn(b'/nonexistent/libfnr.so', error)
+
+class TestFNR2Permutation(unittest.TestCase):
+
+	def setUp(self):
+		self.fnr2 = pyFNR.FNR2(domain=999)
+
+	def tearDown(self):
+		self.fnr2.close()
+
+	def test_permutation(self):
+		permutation = list(self.fnr2.permutation(chunk_size=64))
+		# check permutation of the whole domain
+		self.assertEqual(sorted(permutation), list(range(1000)))
+		self.assertEqual(permutation[:TEST_COUNT], [self.fnr2.encrypt(i) for i in range(TEST_COUNT)])
+		# check seeking and inverse lookup
+		self.assertEqual(list(self.fnr2.permutation(500, 600)), permutation[500:600])
+		for i in Helper.generate_random_ints(0, 1000, TEST_COUNT):
+			self.assertEqual(self.fnr2.position(permutation[i]), i)
+
+	def test_shards(self):
+		permutation = list(self.fnr2.permutation())
+		shards = [self.fnr2.shard_range(k, 7) for k in range(7)]
+		self.assertEqual(shards[0][0], 0)
+		self.assertEqual(shards[-1][1], 1000)
+		values = []
+		for start, stop in shards:
+			values += list(self.fnr2.permutation(start, stop))
+		self.assertEqual(values, permutation)
+		self.assertRaises(ValueError, self.fnr2.shard_range, 7, 7)
+
+class TestFNR2Cache(unittest.TestCase):
+
+	def setUp(self):
+		# prepare one uncached instance and instances with both caches
+		self.fnr2 = pyFNR.FNR2(domain=10**6)
+		self.lru = pyFNR.FNR2(domain=10**6, cache=pyFNR.cache.LRUCache(8))
+		self.clock = pyFNR.FNR2(domain=10**6, cache=pyFNR.cache.ClockCache(8))
+
+	def tearDown(self):
+		self.fnr2.close()
+		self.lru.close()
+		self.clock.close()
+
+	def test_cached_encryption_and_decryption(self):
+		ints = Helper.generate_random_ints(0, 10**6 + 1, TEST_COUNT)
+		for fnr2 in (self.lru, self.clock):
+			for p in ints + ints:
+				c = fnr2.encrypt(p)
+				# check cached values are the same as computed ones
+				self.assertEqual(c, self.fnr2.encrypt(p))
+				self.assertEqual(fnr2.decrypt(c), p)
+			# check limit of entries
+			self.assertEqual(len(fnr2.cache) <= 8, True)
+
+	def test_cache_argument(self):
+		for cache, expected in ((True, 4096), (16, 16), (False, None), (None, None)):
+			with pyFNR.FNR2(domain=10**6, cache=cache) as fnr2:
+				self.assertEqual(fnr2.cache.max_entries if fnr2.cache is not None else None, expected)
+
+	def test_cache_owner(self):
+		# pairs are not keyed by key or tweak, so a cache serves one instance
+		other = self.lru.cache
+		self.assertRaises(ValueError, pyFNR.FNR2, key="other", domain=10**6, cache=other)
+		self.lru.encrypt(47)
+		self.lru.close()
+		fnr2 = pyFNR.FNR2(key="other", domain=10**6, cache=other)
+		self.assertEqual(len(other), 0)
+		with pyFNR.FNR2(key="other", domain=10**6) as uncached:
+			self.assertEqual(fnr2.encrypt(47), uncached.encrypt(47))
+		# instance collected without close() releases its cache
+		del fnr2
+		import gc
+		gc.collect()
+		pyFNR.FNR2(domain=10**6, cache=other).close()
+
+	def test_cache_statistics(self):
+		for fnr2 in (self.lru, self.clock):
+			c = fnr2.encrypt(47)
+			fnr2.encrypt(47)
+			# check inverse map is filled by encryption
+			fnr2.decrypt(c)
+			stats = fnr2.cache.stats()
+			self.assertEqual(stats['hits'], 1)
+			self.assertEqual(stats['misses'], 1)
+			self.assertEqual(stats['inverse_hits'], 1)
+			self.assertEqual(stats['inverse_misses'], 0)
+			self.assertEqual(stats['entries'], 1)
+			self.assertEqual(fnr2.cache.hit_rate(), 2.0 / 3)
+
+	def test_cache_eviction(self):
+		for cache in (pyFNR.cache.LRUCache(2), pyFNR.cache.ClockCache(2)):
+			cache.put(1, 10)
+			cache.put(2, 20)
+			# touch first pair, so the second one is evicted
+			self.assertEqual(cache.get(1), 10)
+			cache.put(3, 30)
+			self.assertEqual(cache.get(2), None)
+			self.assertEqual(cache.get_inverse(20), None)
+			self.assertEqual(cache.get_inverse(10), 1)
+			self.assertEqual(cache.get(3), 30)
+			self.assertEqual(cache.stats()['evictions'], 1)
+			cache.clear()
+			self.assertEqual(len(cache), 0)
+			self.assertEqual(cache.get(1), None)
+
+class TestFNR2Engines(unittest.TestCase):
+
+	def setUp(self):
+		# prepare feistel instance for small domain (prime size 1009 = 32 * 32 - 15)
+		self.fnr2 = pyFNR.FNR2(domain=1008, engine='feistel')
+
+	def tearDown(self):
+		self.fnr2.close()
+
+	def test_feistel_permutation(self):
+		ciphertexts = [self.fnr2.encrypt(p) for p in range(1009)]
+		self.assertEqual(sorted(ciphertexts), list(range(1009)))
+		for p, c in enumerate(ciphertexts):
+			self.assertEqual(self.fnr2.decrypt(c), p)
+		self.assertEqual((self.fnr2._engine._a, self.fnr2._engine._b), (32, 32))
+
+	def test_feistel_batch(self):
+		ints = Helper.generate_random_ints(0, 1009, TEST_COUNT) + list(range(1009))
+		ciphertexts = self.fnr2.encrypt_batch(ints)
+		self.assertEqual(ciphertexts, [self.fnr2.encrypt(p) for p in ints])
+		self.assertEqual(self.fnr2.decrypt_batch(ciphertexts), ints)
+		self.assertEqual(list(self.fnr2.permutation(0, 20)), [self.fnr2.encrypt(p) for p in range(20)])
+
+	def test_feistel_fixed_cost(self):
+		# one FNR call per round, walks only for values of the 15 above domain
+		calls = []
+		encrypt_int = self.fnr2._fnr.encrypt_int
+		self.fnr2._fnr.encrypt_int = lambda x: calls.append(x) or encrypt_int(x)
+		for p in range(1009):
+			del calls[:]
+			self.fnr2.encrypt(p)
+			self.assertEqual(len(calls) % 8, 0)
+			self.assertEqual(len(calls) <= 8 * 16, True)
+
+	def test_feistel_domains(self):
+		for domain in (0, 1, 2, 10**9 - 1, 2**64, 2**128 - 1):
+			fnr2 = pyFNR.FNR2(domain=domain, engine='feistel')
+			ints = Helper.generate_random_ints(0, domain + 1, TEST_COUNT)
+			for p in ints:
+				c = fnr2.encrypt(p)
+				self.assertEqual(c <= domain, True)
+				self.assertEqual(fnr2.decrypt(c), p)
+			self.assertEqual(fnr2.decrypt_batch(fnr2.encrypt_batch(ints)), ints)
+			fnr2.close()
+
+	def test_invalid_engine(self):
+		self.assertRaises(ValueError, pyFNR.FNR2, domain=1008, engine='unknown')
+		self.assertRaises(ValueError, pyFNR.FNR2, domain=2**130, engine='feistel')
+		self.assertRaises(ValueError, pyFNR.FNR2, domain=1008, engine='feistel', rounds=0)
+
+class TestFNR2WideDomain(unittest.TestCase):
+
+	def setUp(self):
+		# prepare format with more than 2**128 words
+		self.luhn = pyFNR.Util.LuhnR(0, 40)
+		self.fnr2 = pyFNR.FNR2(domain=self.luhn.get_words_count()-1)
+
+	def tearDown(self):
+		self.fnr2.close()
+
+	def test_wide_engine_is_default(self):
+		self.assertEqual(self.fnr2._engine.name, 'wide-feistel')
+		self.assertEqual(pyFNR.FNR2(domain=2**128-1)._engine.name, 'cycle-walking')
+
+	def test_format_encryption_and_decryption(self):
+		ranks = Helper.generate_random_ints(0, self.luhn.get_words_count(), TEST_COUNT)
+		for plain in [self.luhn.unrank(r) for r in ranks]:
+			cipher = self.luhn.unrank(self.fnr2.encrypt(self.luhn.rank(plain)))
+			self.assertEqual(len(cipher), 40)
+			self.assertEqual(self.luhn.unrank(self.fnr2.decrypt(self.luhn.rank(cipher))), plain)
+
+	def test_batch_and_long_halves(self):
+		fnr2 = pyFNR.FNR2(domain=3**300)
+		ints = Helper.generate_random_ints(0, 3**300 + 1, TEST_COUNT)
+		ciphertexts = fnr2.encrypt_batch(ints)
+		self.assertEqual(ciphertexts, [fnr2.encrypt(p) for p in ints])
+		self.assertEqual(fnr2.decrypt_batch(ciphertexts), ints)
+		fnr2.close()
+
+	def test_small_domain_permutation(self):
+		fnr2 = pyFNR.FNR2(domain=1000, engine='wide-feistel', rounds=6)
+		self.assertEqual(sorted(fnr2.encrypt(p) for p in range(1001)), list(range(1001)))
+		fnr2.close()
+
 class TestECV_Format(unittest.TestCase):
 
 	def setUp(self):
@@ -358,6 +892,940 @@ class TestLuhnR_Format(unittest.TestCase):
 		self.assertEqual(self.LuhnR_5.unrank(self.LuhnR_5.get_words_count()-1), '998')
 
 
+class TestLazy_DFA(unittest.TestCase):
+
+	def setUp(self):
+		# LuhnR automaton over implicit states and checksum-plus-counter
+		# automaton with (unbounded) counter of nines
+		self.sigma = [str(i) for i in range(10)]
+		def luhn(t, c):
+			a, b = t
+			c = int(c)
+			return ((a+c+(1-b)*(c+c//5))%10, 1-b)
+		self.luhn = luhn
+		self.counter = lambda t, c: ((t[0] * 7 + int(c)) % 97, t[1] + (c == '9'))
+
+	def test_luhn(self):
+		for M, N in ((0, 16), (5, 3), (3, 1)):
+			eager = pyFNR.Util.LuhnR(M, N)
+			lazy = pyFNR.Util.FPE_Format(pyFNR.Util.DFA(None, self.sigma, self.luhn, (0, 0), lambda t: t[0] == M, lazy=True), N)
+			self.assertEqual(lazy.get_words_count(), eager.get_words_count())
+			for c in Helper.generate_random_ints(0, eager.get_words_count(), TEST_COUNT):
+				self.assertEqual(lazy.unrank(c), eager.unrank(c))
+				self.assertEqual(lazy.rank(eager.unrank(c)), c)
+
+	def test_reachable_states(self):
+		# eager DFA would need all states of unbounded counter
+		dfa = pyFNR.Util.DFA(None, self.sigma, self.counter, (0, 0), lambda t: t[0] == 0 and t[1] <= 1, lazy=True)
+		levels = dfa.explore(3)
+		# '0' keeps start state (0, 0)
+		self.assertEqual([len(level) for level in levels[:3]], [1, 9, 73])
+		self.assertEqual(sum(len(level) for level in levels), len(dfa.Q) - 1)
+		lazy = pyFNR.Util.FPE_Format(dfa, 4, positional=False)
+		words = [''.join(w) for w in itertools.product(self.sigma, repeat=4)]
+		accepted = [w for w in words if self.is_accepted(w)]
+		self.assertEqual(lazy.get_words_count(), len(accepted))
+		self.assertEqual(lazy.table.footprint()["states"], len(dfa.Q))
+		for c in Helper.generate_random_ints(0, len(accepted), TEST_COUNT):
+			self.assertEqual(lazy.unrank(c), accepted[c])
+			self.assertEqual(lazy.rank(accepted[c]), c)
+		self.assertRaises(ValueError, lazy.rank, '9999')
+		shared = pyFNR.shared.loads(pyFNR.shared.dumps(lazy))
+		self.assertEqual(shared.unrank_batch(range(len(accepted))), accepted)
+
+	def is_accepted(self, word):
+		t = (0, 0)
+		for c in word:
+			t = self.counter(t, c)
+		return t[0] == 0 and t[1] <= 1
+
+	def test_dictionary(self):
+		# None for missing transitions, F as collection
+		delta = {('a', ('0', '1')): 'b', ('b', ('1',)): 'a'}
+		lazy = pyFNR.Util.FPE_Format(pyFNR.Util.DFA(None, ['0', '1'], delta, 'a', ['a'], lazy=True), 4)
+		self.assertEqual(lazy.unrank_batch(range(lazy.get_words_count())), ['0101', '0111', '1101', '1111'])
+
+
+class TestProduct_DFA(unittest.TestCase):
+
+	def setUp(self):
+		# automaton of words with fixed prefix (e.g. BIN of card numbers)
+		self.sigma = [str(i) for i in range(10)]
+		self.prefix = '45'
+		delta = dict(((i, self.prefix[i]), i + 1) for i in range(len(self.prefix)))
+		delta[(len(self.prefix), '0123456789')] = len(self.prefix)
+		self.prefix_dfa = pyFNR.Util.DFA(range(len(self.prefix) + 1), self.sigma, delta, 0, [len(self.prefix)])
+		self.luhn = pyFNR.Util.LuhnR(0, 5)
+		self.words = [''.join(w) for w in itertools.product(self.sigma, repeat=5)]
+
+	def check(self, dfa, accepted):
+		fmt = pyFNR.Util.FPE_Format(dfa, 5)
+		self.assertEqual(fmt.get_words_count(), len(accepted))
+		for c in Helper.generate_random_ints(0, len(accepted), TEST_COUNT):
+			self.assertEqual(fmt.unrank(c), accepted[c])
+			self.assertEqual(fmt.rank(accepted[c]), c)
+
+	def is_luhn(self, w):
+		try:
+			self.luhn.rank(w)
+			return True
+		except ValueError:
+			return False
+
+	def test_intersect(self):
+		dfa = self.luhn.DFA.intersect(self.prefix_dfa)
+		self.check(dfa, [w for w in self.words if w.startswith(self.prefix) and self.is_luhn(w)])
+		self.assertRaises(ValueError, pyFNR.Util.FPE_Format(dfa, 5).rank, '46000')
+
+	def test_union(self):
+		self.check(self.luhn.DFA.union(self.prefix_dfa), [w for w in self.words if w.startswith(self.prefix) or self.is_luhn(w)])
+
+	def test_complement(self):
+		self.check(self.prefix_dfa.complement(), [w for w in self.words if not w.startswith(self.prefix)])
+		self.check(self.prefix_dfa.complement().complement(), [w for w in self.words if w.startswith(self.prefix)])
+
+	def test_minimize(self):
+		# sum modulo 4 with even accept states is sum modulo 2
+		mod4 = pyFNR.Util.DFA(range(4), self.sigma, lambda q, a: (q + int(a)) % 4, 0, [0, 2])
+		self.assertEqual(len(mod4.intersect(mod4).Q), 3)
+		self.assertEqual(len(mod4.intersect(mod4, minimize=False).Q), 5)
+		self.assertEqual(len(self.luhn.DFA.complement().complement().Q), len(self.luhn.DFA.Q))
+		# prefix which can never be completed leaves only invalid state
+		self.assertEqual(len(self.prefix_dfa.intersect(self.prefix_dfa.complement()).Q), 1)
+
+	def test_alphabets(self):
+		letters = pyFNR.Util.DFA([0], ['a', 'b'], lambda q, a: 0, 0, [0])
+		self.assertEqual(self.prefix_dfa.union(letters).Sigma, self.sigma + ['a', 'b'])
+		self.assertEqual(pyFNR.Util.FPE_Format(self.prefix_dfa.intersect(letters), 5).get_words_count(), 0)
+
+	def test_lazy(self):
+		lazy = pyFNR.Util.DFA(None, self.sigma, lambda q, a: (q + int(a)) % 7, 0, lambda q: q == 0, lazy=True)
+		dfa = lazy.intersect(self.prefix_dfa)
+		self.assertTrue(dfa.lazy)
+		self.check(dfa, [w for w in self.words if w.startswith(self.prefix) and sum(map(int, w)) % 7 == 0])
+
+
+class TestCountingTable(unittest.TestCase):
+
+	def setUp(self):
+		# checksum automaton with enough states for NumPy counting
+		Q = list(range(997))
+		self.dfa = lambda: pyFNR.Util.DFA(Q, [str(i) for i in range(10)], lambda q, a: (q * 7 + int(a)) % 997, 0, [0])
+
+	def test_extension(self):
+		dfa = self.dfa()
+		formats = [pyFNR.Util.FPE_Format(dfa, N) for N in (16, 8, 24)]
+		self.assertTrue(formats[0].table is formats[1].table is formats[2].table)
+		self.assertEqual(formats[0].table.N, 24)
+		for fmt in formats:
+			fresh = pyFNR.Util.FPE_Format(self.dfa(), fmt.N)
+			self.assertEqual(fmt.get_words_count(), fresh.get_words_count())
+			for c in Helper.generate_random_ints(0, fmt.get_words_count(), TEST_COUNT):
+				self.assertEqual(fmt.unrank(c), fresh.unrank(c))
+				self.assertEqual(fmt.rank(fresh.unrank(c)), c)
+
+	def test_numpy_counting(self):
+		threshold = pyFNR.Util.NUMPY_TABLE_THRESHOLD
+		pyFNR.Util.NUMPY_TABLE_THRESHOLD = 10**9
+		try:
+			python = pyFNR.Util.FPE_Format(self.dfa(), 30)
+		finally:
+			pyFNR.Util.NUMPY_TABLE_THRESHOLD = threshold
+		fmt = pyFNR.Util.FPE_Format(self.dfa(), 30)
+		self.assertEqual(fmt.table.columns, python.table.columns)
+
+	def test_footprint(self):
+		fmt = pyFNR.Util.LuhnR(0, 40)
+		report = fmt.table.footprint()
+		# counts of 20 and more digits do not fit 64 bits
+		self.assertEqual((report['states'], report['N']), (21, 40))
+		self.assertEqual((report['fixed_columns'], report['big_columns']), (21, 20))
+		self.assertEqual(report['bytes'], report['fixed_bytes'] + report['big_bytes'] + report['transitions_bytes'])
+		self.assertEqual(fmt.T[fmt.DFA.q0][40], fmt.get_words_count())
+
+	def test_arithmetic(self):
+		self.assertRaises(ValueError, pyFNR.Util.set_arithmetic, 'decimal')
+		if pyFNR._optional.gmpy2() is None:
+			self.assertEqual(pyFNR.Util.get_arithmetic(), 'python')
+			return
+		# counts of LuhnR(0,700) exceed MPZ_BITS
+		try:
+			pyFNR.Util.set_arithmetic('python')
+			python = pyFNR.Util.LuhnR(0, 700)
+			pyFNR.Util.set_arithmetic('gmpy2')
+			fmt = pyFNR.Util.LuhnR(0, 700)
+		finally:
+			pyFNR.Util.set_arithmetic(None)
+		self.assertEqual(pyFNR.Util.get_arithmetic(), 'gmpy2')
+		self.assertEqual(fmt.table.columns, python.table.columns)
+		self.assertIs(type(fmt.get_words_count()), int)
+		shared = pyFNR.shared.loads(pyFNR.shared.dumps(fmt))
+		for c in Helper.generate_random_ints(0, fmt.get_words_count(), TEST_COUNT):
+			word = python.unrank(c)
+			self.assertEqual(fmt.unrank(c), word)
+			self.assertEqual(shared.unrank(c), word)
+			self.assertIs(type(fmt.rank(word)), int)
+			self.assertEqual(fmt.rank(word), c)
+
+
+class TestSampling(unittest.TestCase):
+
+	def setUp(self):
+		self.formats = [pyFNR.Util.ECV(), pyFNR.Util.LuhnR(0, 16), pyFNR.Util.IPv4(), pyFNR.Util.IPv6(),
+			pyFNR.Util.CompositeFormat([pyFNR.Util.ECV(), pyFNR.Util.IPv4()], '|')]
+
+	def test_sample(self):
+		for fmt in self.formats:
+			words = fmt.sample(100, random.Random(7))
+			self.assertEqual(len(words), 100)
+			self.assertEqual(words, fmt.sample(100, random.Random(7)))
+			for word in words:
+				self.assertTrue(0 <= fmt.rank(word) < fmt.get_words_count())
+			# chunks do not change drawn ranks
+			self.assertEqual(list(fmt.generate(100, random.Random(7), chunk_size=3)), words)
+
+	def test_distinct(self):
+		for fmt in self.formats:
+			words = fmt.sample(1000, random.Random(7), distinct=True)
+			self.assertEqual(len(set(words)), 1000)
+			self.assertEqual(words, fmt.sample(1000, random.Random(7), distinct=True))
+		# all words of small format without repeats
+		fmt = pyFNR.Util.LuhnR(5, 3)
+		words = list(fmt.generate(rng=random.Random(7), distinct=True, chunk_size=7))
+		self.assertEqual(sorted(words), fmt.unrank_batch(range(fmt.get_words_count())))
+		self.assertNotEqual(words, sorted(words))
+		self.assertRaises(ValueError, fmt.sample, fmt.get_words_count() + 1, None, True)
+
+
+class TestPositional_Format(unittest.TestCase):
+
+	def setUp(self):
+		# prepare positional format with DFA prefix and generic ECV format
+		self.ID = pyFNR.Util.PositionalFormat(['ABC', '0123456789', 'xyz'], prefix=pyFNR.Util.LuhnR(5, 3))
+		self.ECV = pyFNR.Util.ECV()
+		self.ECV_generic = pyFNR.Util.FPE_Format(self.ECV.DFA, 7, positional=False)
+
+	def test_ranking_and_unranking(self):
+		self.assertEqual(self.ID.get_words_count(), 100 * 90)
+		self.assertEqual(self.ID.rank('007A0x'), 0)
+		self.assertEqual(self.ID.rank('470B1y'), 47 * 90 + 1 * 30 + 1 * 3 + 1)
+		self.assertEqual(self.ID.unrank(self.ID.get_words_count()-1), '998C9z')
+		for c in Helper.generate_random_ints(0, self.ID.get_words_count(), TEST_COUNT):
+			self.assertEqual(self.ID.rank(self.ID.unrank(c)), c)
+		self.assertRaises(ValueError, self.ID.rank, '007D0x')
+
+	def test_sample_and_specialize(self):
+		rng = random.Random(47)
+		for fmt in (self.ID, pyFNR.Util.PositionalFormat(['AB', 'xyz'])):
+			words = fmt.sample(TEST_COUNT, rng)
+			self.assertEqual(len(words), TEST_COUNT)
+			for word in words:
+				self.assertEqual(fmt.unrank(fmt.rank(word)), word)
+			words = fmt.sample(6, rng, distinct=True)
+			self.assertEqual(len(set(words)), 6)
+			self.assertRaises(ValueError, fmt.specialize, False)
+
+	def test_detected_tail(self):
+		# positions after city code are independent character sets
+		self.assertEqual(self.ECV._tail_start, 2)
+		self.assertEqual(self.ECV.get_words_count(), self.ECV_generic.get_words_count())
+		for c in Helper.generate_random_ints(0, self.ECV.get_words_count(), TEST_COUNT):
+			word = self.ECV_generic.unrank(c)
+			self.assertEqual(self.ECV.unrank(c), word)
+			self.assertEqual(self.ECV.rank(word), c)
+		self.assertRaises(ValueError, self.ECV.rank, 'KE007J1')
+
+
+class TestComposite_Format(unittest.TestCase):
+
+	def setUp(self):
+		# prepare composite formats with and without separator
+		self.LuhnR_5 = pyFNR.Util.LuhnR(5, 3)
+		self.record = pyFNR.Util.CompositeFormat([self.LuhnR_5, pyFNR.Util.IPv4()], separator='|')
+		self.ID = pyFNR.Util.CompositeFormat([pyFNR.Util.PositionalFormat(['AB', 'xyz']), self.LuhnR_5])
+
+	def test_ranking_and_unranking(self):
+		self.assertEqual(self.record.get_words_count(), 100 * 2**32)
+		self.assertEqual(self.record.rank('470|0.0.0.1'), 47 * 2**32 + 1)
+		self.assertEqual(self.record.rank(['470', '0.0.0.1']), 47 * 2**32 + 1)
+		self.assertEqual(self.record.unrank(47 * 2**32 + 1), '470|0.0.0.1')
+		self.assertEqual(self.ID.N, 5)
+		self.assertEqual(self.ID.rank('Ay470'), 147)
+		self.assertEqual(self.ID.unrank(self.ID.get_words_count()-1), 'Bz998')
+		self.assertRaises(ValueError, self.record.rank, '470')
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [pyFNR.Util.IPv4()])
+
+	def test_fields(self):
+		self.assertRaises(ValueError, self.record.rank, ['470'])
+		self.assertRaises(ValueError, self.record.rank, ['470', '0.0.0.1', '0.0.0.2'])
+		self.assertRaises(ValueError, self.record.rank_batch, [['470']])
+		# separator which can occur inside words of a field
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [self.LuhnR_5, pyFNR.Util.IPv4()], '.')
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [pyFNR.Util.IPv6(), self.LuhnR_5], ':')
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [pyFNR.Util.IntRangeFormat(-5, 5), self.LuhnR_5], '-')
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [pyFNR.Util.DateFormat(), self.LuhnR_5], '-')
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [self.record, self.LuhnR_5], '|')
+		self.assertRaises(ValueError, pyFNR.Util.CompositeFormat, [pyFNR.Util.PositionalFormat(['A,', 'x'])], ',')
+		pyFNR.Util.CompositeFormat([pyFNR.Util.IntRangeFormat(0, 5), pyFNR.Util.DateFormat()], '|-')
+
+	def test_batch(self):
+		for fmt in (self.record, self.ID):
+			ranks = Helper.generate_random_ints(0, fmt.get_words_count(), TEST_COUNT)
+			words = fmt.unrank_batch(ranks)
+			self.assertEqual(words, [fmt.unrank(c) for c in ranks])
+			self.assertEqual(fmt.rank_batch(words), ranks)
+
+
+class TestArithmetic_Format(unittest.TestCase):
+
+	def setUp(self):
+		# prepare date, timestamp and integer range formats
+		self.date = pyFNR.Util.DateFormat('%d.%m.%Y', '01.01.1950', '31.12.2010')
+		self.iso_date = pyFNR.Util.DateFormat()
+		self.timestamp = pyFNR.Util.TimestampFormat(min='2020-01-01 00:00:00', max='2020-12-31 23:59:59')
+		self.amount = pyFNR.Util.IntRangeFormat(-500, 100000, 6)
+
+	def test_ranking_and_unranking(self):
+		self.assertEqual(self.date.rank('01.01.1950'), 0)
+		self.assertEqual(self.date.rank('01.03.1952'), 365 + 365 + 59 + 1)
+		self.assertEqual(self.date.unrank(self.date.get_words_count()-1), '31.12.2010')
+		self.assertRaises(ValueError, self.date.rank, '29.02.1951')
+		self.assertRaises(ValueError, self.date.rank, '01.01.2011')
+		self.assertEqual(self.timestamp.get_words_count(), 366 * 86400)
+		self.assertEqual(self.timestamp.rank('2020-01-02 00:00:01'), 86401)
+		self.assertEqual(self.timestamp.unrank(86401), '2020-01-02 00:00:01')
+		self.assertEqual(self.amount.unrank(0), '-00500')
+		self.assertEqual(self.amount.rank('000042'), 542)
+		self.assertRaises(ValueError, self.amount.rank, '100001')
+		self.assertEqual((self.date.N, self.timestamp.N, self.amount.N), (10, 19, 6))
+
+	def test_batch(self):
+		for fmt in (self.date, self.iso_date, self.timestamp, self.amount):
+			ranks = Helper.generate_random_ints(0, fmt.get_words_count(), 100)
+			words = fmt.unrank_batch(ranks)
+			self.assertEqual(words, [fmt.unrank(c) for c in ranks])
+			self.assertEqual(fmt.rank_batch(words), ranks)
+
+	def test_canonical_words(self):
+		# words which parse to valid values but are not written by unrank()
+		for word in ('+00042', '0_0042', '\u0660\u0660\u0660\u0660\u0664\u0662', '42'):
+			self.assertRaises(ValueError, self.amount.rank, word)
+			self.assertRaises(ValueError, self.amount.rank_batch, [word] + self.amount.unrank_batch(range(100)))
+		self.assertRaises(ValueError, pyFNR.Util.IntRangeFormat(0, 100).rank, '+5')
+		self.assertRaises(ValueError, self.iso_date.rank, '2020-2-29')
+		self.assertRaises(ValueError, self.date.rank, '1.3.1952')
+		self.assertRaises(ValueError, self.timestamp.rank, '2020-01-02 0:00:01')
+		self.assertRaises(ValueError, self.iso_date.rank_batch, ['2020-02-29'] * 99 + ['2020-2-029'])
+
+	def test_representable_steps(self):
+		self.assertRaises(ValueError, pyFNR.Util.TimestampFormat, seconds=0.5)
+		self.assertRaises(ValueError, pyFNR.Util.TimestampFormat, '%Y-%m-%d %H:%M', seconds=1)
+		self.assertRaises(ValueError, pyFNR.Util.DateFormat, '%m-%d')
+		self.assertRaises(ValueError, pyFNR.Util.DateFormat, '%Y-%m')
+		fine = pyFNR.Util.TimestampFormat('%Y-%m-%d %H:%M:%S.%f', '2020-01-01 00:00:00.000000', '2020-01-01 00:01:00.000000', seconds=0.5)
+		self.assertEqual(fine.get_words_count(), 121)
+		self.assertNotEqual(fine.unrank(0), fine.unrank(1))
+		self.assertEqual(fine.rank(fine.unrank(1)), 1)
+		minutes = pyFNR.Util.TimestampFormat('%Y-%m-%d %H:%M', '2020-01-01 00:00', '2020-01-02 00:00', seconds=60)
+		self.assertEqual(minutes.get_words_count(), 1441)
+
+	def test_default_bounds(self):
+		# default bounds do not depend on fmt
+		date = pyFNR.Util.DateFormat('%d.%m.%Y')
+		self.assertEqual((date.unrank(0), date.unrank(date.get_words_count() - 1)), ('01.01.1900', '31.12.2099'))
+		timestamp = pyFNR.Util.TimestampFormat('%d.%m.%Y %H:%M:%S')
+		self.assertEqual(timestamp.unrank(0), '01.01.1970 00:00:00')
+
+	def test_early_years(self):
+		# ISO words of years before 1000 are zero padded, so they have fixed length
+		import datetime
+		for fmt in (pyFNR.Util.DateFormat(min=datetime.date(1, 1, 1), max=datetime.date(2000, 1, 1)),
+				pyFNR.Util.TimestampFormat(min=datetime.datetime(1, 1, 1), max=datetime.datetime(1, 1, 2))):
+			self.assertEqual(fmt.N, len(fmt.unrank(0)))
+			ranks = list(range(40)) + [fmt.get_words_count() - 1]
+			words = fmt.unrank_batch(ranks)
+			self.assertEqual(words, [fmt.unrank(c) for c in ranks])
+			self.assertEqual(fmt.rank_batch(words), ranks)
+		self.assertEqual(fmt.rank('0001-01-01 00:00:03'), 3)
+
+	def test_encryption(self):
+		fnr2 = pyFNR.FNR2(domain=self.iso_date.get_words_count()-1)
+		cipher = self.iso_date.unrank(fnr2.encrypt(self.iso_date.rank('1985-07-13')))
+		self.assertEqual(self.iso_date.unrank(fnr2.decrypt(self.iso_date.rank(cipher))), '1985-07-13')
+		fnr2.close()
+
+
+class TestSharedTables(unittest.TestCase):
+
+	def setUp(self):
+		# one-limb (LuhnR(0,16), ECV) and multi-limb (LuhnR(3,40)) tables
+		self.formats = [pyFNR.Util.LuhnR(0, 16), pyFNR.Util.ECV(), pyFNR.Util.LuhnR(3, 40)]
+
+	def check(self, fmt, shared):
+		self.assertEqual(shared.get_words_count(), fmt.get_words_count())
+		ranks = Helper.generate_random_ints(0, fmt.get_words_count(), TEST_COUNT)
+		for c in ranks:
+			word = fmt.unrank(c)
+			self.assertEqual(shared.unrank(c), word)
+			self.assertEqual(shared.rank(word), c)
+		self.assertEqual(shared.unrank_batch(ranks), fmt.unrank_batch(ranks))
+
+	def test_dumps_loads(self):
+		for fmt in self.formats:
+			self.check(fmt, pyFNR.shared.loads(pyFNR.shared.dumps(fmt)))
+		self.assertRaises(ValueError, pyFNR.shared.dumps, pyFNR.Util.IPv4())
+		self.assertRaises(ValueError, pyFNR.shared.loads, b'x' * 64)
+
+	def test_format_class(self):
+		for fmt in self.formats:
+			self.assertEqual(type(pyFNR.shared.loads(pyFNR.shared.dumps(fmt))), type(fmt))
+		class Local(pyFNR.Util.LuhnR):
+			pass
+		# class which cannot be imported is attached as FPE_Format
+		self.check(self.formats[0], pyFNR.shared.loads(pyFNR.shared.dumps(Local(0, 16))))
+		self.assertEqual(type(pyFNR.shared.loads(pyFNR.shared.dumps(Local(0, 16)))), pyFNR.Util.FPE_Format)
+		class Upper(pyFNR.Util.LuhnR):
+			def unrank(self, c):
+				return super(Upper, self).unrank(c).upper()
+		self.assertRaises(ValueError, pyFNR.shared.dumps, Upper(0, 16))
+
+	def test_shared_memory(self):
+		for fmt in self.formats:
+			tables = pyFNR.shared.publish(fmt)
+			try:
+				shared = pyFNR.shared.attach(tables.name)
+				self.check(fmt, shared)
+				del shared
+			finally:
+				tables.close()
+				tables.unlink()
+
+	def test_attached_by_other_process(self):
+		# exit of attaching process must not unlink block of publisher
+		tables = pyFNR.shared.publish(self.formats[1])
+		try:
+			statement = 'import sys, pyFNR.shared; print(pyFNR.shared.attach(sys.argv[1]).unrank(47))'
+			output = subprocess.check_output([sys.executable, '-c', statement, tables.name], env=dict(os.environ, PYTHONPATH=os.getcwd()))
+			self.assertEqual(output.strip().decode('ascii'), self.formats[1].unrank(47))
+			self.check(self.formats[1], pyFNR.shared.attach(tables.name))
+		finally:
+			tables.close()
+			tables.unlink()
+
+	@unittest.skipIf(sys.byteorder != 'little', "simulated on little-endian hosts")
+	def test_big_endian(self):
+		# on big-endian hosts little-endian items are byteswapped, simulated
+		# here by big-endian items read as if host was big-endian
+		pyFNR.shared.sys = types.SimpleNamespace(byteorder='big')
+		try:
+			items = pyFNR.shared._cast(memoryview(struct.pack('>3i', 1, -2, 3)), 'i')
+			columns = pyFNR.shared._cast(memoryview(struct.pack('>2Q', 47, 2**64 - 1)), 'Q')
+		finally:
+			pyFNR.shared.sys = sys
+		self.assertEqual(list(items), [1, -2, 3])
+		self.assertEqual(list(columns), [47, 2**64 - 1])
+
+	def test_file(self):
+		fd, path = tempfile.mkstemp()
+		os.close(fd)
+		tables = pyFNR.shared.publish(self.formats[1], path=path)
+		try:
+			self.check(self.formats[1], pyFNR.shared.attach(path=path))
+		finally:
+			tables.unlink()
+		self.assertFalse(os.path.exists(path))
+
+
+class TestCodegen(unittest.TestCase):
+
+	def setUp(self):
+		# formats with DFA prefix and tail, tail only, no tail and generic
+		self.formats = [pyFNR.Util.ECV, lambda: pyFNR.Util.LuhnR(0, 16), lambda: pyFNR.Util.LuhnR(3, 1),
+			lambda: pyFNR.Util.FPE_Format(pyFNR.Util.ECV().DFA, 7, positional=False)]
+		self.cache_dir = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.cache_dir.cleanup()
+
+	def check(self, fmt, specialized):
+		ranks = Helper.generate_random_ints(0, fmt.get_words_count(), TEST_COUNT) + [0, fmt.get_words_count() - 1]
+		for c in ranks:
+			word = fmt.unrank(c)
+			self.assertEqual(specialized.unrank(c), word)
+			self.assertEqual(specialized.rank(word), c)
+		self.assertEqual(specialized.unrank_batch(ranks), fmt.unrank_batch(ranks))
+		self.assertRaises(ValueError, specialized.unrank, fmt.get_words_count())
+		self.assertRaises(ValueError, specialized.unrank, -1)
+		self.assertRaises(ValueError, specialized.rank, fmt.unrank(0) + 'x')
+		self.assertRaises(ValueError, specialized.rank, '#' * fmt.N)
+
+	def test_specialize(self):
+		for new in self.formats:
+			self.check(new(), new().specialize(self.cache_dir.name))
+			self.check(new(), pyFNR.codegen.specialize(new(), cache_dir=False))
+		self.assertRaises(ValueError, pyFNR.Util.IPv4().specialize, self.cache_dir.name)
+
+	def test_symbols(self):
+		# multi-character symbols are joined, other symbols are not supported
+		dfa = pyFNR.Util.DFA([0], ['ab', 'c', 'de'], lambda q, a: 0, 0, [0])
+		fmt = pyFNR.Util.FPE_Format(dfa, 3, positional=False)
+		specialized = pyFNR.Util.FPE_Format(dfa, 3, positional=False).specialize(False)
+		for c in range(fmt.get_words_count()):
+			self.assertEqual(specialized.unrank(c), fmt.unrank(c))
+		dfa = pyFNR.Util.DFA([0], [1, 2, 3], lambda q, a: 0, 0, [0])
+		fmt = pyFNR.Util.FPE_Format(dfa, 3)
+		unrank = fmt.unrank
+		self.assertRaises(ValueError, fmt.specialize, False)
+		self.assertEqual(fmt.unrank, unrank)
+
+	def test_cache(self):
+		fmt = pyFNR.Util.ECV().specialize(self.cache_dir.name)
+		self.assertEqual(len([name for name in os.listdir(self.cache_dir.name) if name.endswith('.py')]), 1)
+		# second format with the same tables imports cached module
+		cached = pyFNR.Util.ECV().specialize(self.cache_dir.name)
+		self.assertEqual(len([name for name in os.listdir(self.cache_dir.name) if name.endswith('.py')]), 1)
+		self.assertEqual(cached.unrank(12345), fmt.unrank(12345))
+		pyFNR.Util.LuhnR(0, 16).specialize(self.cache_dir.name)
+		self.assertEqual(len([name for name in os.listdir(self.cache_dir.name) if name.endswith('.py')]), 2)
+
+	def test_tampered_cache(self):
+		cache_dir = os.path.join(self.cache_dir.name, 'formats')
+		fmt = pyFNR.Util.ECV().specialize(cache_dir)
+		if hasattr(os, 'getuid'):
+			self.assertEqual(os.stat(cache_dir).st_mode & 0o777, 0o700)
+		path = os.path.join(cache_dir, [name for name in os.listdir(cache_dir) if name.endswith('.py')][0])
+		with open(path) as f:
+			source = f.read()
+		# modified source is not executed but generated again
+		with open(path, 'w') as f:
+			f.write(source + 'raise RuntimeError("tampered")\n')
+		cached = pyFNR.Util.ECV().specialize(cache_dir)
+		self.assertEqual(cached.unrank(12345), fmt.unrank(12345))
+		with open(path) as f:
+			self.assertEqual(f.read(), source)
+		if hasattr(os, 'getuid'):
+			os.chmod(path, 0o666)
+			self.assertIsNone(pyFNR.codegen._read(path))
+
+
+class TestRekeyer(unittest.TestCase):
+
+	def setUp(self):
+		# rotation of tweak over small domain and of key over ECV words
+		self.old = pyFNR.FNR2(tweak="old", domain=999)
+		self.new = pyFNR.FNR2(tweak="new", domain=999)
+		self.ecv = pyFNR.Util.ECV()
+		domain = self.ecv.get_words_count() - 1
+		self.old_ecv = pyFNR.FNR2(key="old", domain=domain)
+		self.new_ecv = pyFNR.FNR2(key="new", domain=domain)
+
+	def tearDown(self):
+		for fnr2 in (self.old, self.new, self.old_ecv, self.new_ecv):
+			fnr2.close()
+
+	def test_rekey(self):
+		values = Helper.generate_random_ints(0, 1000, 100)
+		expected = [self.new.encrypt(self.old.decrypt(x)) for x in values]
+		for table in (False, True, None):
+			rekeyer = pyFNR.rekey.Rekeyer(self.old, self.new, table=table)
+			self.assertEqual([rekeyer.rekey(x) for x in values], expected)
+			self.assertEqual(rekeyer.rekey_batch(values), expected)
+		# automatic table is built after 1000 enciphered tokens
+		self.assertIsNone(rekeyer._table)
+		self.assertEqual(rekeyer.rekey_batch(list(range(1000))), [self.new.encrypt(self.old.decrypt(x)) for x in range(1000)])
+		self.assertIsNotNone(rekeyer._table)
+		self.assertEqual(rekeyer.rekey_batch(values), expected)
+		self.assertRaises(ValueError, pyFNR.rekey.Rekeyer, self.old, self.new_ecv)
+
+	def test_batch_stats(self):
+		rekeyer = pyFNR.rekey.Rekeyer(self.old, self.new, table=False)
+		rekeyer.rekey_batch([5] * 100)
+		self.assertEqual(rekeyer.batch_stats()['rows'], 100)
+		self.assertEqual(rekeyer.batch_stats()['enciphered_rows'], 1)
+		# traffic of rekeyer is not counted by the instances it composes
+		self.assertEqual(self.new.batch_stats()['rows'], 0)
+		self.assertEqual(self.old.batch_stats()['rows'], 0)
+
+	@unittest.skipIf(pyFNR._optional.numpy() is None, "NumPy is not installed")
+	def test_array(self):
+		numpy = pyFNR._optional.numpy()
+		values = Helper.generate_random_ints(0, 1000, 100)
+		expected = [self.new.encrypt(self.old.decrypt(x)) for x in values]
+		for table in (False, True):
+			rekeyer = pyFNR.rekey.Rekeyer(self.old, self.new, table=table)
+			self.assertEqual(rekeyer.rekey_array(numpy.array(values)).tolist(), expected)
+
+	def test_words(self):
+		words = [self.ecv.unrank(c) for c in Helper.generate_random_ints(0, self.ecv.get_words_count(), TEST_COUNT)]
+		rekeyer = pyFNR.rekey.Rekeyer(self.old_ecv, self.new_ecv, self.ecv)
+		self.assertEqual(rekeyer.rekey_batch(words), self.new_ecv.encrypt_words(self.ecv, self.old_ecv.decrypt_words(self.ecv, words)))
+		self.assertEqual(rekeyer.rekey(words[0]), rekeyer.rekey_batch(words)[0])
+
+	def test_stream_resume(self):
+		rekeyer = pyFNR.rekey.Rekeyer(self.old, self.new, table=False)
+		values = Helper.generate_random_ints(0, 1000, 100)
+		expected = rekeyer.rekey_batch(values)
+		directory = tempfile.mkdtemp()
+		checkpoint = os.path.join(directory, 'checkpoint.json')
+		chunks = rekeyer.stream(values, checkpoint, chunk_size=30)
+		results = next(chunks)
+		next(chunks)
+		# interrupted: the second chunk was not stored and is yielded again
+		chunks.close()
+		for chunk in rekeyer.stream(values, checkpoint, chunk_size=30):
+			results.extend(chunk)
+		self.assertEqual(results, expected)
+		os.unlink(checkpoint)
+		os.rmdir(directory)
+
+	def test_file_resume(self):
+		rekeyer = pyFNR.rekey.Rekeyer(self.old_ecv, self.new_ecv, self.ecv)
+		words = [self.ecv.unrank(c) for c in Helper.generate_random_ints(0, self.ecv.get_words_count(), 100)]
+		directory = tempfile.mkdtemp()
+		source, target, checkpoint = [os.path.join(directory, name) for name in ('source.txt', 'target.txt', 'checkpoint.json')]
+		with open(source, 'w') as f:
+			f.write(''.join(word + '\n' for word in words))
+		rekey_batch = rekeyer.rekey_batch
+		calls = []
+		def interrupted(tokens):
+			calls.append(len(tokens))
+			if len(calls) == 3:
+				raise KeyboardInterrupt()
+			return rekey_batch(tokens)
+		rekeyer.rekey_batch = interrupted
+		self.assertRaises(KeyboardInterrupt, rekeyer.rekey_file, source, target, checkpoint, 16)
+		rekeyer.rekey_batch = rekey_batch
+		self.assertEqual(rekeyer.rekey_file(source, target, checkpoint, 16), 100 - 32)
+		self.assertEqual(rekeyer.rekey_file(source, target, checkpoint, 16), 0)
+		with open(target) as f:
+			self.assertEqual(f.read().split(), rekeyer.rekey_batch(words))
+		self.assertRaises(ValueError, rekeyer.rekey_file, target, source, checkpoint)
+		# removed target is written again from the first line
+		os.unlink(target)
+		self.assertEqual(rekeyer.rekey_file(source, target, checkpoint, 16), 100)
+		with open(target) as f:
+			self.assertEqual(f.read().split(), rekeyer.rekey_batch(words))
+		for path in (source, target, checkpoint):
+			os.unlink(path)
+		os.rmdir(directory)
+
+
+class TestPcap(unittest.TestCase):
+
+	def setUp(self):
+		self.ipv4 = pyFNR.FNR(block_size=32)
+		self.ipv6 = pyFNR.FNR(block_size=128)
+		self.directory = tempfile.mkdtemp()
+		self.src = [bytes(bytearray([10, 0, 0, i])) for i in range(5)]
+		self.src6 = [bytes(bytearray([0x20, 0x01, 0x0d, 0xb8] + [0] * 11 + [i])) for i in range(5)]
+
+	def tearDown(self):
+		self.ipv4.close()
+		self.ipv6.close()
+		for name in os.listdir(self.directory):
+			os.remove(os.path.join(self.directory, name))
+		os.rmdir(self.directory)
+
+	@staticmethod
+	def checksum(data):
+		if len(data) % 2:
+			data += b'\x00'
+		total = sum(data[i] << 8 | data[i + 1] for i in range(0, len(data), 2))
+		while total >> 16:
+			total = (total & 0xffff) + (total >> 16)
+		return 0xffff - total
+
+	def ipv4_packet(self, src, dst, protocol, transport, fragment=0):
+		header = bytearray(struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(transport), 1, fragment, 64, protocol, 0, src, dst))
+		header[10:12] = struct.pack('>H', self.checksum(bytes(header)))
+		return bytes(header) + transport
+
+	def transport(self, src, dst, protocol, checksum_offset, header, payload, zero_checksum=False):
+		# transport header and payload with checksum over pseudo-header
+		data = bytearray(header + payload)
+		if len(src) == 4:
+			pseudo = src + dst + struct.pack('>BBH', 0, protocol, len(data))
+		else:
+			pseudo = src + dst + struct.pack('>IxxxB', len(data), protocol)
+		if not zero_checksum:
+			data[checksum_offset:checksum_offset + 2] = struct.pack('>H', self.checksum(pseudo + bytes(data)))
+		return bytes(data)
+
+	def packets(self):
+		# Ethernet frames: TCP, UDP, UDP without checksum, VLAN, fragment, ARP, IPv6 UDP and ICMPv6
+		ethernet = b'\x00' * 12
+		tcp_header = struct.pack('>HHIIBBHHH', 1234, 80, 1, 0, 0x50, 0x18, 1024, 0, 0)
+		udp_header = struct.pack('>HHHH', 53, 53, 8 + 5, 0)
+		packets = []
+		for i in range(4):
+			src, dst = self.src[i], self.src[(i + 1) % 4]
+			packets.append(ethernet + b'\x08\x00' + self.ipv4_packet(src, dst, 6, self.transport(src, dst, 6, 16, tcp_header, b'hello')))
+			packets.append(ethernet + b'\x08\x00' + self.ipv4_packet(src, dst, 17, self.transport(src, dst, 17, 6, udp_header, b'query')))
+		packets.append(ethernet + b'\x08\x00' + self.ipv4_packet(self.src[0], self.src[4], 17, self.transport(self.src[0], self.src[4], 17, 6, udp_header, b'query', True)))
+		packets.append(ethernet + b'\x81\x00\x00\x05\x08\x00' + self.ipv4_packet(self.src[4], self.src[1], 6, self.transport(self.src[4], self.src[1], 6, 16, tcp_header, b'vlan')))
+		packets.append(ethernet + b'\x08\x00' + self.ipv4_packet(self.src[4], self.src[1], 17, b'continued', 100))
+		packets.append(ethernet + b'\x08\x06' + b'\x00' * 28)
+		for i in range(4):
+			src, dst = self.src6[i], self.src6[i + 1]
+			transport = self.transport(src, dst, 17, 6, udp_header, b'query')
+			packets.append(ethernet + b'\x86\xdd' + struct.pack('>IHBB', 0x60000000, len(transport), 17, 64) + src + dst + transport)
+		transport = self.transport(self.src6[0], self.src6[4], 58, 2, struct.pack('>BBHI', 128, 0, 0, 1), b'ping')
+		packets.append(ethernet + b'\x86\xdd' + struct.pack('>IHBB', 0x60000000, len(transport), 58, 64) + self.src6[0] + self.src6[4] + transport)
+		return packets
+
+	def write_pcap(self, path, packets, order='<'):
+		with open(path, 'wb') as f:
+			f.write(struct.pack(order + 'IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+			for i, packet in enumerate(packets):
+				f.write(struct.pack(order + 'IIII', i, 0, len(packet), len(packet)) + packet)
+
+	def read_pcap(self, path):
+		with open(path, 'rb') as f:
+			f.read(24)
+			packets = []
+			while True:
+				record = f.read(16)
+				if not record:
+					return packets
+				packets.append(f.read(struct.unpack('<I', record[8:12])[0]))
+
+	def test_anonymise(self):
+		source = os.path.join(self.directory, 'source.pcap')
+		target = os.path.join(self.directory, 'target.pcap')
+		restored = os.path.join(self.directory, 'restored.pcap')
+		packets = self.packets()
+		self.write_pcap(source, packets)
+		anonymiser = pyFNR.tools.pcap.Anonymiser(self.ipv4, self.ipv6, cache=4)
+		stats = anonymiser.anonymise(source, target, chunk_size=3)
+		self.assertEqual(stats['packets'], len(packets))
+		self.assertEqual(stats['rewritten'], len(packets) - 1) # ARP
+		anonymised = self.read_pcap(target)
+		pseudonym = dict((a, bytes(self.ipv4.encrypt_bytes(bytearray(a)))) for a in self.src)
+		pseudonym.update((a, bytes(self.ipv6.encrypt_bytes(bytearray(a)))) for a in self.src6)
+		for packet, original in zip(anonymised, packets):
+			self.assertEqual(len(packet), len(original))
+			ethertype = packet[12:14]
+			ip = packet[18:] if ethertype == b'\x81\x00' else packet[14:]
+			if ethertype == b'\x08\x06':
+				self.assertEqual(packet, original)
+			elif ip[0] >> 4 == 4:
+				self.assertEqual(ip[12:16], pseudonym[original[len(packet) - len(ip) + 12:len(packet) - len(ip) + 16]])
+				self.assertEqual(self.checksum(ip[:20]), 0)
+				src, dst, transport = ip[12:16], ip[16:20], ip[20:]
+				if struct.unpack('>H', ip[6:8])[0] & 0x1fff:
+					self.assertEqual(transport, b'continued')
+				elif ip[9] == 17 and transport[6:8] == b'\x00\x00':
+					self.assertEqual(transport, original[-len(transport):]) # no checksum
+				else:
+					self.assertEqual(self.checksum(src + dst + struct.pack('>BBH', 0, ip[9], len(transport)) + transport), 0)
+			else:
+				src, dst, transport = ip[8:24], ip[24:40], ip[40:]
+				self.assertEqual((src, dst), (pseudonym[original[22:38]], pseudonym[original[38:54]]))
+				self.assertEqual(self.checksum(src + dst + struct.pack('>IxxxB', len(transport), ip[6]) + transport), 0)
+		self.assertGreater(stats['hit_rate'], 0)
+		self.assertEqual(stats['enciphered'], len(pseudonym) + 1) # one evicted address
+		# deciphering restores original file
+		pyFNR.tools.pcap.Anonymiser(self.ipv4, self.ipv6, decrypt=True).anonymise(target, restored)
+		with open(source, 'rb') as f, open(restored, 'rb') as g:
+			self.assertEqual(f.read(), g.read())
+
+	def test_formats(self):
+		# big-endian file, raw IP link type, only IPv4 enciphered
+		source = os.path.join(self.directory, 'source.pcap')
+		target = os.path.join(self.directory, 'target.pcap')
+		packets = [packet[14:] for packet in self.packets() if packet[12:14] in (b'\x08\x00', b'\x86\xdd')]
+		with open(source, 'wb') as f:
+			f.write(struct.pack('>IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 101))
+			for packet in packets:
+				f.write(struct.pack('>IIII', 0, 0, len(packet), len(packet)) + packet)
+		stats = pyFNR.tools.pcap.Anonymiser(self.ipv4, cache=None).anonymise(source, target)
+		self.assertEqual(stats['rewritten'], len([p for p in packets if p[0] >> 4 == 4]))
+		with open(target, 'rb') as f:
+			data = f.read()
+		self.assertEqual(data.count(self.src6[1]), 2)
+		self.assertEqual(data.count(self.src[1]), 0)
+		self.assertRaises(ValueError, pyFNR.tools.pcap.Anonymiser, self.ipv6)
+		with open(source, 'wb') as f:
+			f.write(b'\x0a\x0d\x0d\x0a' + b'\x00' * 20) # pcapng
+		self.assertRaises(ValueError, pyFNR.tools.pcap.Anonymiser(self.ipv4).anonymise, source, target)
+
+	def test_files_closed(self):
+		# source is closed when target cannot be created
+		source = os.path.join(self.directory, 'source.pcap')
+		self.write_pcap(source, self.packets())
+		opened = []
+		def tracked_open(*args):
+			opened.append(open(*args))
+			return opened[-1]
+		pyFNR.tools.pcap.open = tracked_open
+		try:
+			anonymiser = pyFNR.tools.pcap.Anonymiser(self.ipv4, self.ipv6)
+			self.assertRaises(IOError, anonymiser.anonymise, source, os.path.join(self.directory, 'missing', 'target.pcap'))
+		finally:
+			del pyFNR.tools.pcap.open
+		self.assertEqual(len(opened), 1)
+		self.assertTrue(opened[0].closed)
+
+
+class TestPool(unittest.TestCase):
+
+	def setUp(self):
+		self.now = 0.0
+		self.keys = {'old': bytes(bytearray(range(pyFNR.KEY_SIZE))), 'new': bytes(bytearray(pyFNR.KEY_SIZE))}
+		self.pool = pyFNR.pool.Pool(self.keys, max_size=3, idle_timeout=60, clock=lambda: self.now)
+
+	def tearDown(self):
+		self.pool.close()
+
+	def test_lease(self):
+		with pyFNR.FNR2.from_master_key(self.keys['old'], 'emails', 999) as fnr2:
+			expected = fnr2.encrypt_batch(range(1000))
+		self.assertTrue(fnr2.closed)
+		self.assertRaises(ValueError, fnr2.encrypt, 1)
+		for _ in range(3):
+			with self.pool.lease('old', 'emails', domain=999) as fnr2:
+				self.assertEqual(fnr2.encrypt_batch(range(1000)), expected)
+		with self.pool.lease('old', 'emails', block_size=32) as fnr:
+			self.assertEqual(fnr.decrypt_int(fnr.encrypt_int(5)), 5)
+		stats = self.pool.stats()
+		self.assertEqual((stats['created'], stats['reused'], stats['idle'], stats['leased']), (2, 2, 2, 0))
+		self.assertRaises(ValueError, self.pool.checkout, 'old', domain=999, block_size=32)
+		self.assertRaises(KeyError, self.pool.checkout, 'unknown', domain=999)
+		self.assertRaises(ValueError, self.pool.checkin, fnr2)
+		self.assertRaises(ValueError, self.pool.checkin, pyFNR.FNR())
+
+	def test_limits(self):
+		leased = [self.pool.checkout('old', str(i), block_size=32) for i in range(2)]
+		self.pool.checkin(leased.pop())
+		idle = self.pool.checkout('new', block_size=32)
+		self.pool.checkin(idle)
+		# third instance evicts least recently returned idle one
+		leased.append(self.pool.checkout('new', 'other', block_size=32))
+		self.assertEqual(self.pool.stats()['evicted'], 1)
+		leased.append(self.pool.checkout('new', block_size=32))
+		self.assertIs(leased[-1], idle)
+		self.assertRaises(pyFNR.pool.PoolExhausted, self.pool.checkout, 'old', block_size=16)
+		# instance never returned is released when collected
+		leased.pop()
+		idle = None
+		import gc
+		gc.collect()
+		self.assertEqual(len(self.pool), 2)
+		self.pool.checkin(leased.pop())
+		self.now = 61
+		self.assertEqual(self.pool.evict_idle(), 1)
+		self.assertEqual(len(self.pool), 1)
+		self.pool.close()
+		self.assertRaises(ValueError, self.pool.checkout, 'old', block_size=32)
+		self.pool.checkin(leased[0])
+		self.assertTrue(leased[0].closed)
+
+	def test_concurrent_checkout(self):
+		# slow key lookup of one checkout does not block others
+		looking_up = threading.Event()
+		release = threading.Event()
+		def keys(key_id):
+			if key_id == 'slow':
+				looking_up.set()
+				release.wait(10)
+			return self.keys['old']
+		pool = pyFNR.pool.Pool(keys, max_size=2)
+		leased = []
+		thread = threading.Thread(target=lambda: leased.append(pool.checkout('slow', block_size=32)))
+		thread.start()
+		self.assertTrue(looking_up.wait(10))
+		start = time.time()
+		fnr = pool.checkout('fast', block_size=32)
+		self.assertLess(time.time() - start, 5)
+		self.assertRaises(pyFNR.pool.PoolExhausted, pool.checkout, 'other', block_size=32)
+		release.set()
+		thread.join()
+		self.assertEqual(len(pool), 2)
+		# waiter wakes up when instance lent to it is collected
+		waiter = threading.Thread(target=lambda: pool.checkout('waiter', block_size=32, timeout=30))
+		start = time.time()
+		waiter.start()
+		time.sleep(0.1)
+		fnr = None
+		import gc
+		gc.collect()
+		waiter.join()
+		self.assertLess(time.time() - start, 10)
+		self.assertEqual(pool.stats()['created'], 3)
+		pool.close()
+
+	def test_options_key(self):
+		key = pyFNR.pool._freeze({'engine': 'feistel', 'nested': [1, {'a': set([2])}]})
+		self.assertEqual(hash(key), hash(pyFNR.pool._freeze({'nested': [1, {'a': set([2])}], 'engine': 'feistel'})))
+		self.assertRaises(ValueError, pyFNR.pool._freeze, {'buffer': bytearray(1)})
+		self.assertRaises(ValueError, self.pool.checkout, 'old', domain=999, engine=bytearray(1))
+
+	def test_native_init_refcount(self):
+		# FNR_shut() only after last expanded key is released
+		calls = []
+		class Library(object):
+			_handle = -1 # dlopen() handle of fake library
+			def __getattr__(self, name):
+				return lambda *args: calls.append(name) or 1
+		backend = pyFNR.backends.CtypesBackend.__new__(pyFNR.backends.CtypesBackend)
+		backend.libfnr = Library()
+		ciphers = [backend.new_cipher(self.keys['old'], 32) for _ in range(3)]
+		self.assertEqual(calls.count('FNR_init'), 1)
+		for cipher in ciphers + ciphers:
+			cipher.release()
+		self.assertEqual(calls.count('FNR_release_key'), 3)
+		self.assertEqual(calls.count('FNR_shut'), 1)
+		self.assertEqual(calls[-1], 'FNR_shut')
+
+
+class TestThreads(unittest.TestCase):
+
+	def setUp(self):
+		# frequent thread switches make races likely on GIL builds too
+		self.interval = sys.getswitchinterval()
+		sys.setswitchinterval(1e-6)
+
+	def tearDown(self):
+		sys.setswitchinterval(self.interval)
+
+	def run_threads(self, count, target):
+		barrier = threading.Barrier(count)
+		results = [None] * count
+		def run(i):
+			barrier.wait()
+			results[i] = target(i)
+		threads = [threading.Thread(target=run, args=(i,)) for i in range(count)]
+		for thread in threads:
+			thread.start()
+		for thread in threads:
+			thread.join()
+		return results
+
+	def test_shared_instances(self):
+		values = Helper.generate_random_ints(0, 10**6, 8 * TEST_COUNT)
+		with pyFNR.FNR2("key", "threads", 10**6) as fnr2:
+			expected = fnr2.encrypt_batch(values)
+		for cache in (pyFNR.cache.LRUCache(TEST_COUNT), pyFNR.cache.ClockCache(TEST_COUNT)):
+			with pyFNR.FNR2("key", "threads", 10**6, cache=cache) as fnr2:
+				# small cache evicts pairs while other threads read it
+				results = self.run_threads(8, lambda i: [fnr2.encrypt(x) for x in values + values])
+				self.assertEqual(results, [expected + expected] * 8)
+				self.assertEqual(self.run_threads(8, lambda i: fnr2.decrypt_batch(expected)), [values] * 8)
+
+	def test_shared_tables(self):
+		# formats of one lazy DFA extend its shared table concurrently
+		dfa = pyFNR.Util.DFA(None, '0123456789', lambda q, a: (q[0] + 1, (q[1] * 3 + int(a)) % 1009), (0, 0), lambda q: q[1] == 0, lazy=True)
+		lengths = [4, 9, 6, 12, 5, 10, 7, 8]
+		formats = self.run_threads(len(lengths), lambda i: pyFNR.Util.FPE_Format(dfa, lengths[i]))
+		self.assertEqual(formats[0].table.N, 12)
+		for fmt in formats:
+			fresh = pyFNR.Util.FPE_Format(pyFNR.Util.DFA(None, '0123456789', dfa._delta, (0, 0), dfa._accepts, lazy=True), fmt.N)
+			self.assertEqual(fmt.get_words_count(), fresh.get_words_count())
+			ranks = Helper.generate_random_ints(0, fmt.get_words_count(), TEST_COUNT)
+			self.assertEqual(fmt.unrank_batch(ranks), fresh.unrank_batch(ranks))
+			self.assertEqual(fmt.rank_batch(fresh.unrank_batch(ranks)), ranks)
+
+
 class Helper(object):
 
 	@staticmethod